@@ -14,5 +14,17 @@ def create_app():
     from .api.routes import api as api_blueprint
     app.register_blueprint(api_blueprint)
 
-    socketio.init_app(app)
+    # 配置了消息队列时（多进程部署），推送事件经队列转发给所有进程的客户端
+    from .services.message_queue import create_client_manager
+    from .services.backup_store import BACKUPS_REMOVED_EVENT, invalidate_removed
+    # 其他进程（监控进程的容量淘汰等）删除的备份，清除本进程缓存的路径
+    client_manager = create_client_manager(config.SOCKETIO_MESSAGE_QUEUE,
+                                           handlers={BACKUPS_REMOVED_EVENT: invalidate_removed})
+    if client_manager is not None:
+        socketio.init_app(app, client_manager=client_manager)
+    else:
+        socketio.init_app(app)
+    if config.METRICS_ENABLED:
+        from .services import metrics
+        metrics.init_app(app, socketio)
     return app
@@ -0,0 +1,90 @@
+import gzip
+import json
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from flask import Response, request
+from config import config
+from app.db.cache import cache
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只协商 gzip
+    brotli = None
+
+# 接口 JSON 响应
+# 序列化：安装 orjson 时使用 orjson，否则使用标准库 json（紧凑格式，中文不转义）。
+# 压缩：按 Accept-Encoding 协商 br / gzip，小于 RESPONSE_COMPRESS_MIN_BYTES 的响应不压缩。
+# 列表分页的响应体（序列化后的字节，以及已请求过的各编码压缩结果）缓存在 cache.response_bodies 中，
+# 分页缓存每次增量更新都会使其失效（缓存代数），命中时不再构造字典、序列化或压缩，直接写出字节。
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 编码的 JSON"""
+    if orjson is not None and config.JSON_FAST_SERIALIZER:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=config.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(data, config.RESPONSE_GZIP_LEVEL, mtime=0)
+
+def negotiate_encoding() -> Optional[str]:
+    """按当前请求的 Accept-Encoding 选择压缩编码，不压缩时返回 None"""
+    if not config.RESPONSE_COMPRESSION:
+        return None
+    available = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(available)
+
+class EncodedBody:
+    """序列化后的响应体，各编码的压缩结果在首次请求时生成并保存"""
+    __slots__ = ("bodies",)
+
+    def __init__(self, data: bytes):
+        self.bodies: Dict[Optional[str], bytes] = {None: data}
+
+    def get(self, encoding: Optional[str]) -> Tuple[Optional[str], bytes]:
+        """返回 (实际使用的编码, 字节)，响应体较小时不压缩"""
+        data = self.bodies[None]
+        if encoding is None or len(data) < config.RESPONSE_COMPRESS_MIN_BYTES:
+            return None, data
+        body = self.bodies.get(encoding)
+        if body is None:
+            body = self.bodies[encoding] = compress(data, encoding)
+        return encoding, body
+
+    def __sizeof__(self) -> int:
+        # 供缓存估算占用字节数
+        return object.__sizeof__(self) + sum(len(body) for body in self.bodies.values())
+
+def _respond(body: EncodedBody, status: int = 200) -> Response:
+    encoding, data = body.get(negotiate_encoding())
+    response = Response(data, status=status, content_type="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if config.RESPONSE_COMPRESSION:
+        response.vary.add("Accept-Encoding")
+    return response
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    """替代 jsonify：快速序列化并按需压缩"""
+    return _respond(EncodedBody(dumps(obj)), status)
+
+def cached_json_response(key: Hashable, build: Callable[[], Any]) -> Response:
+    """
+    可缓存的 JSON 响应：命中时直接写出（压缩后的）字节，未命中时调用 build() 生成数据
+    :param key: 响应缓存键，需包含影响响应内容的全部参数（路由、分页、筛选条件、版本号等）
+    """
+    generation = cache.generation  # 在生成数据之前读取，期间分页缓存被修改时本次结果不会被复用
+    body = cache.get_response_body(key)
+    fresh = body is None
+    if fresh:
+        body = EncodedBody(dumps(build()))
+    known = len(body.bodies)
+    response = _respond(body)
+    if fresh or len(body.bodies) != known:
+        cache.set_response_body(key, generation, body)  # 新增了压缩结果时重新登记，更新占用字节数
+    return response
@@ -1,15 +1,25 @@
 import eventlet
 # eventlet.monkey_patch()
 import json
-from flask import request, jsonify, send_file, Blueprint, render_template
+import hmac
+from flask import request, jsonify, send_file, Blueprint, render_template, redirect, url_for, Response, \
+    stream_with_context
 from config import config
-from app.db.database import ServerGet, ServerSet, add_history_item_from_json, init_db
+from app.db.database import ServerGet, ServerSet, add_history_item_from_json, \
+    on_history_inserted, on_history_deleted, insert_history
 from app.db.cache import cache
+from app.db.filters import HistoryFilter
+from app.db.engine import get_write_engine
+from app.api.responses import dumps, json_response, cached_json_response
+from app.services.backup_store import store_stream, backup_usage
+from app.services.event_bus import event_bus
+from app.services.offload import blocking_pool, OffloadBusy
+from app.services import metrics
+from app.services.thumbnail_service import thumbnail_worker, generate_thumbnail, thumbnail_path, \
+    thumbnail_mimetype, touch_thumbnail, remove_thumbnail, is_valid_checksum
 from app.models.models import BackupFile, ClipboardHistory, Folder, Favorite
 from sqlmodel import Session, select
 import os
-import uuid as uuid_lib
-import hashlib
 
 api = Blueprint('api', __name__)
 
@@ -37,25 +47,112 @@ def collections():
     return render_template('collections.html')
 
 # 主页列表专用分页API
+# 传入 cursor 参数（第一页为空字符串）时使用游标分页，否则使用 offset 分页（兼容旧客户端）
+# 可选筛选参数 type（逗号分隔）/source/tag 在数据库端执行，每种筛选独立分页与缓存
+# 响应体序列化、压缩后按参数与版本号缓存，分页缓存未变化时直接返回字节
 @api.route('/api/history')
 def api_history_paginated():
     try:
         # 解析分页参数
         limit = int(request.args.get('limit', 30))
-        offset = int(request.args.get('offset', 0))
         # 限制参数范围
         limit = max(1, min(limit, 100))
-        offset = max(0, offset)
+        filters = HistoryFilter.from_args(request.args)
+
+        # 先取版本号再查询：期间发生的变更客户端会再收到一次，增量应用是幂等的
+        version = history_db.get_change_version()
+
+        if 'cursor' in request.args:
+            with_total = request.args.get('total', '0') in ('1', 'true')
+            cursor = request.args.get('cursor')
+            try:
+                return cached_json_response(
+                    ('history_cursor', limit, cursor, with_total, filters, version),
+                    lambda: {'success': True, 'data': history_db.get_history_by_cursor(
+                        limit=limit, cursor=cursor, with_total=with_total, filters=filters
+                    ), 'version': version}
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
 
-        # 使用实例调用方法
-        result = history_db.get_history_paginated(limit=limit, offset=offset)
+        offset = int(request.args.get('offset', 0))
+        offset = max(0, offset)
 
         print("::DEBUG::", "API /api/history called with limit:", limit, "offset:", offset)
 
-        return jsonify({'success': True, 'data': result})
+        # 使用实例调用方法
+        return cached_json_response(
+            ('history', limit, offset, filters, version),
+            lambda: {'success': True, 'data': history_db.get_history_paginated(
+                limit=limit, offset=offset, filters=filters
+            ), 'version': version}
+        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# 单条记录完整内容（列表/搜索只返回文本预览，truncated 为 true 时通过此接口获取）
+# 记录内容写入后不会变化，uuid 作为 ETag，重复请求返回 304（压缩后的响应使用弱 ETag）
+@api.route('/api/history/<int:history_id>')
+def api_history_detail(history_id):
+    history_db.get_change_version()  # 其他进程写入过时先清空本进程的缓存
+    record = history_db.get_history_by_id(history_id)
+    if record is None:
+        return jsonify({'success': False, 'error': '记录不存在'}), 404
+    response = json_response({'success': True, 'data': record})
+    response.set_etag(record['uuid'], weak='Content-Encoding' in response.headers)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 增量同步API：以 NDJSON 逐行返回版本号 since 之后的新增（附完整记录）与删除（墓碑）
+# 响应头 X-Change-Version 为本次同步到的版本号，客户端下次以此作为 since
+@api.route('/api/changes')
+def api_changes():
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since 必须为整数版本号'}), 400
+    if history_db.is_change_version_expired(since):
+        return jsonify({'success': False, 'error': '变更日志已清理，请重新全量同步'}), 410
+
+    until = history_db.get_change_version()  # 只返回请求开始时已有的变更，保证响应有限
+
+    def generate():
+        for change in history_db.iter_changes(since, until):
+            yield dumps(change) + b"\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Change-Version'] = str(max(since, until))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# 缓存统计API：各命名空间的大小与命中/未命中/淘汰计数
+@api.route('/api/cache/stats')
+def cache_stats():
+    return jsonify({'success': True, 'data': cache.stats()})
+
+# 运行指标（Prometheus 抓取）：接口耗时、SQL 耗时、缓存命中、入库延迟、备份大小、Socket.IO 连接数
+@api.route('/metrics')
+def metrics_endpoint():
+    if not config.METRICS_ENABLED:
+        return "未启用运行指标", 404
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _invalidate_allowed() -> bool:
+    """配置了 CACHE_INVALIDATE_TOKEN 时校验请求头中的令牌，否则只允许本机直接访问（不经反向代理）"""
+    if config.CACHE_INVALIDATE_TOKEN:
+        token = request.headers.get('X-Cache-Invalidate-Token', '')
+        return hmac.compare_digest(token.encode(), config.CACHE_INVALIDATE_TOKEN.encode())
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+# 缓存失效API：批量导入等在其他进程中直接写库的工具完成后调用，清空缓存并重新统计备份大小
+@api.route('/api/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    if not _invalidate_allowed():
+        return jsonify({'success': False, 'error': '无权访问'}), 403
+    cache.clear_all()
+    backup_usage.refresh(get_write_engine())
+    return jsonify({'success': True})
+
 # 添加下载文件的API
 @api.route('/api/download')
 def download_file():
@@ -63,14 +160,65 @@ def download_file():
     if not checksum:
         return "缺少参数", 400
 
-    # 调用数据库层获取文件路径，不直接操作数据库
+    # 备份按内容寻址，checksum 即强 ETag：客户端已有该内容时直接 304，不查库也不读文件
+    if checksum in request.if_none_match:
+        response = Response(status=304)
+        _set_immutable_cache_headers(response, checksum)
+        return response
+
+    # 调用数据库层获取文件路径，不直接操作数据库（先与变更版本对齐，其他进程新增的备份不会被缓存的“不存在”挡住）
+    history_db.get_change_version()
     file_path = history_db.get_file_path_by_checksum(checksum)
 
     if not file_path:
+        if history_db.is_backup_evicted(checksum):
+            return "文件已因备份容量限制被清理", 410
         return "文件不存在或已丢失", 404
 
-    # 发送文件
-    return send_file(file_path, as_attachment=True)
+    # 发送文件（存储路径不含文件名，使用记录中的原始文件名，同时据此推断 MIME 类型）
+    # conditional=True 时由 werkzeug 处理 If-None-Match / If-Range / Range（206 分段响应，支持断点续传）；
+    # 配置 USE_X_SENDFILE 后交给前置的 Web 服务器零拷贝发送
+    download_name = history_db.get_file_name_by_checksum(checksum) or os.path.basename(file_path)
+    response = send_file(file_path, as_attachment=True, download_name=download_name,
+                         etag=checksum, conditional=True)
+    _set_immutable_cache_headers(response, checksum)
+    return response
+
+def _set_immutable_cache_headers(response, checksum: str) -> None:
+    """内容按 checksum 寻址，同一 URL 的内容永不改变"""
+    response.set_etag(checksum)
+    response.headers['Cache-Control'] = f"private, max-age={config.DOWNLOAD_CACHE_MAX_AGE}, immutable"
+
+# 图片缩略图API：按 checksum 生成并缓存，内容不变，浏览器可长期缓存
+@api.route('/api/thumbnail')
+def thumbnail():
+    checksum = request.args.get('checksum')
+    if not checksum:
+        return "缺少参数", 400
+    if not is_valid_checksum(checksum):
+        return "checksum 格式错误", 400
+
+    path = thumbnail_path(checksum)
+    if os.path.exists(path):
+        touch_thumbnail(path)
+    else:
+        file_path = history_db.get_file_path_by_checksum(checksum)
+        if not file_path:
+            if history_db.is_backup_evicted(checksum):
+                return "文件已因备份容量限制被清理", 410
+            return "文件不存在或已丢失", 404
+        try:
+            path = generate_thumbnail(checksum, file_path)  # 解码图片在线程池中执行
+        except OffloadBusy as e:
+            return _busy_response(e)
+        if not path:
+            # 未安装 Pillow 或无法识别的图片格式，退回原图
+            return redirect(url_for('api.download_file', checksum=checksum))
+
+    response = send_file(path, mimetype=thumbnail_mimetype(), etag=f"thumb-{checksum}",
+                         max_age=config.THUMBNAIL_CACHE_MAX_AGE, conditional=True)
+    response.headers['Cache-Control'] = f"public, max-age={config.THUMBNAIL_CACHE_MAX_AGE}, immutable"
+    return response
 
 # 粘贴文本API
 @api.route('/api/paste/text', methods=['POST'])
@@ -92,19 +240,64 @@ def paste_text():
             "Tag": "手动粘贴"
         }
 
-        # 添加到数据库
-        engine = init_db()
-        new_id = add_history_item_from_json(json_data, engine)
+        # 添加到数据库（大文本压缩与写事务在线程池中执行）
+        engine = get_write_engine()
+        new_id = blocking_pool.run(add_history_item_from_json, json_data, engine)
 
         if new_id:
             return jsonify({'success': True, 'id': new_id})
         else:
             return jsonify({'success': False, 'error': '添加失败'}), 500
 
+    except OffloadBusy as e:
+        return _busy_response(e)
     except Exception as e:
         print(f"文本粘贴错误: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _busy_response(error: OffloadBusy):
+    """后台线程池已满：返回 503，客户端稍后重试"""
+    return jsonify({'success': False, 'error': str(error)}), 503, {'Retry-After': '1'}
+
+def _add_uploaded_history(file, item_type: str):
+    """
+    流式保存上传的图片/文件并写入历史记录（通过 blocking_pool.run 调用，不阻塞事件循环）
+    :param item_type: "Image"（clipboard 字段存 checksum）或 "File"（clipboard 字段存原始文件名）
+    :return: 新记录ID
+    """
+    engine = get_write_engine()
+
+    # 分块写入并计算MD5，内容已存在时复用已有备份文件
+    checksum, backup_path, _ = store_stream(file.stream, file.filename, engine)
+    clipboard = checksum if item_type == "Image" else file.filename
+
+    # 构造JSON数据格式
+    json_data = {
+        "Type": item_type,
+        "Clipboard": clipboard,
+        "File": os.path.basename(backup_path),
+        "From": "Web",
+        "Tag": "手动粘贴"
+    }
+
+    # 直接创建数据库记录，以便设置原始文件名（备份已在 store_stream 中登记）
+    history_item = ClipboardHistory(
+        raw_content=json.dumps(json_data),
+        type=item_type,
+        clipboard=clipboard,
+        from_equipment="Web",
+        tag="手动粘贴",
+        checksum=checksum,
+        original_filename=file.filename  # 存储原始文件名
+    )
+    new_id, record, version, _, _ = blocking_pool.run_write(insert_history, engine, history_item)
+    on_history_inserted(record, version)
+
+    cache.set_file_path(checksum, backup_path)
+    if item_type == "Image":
+        thumbnail_worker.submit(checksum, backup_path)
+    return new_id
+
 # 粘贴图片API
 @api.route('/api/paste/image', methods=['POST'])
 def paste_image():
@@ -116,69 +309,15 @@ def paste_image():
         if file.filename == '':
             return jsonify({'success': False, 'error': '文件名为空'}), 400
 
-        # 读取文件内容并计算MD5
-        file_bytes = file.read()
-        checksum = hashlib.md5(file_bytes).hexdigest()
-
-        # 生成唯一文件名
-        file_ext = os.path.splitext(file.filename)[1] if file.filename else '.png'
-        unique_filename = f"{uuid_lib.uuid4()}{file_ext}"
-        backup_path = os.path.join(config.BACKUP_DIR, unique_filename)
-
-        # 确保备份目录存在
-        os.makedirs(config.BACKUP_DIR, exist_ok=True)
-
-        # 保存文件
-        with open(backup_path, 'wb') as f:
-            f.write(file_bytes)
-
-        # 构造JSON数据格式
-        json_data = {
-            "Type": "Image",
-            "Clipboard": checksum,
-            "File": unique_filename,
-            "From": "Web",
-            "Tag": "手动粘贴"
-        }
-
-        # 添加到数据库
-        engine = init_db()
-
-        # 检查备份文件是否已存在
-        with Session(engine) as session:
-            exists = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
-            if not exists:
-                backup = BackupFile(
-                    checksum=checksum,
-                    filepath=backup_path,
-                    size=len(file_bytes)
-                )
-                session.add(backup)
-                session.commit()
-
-        # 直接创建数据库记录，以便设置原始文件名
-        with Session(engine) as session:
-            history_item = ClipboardHistory(
-                raw_content=json.dumps(json_data),
-                type="Image",
-                clipboard=checksum,  # 对于图片，clipboard字段存储checksum
-                from_equipment="Web",
-                tag="手动粘贴",
-                checksum=checksum,
-                original_filename=file.filename  # 存储原始文件名
-            )
-            session.add(history_item)
-            session.commit()
-            new_id = history_item.id
-
-        cache.invalidate_history()
-        cache.set_file_path(checksum, backup_path)
+        new_id = blocking_pool.run(_add_uploaded_history, file, "Image")
 
         if new_id:
             return jsonify({'success': True, 'id': new_id})
         else:
             return jsonify({'success': False, 'error': '添加失败'}), 500
 
+    except OffloadBusy as e:
+        return _busy_response(e)
     except Exception as e:
         print(f"图片粘贴错误: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -194,69 +333,15 @@ def paste_file():
         if file.filename == '':
             return jsonify({'success': False, 'error': '文件名为空'}), 400
 
-        # 读取文件内容并计算MD5
-        file_bytes = file.read()
-        checksum = hashlib.md5(file_bytes).hexdigest()
-
-        # 生成唯一文件名
-        file_ext = os.path.splitext(file.filename)[1] if file.filename else ''
-        unique_filename = f"{uuid_lib.uuid4()}{file_ext}"
-        backup_path = os.path.join(config.BACKUP_DIR, unique_filename)
-
-        # 确保备份目录存在
-        os.makedirs(config.BACKUP_DIR, exist_ok=True)
-
-        # 保存文件
-        with open(backup_path, 'wb') as f:
-            f.write(file_bytes)
-
-        # 构造JSON数据格式
-        json_data = {
-            "Type": "File",
-            "Clipboard": file.filename,  # 对于文件，Clipboard字段存储原始文件名
-            "File": unique_filename,
-            "From": "Web",
-            "Tag": "手动粘贴"
-        }
-
-        # 添加到数据库
-        engine = init_db()
-
-        # 检查备份文件是否已存在
-        with Session(engine) as session:
-            exists = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
-            if not exists:
-                backup = BackupFile(
-                    checksum=checksum,
-                    filepath=backup_path,
-                    size=len(file_bytes)
-                )
-                session.add(backup)
-                session.commit()
-
-        # 直接创建数据库记录，以便设置原始文件名
-        with Session(engine) as session:
-            history_item = ClipboardHistory(
-                raw_content=json.dumps(json_data),
-                type="File",
-                clipboard=file.filename,  # 剪贴板内容存储原始文件名
-                from_equipment="Web",
-                tag="手动粘贴",
-                checksum=checksum,
-                original_filename=file.filename  # 存储原始文件名
-            )
-            session.add(history_item)
-            session.commit()
-            new_id = history_item.id
-
-        cache.invalidate_history()
-        cache.set_file_path(checksum, backup_path)
+        new_id = blocking_pool.run(_add_uploaded_history, file, "File")
 
         if new_id:
             return jsonify({'success': True, 'id': new_id})
         else:
             return jsonify({'success': False, 'error': '添加失败'}), 500
 
+    except OffloadBusy as e:
+        return _busy_response(e)
     except Exception as e:
         print(f"文件粘贴错误: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -265,13 +350,15 @@ def paste_file():
 @api.route('/api/delete/<string:uuid>', methods=['DELETE'])
 def delete_record(uuid):
     try:
-        engine = init_db()
+        engine = get_write_engine()
 
         with Session(engine) as session:
             # 查找记录
             record = session.exec(select(ClipboardHistory).where(ClipboardHistory.uuid == uuid)).first()
             deleted_checksum = record.checksum if record else None
             deleted_backup = False
+            deleted_size = 0
+            orphaned = False
 
             if not record:
                 return jsonify({'success': False, 'error': '记录不存在'}), 404
@@ -287,6 +374,7 @@ def delete_record(uuid):
 
                 # 如果没有其他记录使用该备份文件，删除备份文件
                 if not other_records:
+                    orphaned = True
                     backup_file = session.exec(
                         select(BackupFile).where(BackupFile.checksum == record.checksum)
                     ).first()
@@ -302,14 +390,20 @@ def delete_record(uuid):
                         # 删除备份文件记录
                         session.delete(backup_file)
                         deleted_backup = True
+                        deleted_size = backup_file.size
 
             # 删除历史记录
+            deleted_id, deleted_timestamp = record.id, record.timestamp
+            deleted_fields = {'type': record.type, 'source': record.from_equipment, 'tag': record.tag}
             session.delete(record)
             session.commit()
 
-        cache.invalidate_history()
+        on_history_deleted(deleted_id, deleted_timestamp, uuid, deleted_fields)
+        backup_usage.add(-deleted_size)
         if deleted_backup and deleted_checksum:
             cache.invalidate_file_path(deleted_checksum)
+        if orphaned:
+            remove_thumbnail(deleted_checksum)
 
         return jsonify({'success': True, 'message': '记录已删除'})
 
@@ -328,56 +422,21 @@ def search_records():
         # 限制参数范围
         limit = max(1, min(limit, 100))
         offset = max(0, offset)
+        filters = HistoryFilter.from_args(request.args)
 
         if not query:
-            # 如果没有搜索词，返回普通的历史记录
-            result = history_db.get_history_paginated(limit=limit, offset=offset)
-            return jsonify({'success': True, 'data': result, 'query': query})
-
-        # 有搜索词，进行搜索
-        # 使用现有的分页方法获取所有数据，然后在内存中搜索
-        result = history_db.get_history_paginated(limit=200, offset=0)  # 获取更多数据用于搜索
-
-        filtered_records = []
-        query_lower = query.lower()
-
-        for record in result['records']:
-            # 搜索文本内容
-            content = record.get('content') or ''
-            content_match = content.lower().find(query_lower) != -1
-
-            # 搜索文件名
-            filename = record.get('file_name') or ''
-            filename_match = filename.lower().find(query_lower) != -1
-
-            # 搜索时间戳
-            timestamp = record.get('timestamp') or ''
-            timestamp_match = timestamp.lower().find(query_lower) != -1
-
-            # 搜索来源和标签
-            source = record.get('source') or ''
-            source_match = source.lower().find(query_lower) != -1
-
-            tag = record.get('tag') or ''
-            tag_match = tag.lower().find(query_lower) != -1
-
-            if content_match or filename_match or timestamp_match or source_match or tag_match:
-                filtered_records.append(record)
-
-        # 应用分页
-        total_count = len(filtered_records)
-        paginated_records = filtered_records[offset:offset + limit]
-
-        return jsonify({
-            'success': True,
-            'data': {
-                'records': paginated_records,
-                'total': total_count,
-                'limit': limit,
-                'offset': offset
-            },
-            'query': query
-        })
+            # 如果没有搜索词，返回普通的历史记录（与主页列表共用分页缓存，同样按版本号缓存响应）
+            version = history_db.get_change_version()
+            return cached_json_response(
+                ('search', limit, offset, filters, version),
+                lambda: {'success': True, 'data': history_db.get_history_paginated(
+                    limit=limit, offset=offset, filters=filters
+                ), 'query': query}
+            )
+
+        # 有搜索词，使用全文索引在数据库端检索并分页
+        result = history_db.search_history(query, limit=limit, offset=offset, filters=filters)
+        return json_response({'success': True, 'data': result, 'query': query})
 
     except Exception as e:
         print(f"搜索错误: {e}")
@@ -1,58 +1,438 @@
+import sys
+import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from threading import RLock
-from typing import Dict, Optional, Tuple
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from config import config
+from app.db.pagination import decode_cursor
+from app.db.filters import HistoryFilter, NO_FILTER
+
+
+def _estimate_size(value: Any) -> int:
+    """粗略估算缓存值占用的字节数（递归统计 dict/list 中的字符串等）"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUNamespace:
+    """
+    单个缓存命名空间：LRU 淘汰 + 条目数/字节数上限 + 过期时间
+    不自带锁，由 InMemoryCache 统一加锁
+    :param ttl: 过期时间（秒），0 表示不过期
+    :param negative_ttl: 值为 None（负缓存）时的过期时间，默认同 ttl
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int = 0,
+                 ttl: float = 0, negative_ttl: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()  # key -> (value, size, expires_at)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)，命中时将条目移到最近使用端"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        value, _, expires_at = entry
+        if expires_at and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if key in self.entries:
+            self._remove(key)
+        ttl = self.negative_ttl if value is None else self.ttl
+        size = _estimate_size(key) + _estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            return  # 单个值超过整个命名空间上限，不缓存
+        self.entries[key] = (value, size, time.monotonic() + ttl if ttl else 0)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """未过期条目的快照（用于增量维护，不计入命中统计）"""
+        now = time.monotonic()
+        return [(k, v) for k, (v, _, expires_at) in self.entries.items() if not expires_at or expires_at > now]
+
+    def pop(self, key: Hashable) -> None:
+        if key in self.entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def _record_key(record: dict) -> Tuple[datetime, int]:
+    """列表记录的排序键 (timestamp, id)，越大越新"""
+    return decode_cursor(record['cursor'])
+
+
+def _pages_namespace(name: str) -> LRUNamespace:
+    return LRUNamespace(name, config.CACHE_HISTORY_PAGES_MAX_ENTRIES,
+                        config.CACHE_HISTORY_PAGES_MAX_BYTES, config.CACHE_HISTORY_PAGES_TTL)
 
 
 @dataclass
 class InMemoryCache:
     lock: RLock = field(default_factory=RLock)
-    history_pages: Dict[Tuple[int, int], dict] = field(default_factory=dict)
-    history_by_id: Dict[int, dict] = field(default_factory=dict)
-    file_paths: Dict[str, Optional[str]] = field(default_factory=dict)
+    history_pages: LRUNamespace = field(default_factory=lambda: _pages_namespace('history_pages'))
+    history_cursor_pages: LRUNamespace = field(default_factory=lambda: _pages_namespace('history_cursor_pages'))
+    history_by_id: LRUNamespace = field(default_factory=lambda: LRUNamespace(
+        'history_by_id', config.CACHE_HISTORY_BY_ID_MAX_ENTRIES,
+        config.CACHE_HISTORY_BY_ID_MAX_BYTES, config.CACHE_HISTORY_BY_ID_TTL))
+    file_paths: LRUNamespace = field(default_factory=lambda: LRUNamespace(
+        'file_paths', config.CACHE_FILE_PATHS_MAX_ENTRIES, 0,
+        config.CACHE_FILE_PATHS_TTL, config.CACHE_FILE_PATHS_NEGATIVE_TTL))
+    filtered_totals: LRUNamespace = field(default_factory=lambda: LRUNamespace(
+        'filtered_totals', config.CACHE_FILTERED_TOTALS_MAX_ENTRIES, 0, config.CACHE_HISTORY_PAGES_TTL))
+    response_bodies: LRUNamespace = field(default_factory=lambda: LRUNamespace(
+        'response_bodies', config.CACHE_RESPONSE_BODIES_MAX_ENTRIES,
+        config.CACHE_RESPONSE_BODIES_MAX_BYTES, config.CACHE_HISTORY_PAGES_TTL))
+    history_total: Optional[int] = None
+    # 分页缓存的代数：记录增删、失效时加一，序列化后的响应体只在代数不变时有效
+    generation: int = 0
+    # 缓存内容对应的 change_log 版本号（本进程连续应用的最后一个变更），None 表示尚未对齐
+    change_version: Optional[int] = None
+
+    # 分页缓存键均包含筛选条件：(limit, offset/cursor, HistoryFilter)，无筛选时为 NO_FILTER
+    # 写入缓存的 version 参数：查询数据前后读取的 change_log 版本号（两次一致才传入），
+    # 只有与缓存当前版本相同时才写入，避免提交后、增量更新前读到的新数据再被增量更新一次
+
+    def _accepts(self, version: Optional[int]) -> bool:
+        if version is None:
+            return True
+        if self.change_version is None:
+            self.change_version = version  # 尚未对齐，以首次读取的版本为准
+        return version == self.change_version
+
+    def get_history_page(self, limit: int, offset: int, filters: HistoryFilter = NO_FILTER) -> Optional[dict]:
+        key = (limit, offset, filters)
+        with self.lock:
+            return self.history_pages.get(key)[1]
+
+    def set_history_page(self, limit: int, offset: int, value: dict, filters: HistoryFilter = NO_FILTER,
+                         version: Optional[int] = None) -> None:
+        key = (limit, offset, filters)
+        with self.lock:
+            if self._accepts(version):
+                self.history_pages.set(key, value)
 
-    def get_history_page(self, limit: int, offset: int) -> Optional[dict]:
-        key = (limit, offset)
+    def get_history_cursor_page(self, limit: int, cursor: str, filters: HistoryFilter = NO_FILTER) -> Optional[dict]:
+        key = (limit, cursor, filters)
         with self.lock:
-            return self.history_pages.get(key)
+            return self.history_cursor_pages.get(key)[1]
 
-    def set_history_page(self, limit: int, offset: int, value: dict) -> None:
-        key = (limit, offset)
+    def set_history_cursor_page(self, limit: int, cursor: str, value: dict,
+                                filters: HistoryFilter = NO_FILTER, version: Optional[int] = None) -> None:
+        key = (limit, cursor, filters)
         with self.lock:
-            self.history_pages[key] = value
+            if self._accepts(version):
+                self.history_cursor_pages.set(key, value)
+
+    def get_history_total(self, filters: HistoryFilter = NO_FILTER) -> Optional[int]:
+        with self.lock:
+            if filters.is_empty():
+                return self.history_total
+            return self.filtered_totals.get(filters)[1]
+
+    def set_history_total(self, total: int, filters: HistoryFilter = NO_FILTER,
+                          version: Optional[int] = None) -> None:
+        with self.lock:
+            if not self._accepts(version):
+                return
+            if filters.is_empty():
+                self.history_total = total
+            else:
+                self.filtered_totals.set(filters, total)
+
+    def get_response_body(self, key: Hashable) -> Optional[Any]:
+        """序列化后的列表响应体（由分页数据生成），分页缓存修改过则视为未命中"""
+        with self.lock:
+            entry = self.response_bodies.get(key)[1]
+            if entry is None or entry[0] != self.generation:
+                return None
+            return entry[1]
+
+    def set_response_body(self, key: Hashable, generation: int, body: Any) -> None:
+        """:param generation: 生成响应数据之前读取的 self.generation"""
+        with self.lock:
+            if generation == self.generation:
+                self.response_bodies.set(key, (generation, body))
 
     def get_history_by_id(self, history_id: int) -> Optional[dict]:
         with self.lock:
-            return self.history_by_id.get(history_id)
+            return self.history_by_id.get(history_id)[1]
 
-    def set_history_by_id(self, history_id: int, value: dict) -> None:
+    def set_history_by_id(self, history_id: int, value: dict, version: Optional[int] = None) -> None:
         with self.lock:
-            self.history_by_id[history_id] = value
+            if self._accepts(version):
+                self.history_by_id.set(history_id, value)
 
     def get_file_path(self, checksum: str) -> Tuple[bool, Optional[str]]:
         with self.lock:
-            if checksum in self.file_paths:
-                return True, self.file_paths[checksum]
-            return False, None
+            return self.file_paths.get(checksum)
 
     def set_file_path(self, checksum: str, path: Optional[str]) -> None:
         with self.lock:
-            self.file_paths[checksum] = path
+            self.file_paths.set(checksum, path)
+
+    def sync_change_version(self, version: int) -> None:
+        """
+        与数据库当前的变更版本号对齐：版本号变化但本进程没有应用对应的增量更新时
+        （其他进程写入，如多进程部署的其他工作进程、批量导入工具），清空缓存
+        """
+        with self.lock:
+            if self.change_version is not None and version != self.change_version:
+                self.clear_all()
+            self.change_version = version
+
+    def _apply_change_version(self, version: Optional[int]) -> bool:
+        """
+        增量更新前检查版本号，返回是否需要应用：
+        不大于缓存版本说明缓存中的数据是提交之后读取的，已包含该变更，跳过；
+        版本号不连续说明中间有其他进程的变更，清空缓存并以该版本重新对齐
+        """
+        if version is None or self.change_version is None:
+            return True
+        if version <= self.change_version:
+            return False
+        if version > self.change_version + 1:
+            self.clear_all()
+            self.change_version = version
+            return False
+        self.change_version = version
+        return True
+
+    def history_inserted(self, record: dict, version: Optional[int] = None) -> None:
+        """
+        新增记录后增量更新缓存（替代 invalidate_history）：
+        新记录插入到所在的缓存分页，其后的 offset 分页整体顺移一位，游标分页只影响覆盖该位置的页，
+        单条记录缓存不受影响；不满足筛选条件的分页保持不变
+        :param record: 新记录的列表格式字典（含 cursor）
+        :param version: 该插入在 change_log 中的版本号
+        """
+        key = _record_key(record)
+        with self.lock:
+            if not self._apply_change_version(version):
+                return
+            self._bump_generation()
+            if self.history_total is not None:
+                self.history_total += 1
+            for filters, total in self.filtered_totals.items():
+                if filters.matches(record):
+                    self.filtered_totals.set(filters, total + 1)
+            self._insert_into_offset_pages(record, key)
+            self._insert_into_cursor_pages(record, key)
+
+    def history_deleted(self, history_id: int, timestamp: datetime, record: Optional[dict] = None,
+                        version: Optional[int] = None) -> None:
+        """
+        删除记录后增量更新缓存：从所在 offset 分页移除，其后的 offset 分页向前补位；包含该记录的游标分页失效
+        :param record: 被删记录的 type/source/tag（列表格式），用于判断影响哪些筛选视图；
+                       未提供时带筛选条件的 offset 分页与计数整体失效
+        :param version: 该删除在 change_log 中的版本号
+        """
+        key = (timestamp, history_id)
+        with self.lock:
+            if not self._apply_change_version(version):
+                return
+            self._bump_generation()
+            if self.history_total is not None:
+                self.history_total -= 1
+            for filters, total in self.filtered_totals.items():
+                if record is None:
+                    self.filtered_totals.pop(filters)
+                elif filters.matches(record):
+                    self.filtered_totals.set(filters, total - 1)
+            self.history_by_id.pop(history_id)
+            self._delete_from_offset_pages(history_id, key, record)
+            for page_key, page in self.history_cursor_pages.items():
+                if any(r['id'] == history_id for r in page['records']):
+                    # 原地移除会使本页少一条（空位应由下一页页首补上），整页失效，下次从数据库重新读取
+                    self.history_cursor_pages.pop(page_key)
+
+    def _bump_generation(self) -> None:
+        self.generation += 1
+        self.response_bodies.clear()  # 旧代数的响应体不会再命中，直接释放
+
+    def _insert_into_offset_pages(self, record: dict, key: Tuple[datetime, int]) -> None:
+        # 按 offset 升序处理，顺移时需要读取上一页（修改前）的最后一条
+        old = dict(self.history_pages.items())
+        for (limit, offset, filters), page in sorted(old.items(), key=lambda kv: kv[0][1]):
+            if not filters.matches(record):
+                continue
+            records = page['records']
+            keys = [_record_key(r) for r in records]
+            if not records:
+                self.history_pages.pop((limit, offset, filters))
+                continue
+            if key in keys:
+                continue  # 本页已包含该记录（重复的增量更新），总数也已计入
+            if len(records) == limit and keys[-1] > key:
+                new_records = records  # 新记录落在本页之后
+            elif keys[0] < key:
+                # 新记录落在本页之前：整页后移，页首由上一页末尾（或新记录本身）补上
+                head = record
+                if offset > 0:
+                    prev = old.get((limit, offset - limit, filters))
+                    if not prev or len(prev['records']) != limit:
+                        self.history_pages.pop((limit, offset, filters))  # 缺少上一页无法顺移
+                        continue
+                    prev_last = prev['records'][-1]
+                    if _record_key(prev_last) < key:
+                        head = prev_last
+                new_records = ([head] + records)[:limit]
+            else:
+                pos = sum(1 for k in keys if k > key)
+                new_records = (records[:pos] + [record] + records[pos:])[:limit]
+            self.history_pages.set((limit, offset, filters), {**page, 'records': new_records, 'total': page['total'] + 1})
+
+    def _insert_into_cursor_pages(self, record: dict, key: Tuple[datetime, int]) -> None:
+        old = dict(self.history_cursor_pages.items())
+        for (limit, cursor, filters), page in old.items():
+            if not filters.matches(record):
+                continue
+            if cursor and decode_cursor(cursor) < key:
+                continue  # 新记录比本页起始位置更新，不在本页范围内
+            if page['next_cursor'] and decode_cursor(page['next_cursor']) > key:
+                continue  # 新记录落在本页之后（页范围为 (next_cursor, cursor)）
+            records = page['records']
+            keys = [_record_key(r) for r in records]
+            if key in keys:
+                continue
+            pos = sum(1 for k in keys if k > key)
+            new_records = records[:pos] + [record] + records[pos:]
+            next_cursor = page['next_cursor']
+            if len(new_records) > limit:
+                carry = new_records[limit]
+                new_records = new_records[:limit]
+                next_cursor = new_records[-1]['cursor']
+                self._shift_cursor_pages(old, limit, filters, next_cursor, carry, page['next_cursor'])
+            self.history_cursor_pages.set((limit, cursor, filters), {**page, 'records': new_records, 'next_cursor': next_cursor})
+
+    def _shift_cursor_pages(self, old: dict, limit: int, filters: HistoryFilter, cursor: str, carry: dict,
+                            old_cursor: Optional[str]) -> None:
+        """
+        本页被挤出的记录成为下一页页首：由旧的下一页推导出新游标对应的页，
+        使翻页时下一页依然命中缓存（旧游标对应的页仍然有效，保留不动）
+        """
+        while old_cursor is not None and (limit, cursor, filters) not in old:
+            nxt = old.get((limit, old_cursor, filters))
+            if nxt is None:
+                return
+            records = [carry] + nxt['records']
+            next_cursor = nxt['next_cursor']
+            carry = None
+            if len(records) > limit:
+                carry = records[limit]
+                records = records[:limit]
+                next_cursor = records[-1]['cursor']
+            self.history_cursor_pages.set((limit, cursor, filters), {**nxt, 'cursor': cursor, 'records': records, 'next_cursor': next_cursor})
+            if carry is None:
+                return
+            cursor, old_cursor = next_cursor, nxt['next_cursor']
+
+    def _delete_from_offset_pages(self, history_id: int, key: Tuple[datetime, int], record: Optional[dict]) -> None:
+        # 按 offset 升序处理，补位时需要读取下一页（修改前）的第一条
+        old = dict(self.history_pages.items())
+        for (limit, offset, filters), page in sorted(old.items(), key=lambda kv: kv[0][1]):
+            if not filters.is_empty():
+                if record is None:
+                    self.history_pages.pop((limit, offset, filters))  # 无法判断被删记录是否属于该筛选视图
+                    continue
+                if not filters.matches(record):
+                    continue
+            records = page['records']
+            keys = [_record_key(r) for r in records]
+            if key in keys:
+                new_records = [r for r in records if r['id'] != history_id]
+            elif not records or keys[-1] > key:
+                new_records = records  # 被删记录在本页之后
+            elif keys[0] < key:
+                new_records = records[1:]  # 被删记录在本页之前，整页前移一位
+            else:
+                self.history_pages.pop((limit, offset, filters))
+                continue
+            if len(new_records) < len(records) and len(records) == limit and offset + limit < page['total']:
+                nxt = old.get((limit, offset + limit, filters))
+                if not nxt or not nxt['records']:
+                    self.history_pages.pop((limit, offset, filters))  # 缺少下一页无法补位
+                    continue
+                new_records = new_records + [nxt['records'][0]]
+            self.history_pages.set((limit, offset, filters), {**page, 'records': new_records, 'total': page['total'] - 1})
 
     def invalidate_history(self) -> None:
         with self.lock:
+            self._bump_generation()
             self.history_pages.clear()
+            self.history_cursor_pages.clear()
+            self.history_total = None
+            self.filtered_totals.clear()
             self.history_by_id.clear()
 
     def invalidate_file_path(self, checksum: str) -> None:
         with self.lock:
-            if checksum in self.file_paths:
-                del self.file_paths[checksum]
+            self.file_paths.pop(checksum)
 
     def clear_all(self) -> None:
         with self.lock:
+            self._bump_generation()
             self.history_pages.clear()
+            self.history_cursor_pages.clear()
+            self.history_total = None
+            self.filtered_totals.clear()
             self.history_by_id.clear()
             self.file_paths.clear()
 
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各命名空间的条目数、字节数及命中/未命中/淘汰计数"""
+        with self.lock:
+            return {
+                ns.name: ns.stats()
+                for ns in (self.history_pages, self.history_cursor_pages, self.history_by_id, self.file_paths,
+                           self.filtered_totals, self.response_bodies)
+            }
+
 
 cache = InMemoryCache()
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+# 变更日志（增量同步）
+# change_log 由触发器在 clipboardhistory 插入/删除时写入，id（AUTOINCREMENT）即变更版本号，
+# 客户端保存最后处理的版本号，之后按 id 顺序读取 id > since 的变更即可追平，无需重新翻页比对。
+# 旧日志按保留天数清理，但始终保留最新一条，据此判断客户端的版本号是否已过期。
+
+CHANGE_TABLE = "change_log"
+
+_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS {CHANGE_TABLE}_ai AFTER INSERT ON clipboardhistory BEGIN "
+    f"INSERT INTO {CHANGE_TABLE}(op, history_id, history_uuid, created_at) "
+    f"VALUES ('insert', new.id, new.uuid, datetime('now')); END",
+    f"CREATE TRIGGER IF NOT EXISTS {CHANGE_TABLE}_ad AFTER DELETE ON clipboardhistory BEGIN "
+    f"INSERT INTO {CHANGE_TABLE}(op, history_id, history_uuid, created_at) "
+    f"VALUES ('delete', old.id, old.uuid, datetime('now')); END",
+]
+
+def ensure_change_log(engine) -> None:
+    """确保同步触发器存在；首次创建时为已有记录补写 insert 日志，since=0 即可得到全量"""
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?", (f"{CHANGE_TABLE}_ai",)
+        ).first()
+        if exists:
+            return
+        conn.exec_driver_sql(
+            f"INSERT INTO {CHANGE_TABLE}(op, history_id, history_uuid, created_at) "
+            f"SELECT 'insert', id, uuid, datetime('now') FROM clipboardhistory ORDER BY id"
+        )
+        for statement in _TRIGGERS:
+            conn.exec_driver_sql(statement)
+        print(f"已创建变更日志触发器 {CHANGE_TABLE}")
+
+def current_version(conn) -> int:
+    """最新的变更版本号（没有任何变更时为 0）"""
+    return conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {CHANGE_TABLE}").scalar()
+
+def version_of(conn, history_id: int, op: str) -> Optional[int]:
+    """某条记录的插入/删除对应的变更版本号"""
+    return conn.exec_driver_sql(
+        f"SELECT MAX(id) FROM {CHANGE_TABLE} WHERE history_id = ? AND op = ?", (history_id, op)
+    ).scalar()
+
+def is_expired(conn, since: int) -> bool:
+    """since 之后的部分日志已被清理，客户端需要重新全量同步"""
+    oldest = conn.exec_driver_sql(f"SELECT MIN(id) FROM {CHANGE_TABLE}").scalar()
+    return oldest is not None and since < oldest - 1
+
+def fetch_changes(conn, since: int, until: int, limit: int) -> List[Tuple[int, str, int, str]]:
+    """按版本号顺序返回 (since, until] 范围内的最多 limit 条变更 (version, op, history_id, history_uuid)"""
+    return conn.exec_driver_sql(
+        f"SELECT id, op, history_id, history_uuid FROM {CHANGE_TABLE} "
+        f"WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+        (since, until, limit),
+    ).all()
+
+def prune_change_log(engine, retention_days: int) -> int:
+    """删除超过保留天数的日志（始终保留最新一条），返回删除条数"""
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    with engine.begin() as conn:
+        result = conn.exec_driver_sql(
+            f"DELETE FROM {CHANGE_TABLE} WHERE created_at < ? "
+            f"AND id < (SELECT MAX(id) FROM {CHANGE_TABLE})",
+            (cutoff,),
+        )
+        return result.rowcount
@@ -0,0 +1,341 @@
+import json
+import time
+import zlib
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.orm import defer
+from config import config
+from app.models.models import ClipboardHistory, ClipboardContent, ClipboardDictionary
+from app.db.engine import get_read_engine
+from app.db.search import index_contents
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时使用 zlib
+    zstandard = None
+
+# 剪贴板内容的存储与列表预览
+# 列表/搜索/推送只返回前 LIST_PREVIEW_CHARS 个字符的预览（数据库端 substr 截取），
+# 以及完整内容的字节数与MD5（写入时计算并存列），完整内容通过 /api/history/<id> 按需获取。
+# 列表查询延迟加载 clipboard 与 raw_content 两列，大文本不会进入分页结果和分页缓存。
+#
+# 超过 TEXT_COMPRESS_THRESHOLD 字节的文本压缩后存入 clipboard_content（按MD5去重），
+# clipboardhistory.clipboard 只保留前 TEXT_INLINE_CHARS 个字符（用于预览），行保持短小；
+# 完整文本在写入时另建全文索引（TEXT_SEARCH_FULL，见 app/db/search.py），检索不受前缀长度限制；
+# 使用 zstd 时以共享字典压缩：大文本之间常有大量相同的片段（同类日志、代码、模板），
+# 16KB 级别的文本约可再小 15%~20%。字典由监控进程用已有内容训练并存入 clipboard_dictionary（maintain_dictionary），
+# 字典ID写在 zstd 帧头中，解压时据此读取对应的字典（按ID缓存），clipboard_content 不需要额外的列。
+# raw_content 中不再重复保存 Clipboard 字段，读取完整记录时再还原。
+# content_size 大于 clipboard 列的字节数即表示完整内容在 clipboard_content 中。
+
+CONTENT_TABLE = "clipboard_content"
+
+# 最后一条引用某压缩内容的记录被删除时，同时删除压缩内容
+_TRIGGER = (
+    f"CREATE TRIGGER IF NOT EXISTS {CONTENT_TABLE}_ad AFTER DELETE ON clipboardhistory "
+    f"WHEN old.content_hash IS NOT NULL BEGIN "
+    f"DELETE FROM {CONTENT_TABLE} WHERE content_hash = old.content_hash "
+    f"AND NOT EXISTS (SELECT 1 FROM clipboardhistory WHERE content_hash = old.content_hash); END"
+)
+
+def content_meta(text: Optional[str]) -> Tuple[int, str]:
+    """返回内容的 (UTF-8 字节数, MD5)"""
+    data = (text or "").encode("utf-8")
+    return len(data), hashlib.md5(data).hexdigest()
+
+def _codec() -> str:
+    if config.TEXT_COMPRESSION in ("auto", "zstd") and zstandard is not None:
+        return "zstd"
+    return "zlib"
+
+_dictionaries: Dict[int, "zstandard.ZstdCompressionDict"] = {}  # 已加载的字典（按 zstd 字典ID）
+_latest_dict_id = 0  # 压缩使用的字典ID（0 为不使用字典）
+_latest_checked = None  # 上次检查最新字典的时间（time.monotonic）
+
+def _query(conn, statement):
+    """在 conn 上执行查询（写事务中压缩时传入事务的连接），conn 为 None 时使用读引擎"""
+    if conn is not None:
+        return conn.execute(statement).scalar()
+    with get_read_engine().connect() as read_conn:
+        return read_conn.execute(statement).scalar()
+
+def _load_dictionary(dict_id: int, conn=None) -> "zstandard.ZstdCompressionDict":
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        data = _query(conn, select(ClipboardDictionary.data).where(ClipboardDictionary.dict_id == dict_id))
+        if data is None:
+            raise RuntimeError(f"缺少 zstd 字典 {dict_id}")
+        dictionary = _dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+    return dictionary
+
+def _current_dictionary(conn=None) -> Optional["zstandard.ZstdCompressionDict"]:
+    """压缩使用的最新字典，没有时为 None（每 TEXT_ZSTD_DICT_REFRESH 秒查询一次是否有新字典）"""
+    global _latest_dict_id, _latest_checked
+    if not config.TEXT_ZSTD_DICT_ENABLED:
+        return None
+    now = time.monotonic()
+    if _latest_checked is None or now - _latest_checked >= config.TEXT_ZSTD_DICT_REFRESH:
+        _latest_checked = now
+        _latest_dict_id = _query(
+            conn, select(ClipboardDictionary.dict_id).order_by(ClipboardDictionary.id.desc()).limit(1)
+        ) or 0
+    return _load_dictionary(_latest_dict_id, conn) if _latest_dict_id else None
+
+def compress_text(text: str, conn=None) -> Tuple[str, bytes]:
+    """
+    返回 (压缩算法, 压缩后的字节)
+    :param conn: 在写事务中调用时传入事务的连接，读取共享字典不再另占读引擎的连接
+    """
+    data = text.encode("utf-8")
+    if _codec() == "zstd":
+        compressor = zstandard.ZstdCompressor(level=config.TEXT_COMPRESSION_LEVEL, dict_data=_current_dictionary(conn))
+        return "zstd", compressor.compress(data)
+    return "zlib", zlib.compress(data, min(config.TEXT_COMPRESSION_LEVEL, 9))
+
+def decompress_text(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("该内容使用 zstd 压缩，需要安装 zstandard")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = _load_dictionary(dict_id) if dict_id else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+def maintain_dictionary(engine) -> Optional[int]:
+    """
+    训练 zstd 共享字典（监控进程定期调用）：尚无字典且压缩内容达到 TEXT_ZSTD_DICT_MIN_SAMPLES 条，
+    或上次训练后新增的内容达到 TEXT_ZSTD_DICT_RETRAIN_EVERY 条时，用最近的内容训练新字典
+    :return: 新字典的ID，未训练时为 None
+    """
+    if not config.TEXT_ZSTD_DICT_ENABLED or _codec() != "zstd":
+        return None
+    with get_read_engine().connect() as conn:
+        last_content_id = conn.execute(
+            select(ClipboardDictionary.last_content_id).order_by(ClipboardDictionary.id.desc()).limit(1)
+        ).scalar()
+        threshold = config.TEXT_ZSTD_DICT_MIN_SAMPLES if last_content_id is None else config.TEXT_ZSTD_DICT_RETRAIN_EVERY
+        added = conn.execute(
+            select(func.count()).select_from(ClipboardContent).where(ClipboardContent.id > (last_content_id or 0))
+        ).scalar()
+        if added < threshold:
+            return None
+        rows = conn.execute(
+            select(ClipboardContent.id, ClipboardContent.codec, ClipboardContent.data)
+            .order_by(ClipboardContent.id.desc()).limit(config.TEXT_ZSTD_DICT_MAX_SAMPLES)
+        ).all()
+    samples = [decompress_text(codec, data).encode("utf-8")[:config.TEXT_ZSTD_DICT_SAMPLE_BYTES]
+               for _, codec, data in rows]
+    try:
+        dictionary = zstandard.train_dictionary(config.TEXT_ZSTD_DICT_SIZE, samples,
+                                                level=config.TEXT_COMPRESSION_LEVEL)
+    except zstandard.ZstdError as e:
+        print(f"训练 zstd 字典失败: {e}")
+        return None
+    with engine.begin() as conn:
+        conn.execute(insert(ClipboardDictionary.__table__), {
+            "dict_id": dictionary.dict_id(), "data": dictionary.as_bytes(),
+            "samples": len(samples), "last_content_id": rows[0].id, "created_at": datetime.utcnow(),
+        })
+    print(f"已用 {len(samples)} 条内容训练 zstd 共享字典 {dictionary.dict_id()}")
+    return dictionary.dict_id()
+
+def _strip_raw_content(raw_content: Optional[str], clipboard: str) -> Optional[str]:
+    """原始JSON中去掉与 clipboard 列重复的 Clipboard 字段"""
+    if not raw_content:
+        return raw_content
+    try:
+        data = json.loads(raw_content)
+    except ValueError:
+        return raw_content
+    if not isinstance(data, dict) or data.get("Clipboard") != clipboard:
+        return raw_content
+    del data["Clipboard"]
+    return json.dumps(data, ensure_ascii=False)
+
+def _restore_raw_content(raw_content: Optional[str], clipboard: str) -> Optional[str]:
+    """还原原始JSON中的 Clipboard 字段（放回 Type 之后，与 SyncClipboard.json 的顺序一致）"""
+    if not raw_content:
+        return raw_content
+    try:
+        data = json.loads(raw_content)
+    except ValueError:
+        return raw_content
+    if not isinstance(data, dict) or "Clipboard" in data:
+        return raw_content
+    restored = {}
+    for key, value in data.items():
+        restored[key] = value
+        if key == "Type":
+            restored["Clipboard"] = clipboard
+    if "Clipboard" not in restored:
+        restored = {"Clipboard": clipboard, **data}
+    return json.dumps(restored, ensure_ascii=False)
+
+def pack_content(clipboard: Optional[str], raw_content: Optional[str], conn=None) -> Tuple[dict, Optional[dict]]:
+    """
+    计算写入 clipboardhistory 的内容相关列，大文本同时返回需写入 clipboard_content 的行
+    :param conn: 同 compress_text
+    :return: ({clipboard, raw_content, content_size, content_hash}, clipboard_content 行或 None；
+             该行另带完整文本 text，供 insert_contents 建立全文索引，不写入表中)
+    """
+    clipboard = clipboard or ""
+    size, digest = content_meta(clipboard)
+    columns = {
+        "clipboard": clipboard,
+        "raw_content": _strip_raw_content(raw_content, clipboard),
+        "content_size": size,
+        "content_hash": digest,
+    }
+    blob = None
+    if size > config.TEXT_COMPRESS_THRESHOLD:
+        codec, data = compress_text(clipboard, conn)
+        blob = {"content_hash": digest, "codec": codec, "size": size, "data": data, "text": clipboard}
+        columns["clipboard"] = clipboard[:config.TEXT_INLINE_CHARS]
+    return columns, blob
+
+def insert_contents(conn, blobs: list) -> None:
+    """写入压缩内容并建立完整文本索引，相同MD5已存在时跳过"""
+    if blobs:
+        conn.execute(
+            insert(ClipboardContent.__table__).prefix_with("OR IGNORE"),
+            [{key: value for key, value in blob.items() if key != "text"} for blob in blobs]
+        )
+        index_contents(conn, blobs)
+
+def iter_contents(conn, batch_size: int = 200):
+    """按 id 顺序分批读取并解压全部压缩内容，每批为 [(id, 完整文本)]（建立全文索引时使用）"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(ClipboardContent.id, ClipboardContent.codec, ClipboardContent.data)
+            .where(ClipboardContent.id > last_id).order_by(ClipboardContent.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield [(content_id, decompress_text(codec, data)) for content_id, codec, data in rows]
+        last_id = rows[-1][0]
+
+@event.listens_for(ClipboardHistory, "before_insert")
+def _pack_on_insert(mapper, connection, target) -> None:
+    # 所有通过 ORM 写入的记录自动处理；批量导入（Core executemany）由调用方调用 pack_content
+    columns, blob = pack_content(target.clipboard, target.raw_content, connection)
+    for name, value in columns.items():
+        setattr(target, name, value)
+    if blob:
+        insert_contents(connection, [blob])
+
+def is_compressed(clipboard: Optional[str], content_size: Optional[int]) -> bool:
+    """完整内容是否在 clipboard_content 中（clipboard 列只是前缀）"""
+    return content_size is not None and content_size > len((clipboard or "").encode("utf-8"))
+
+def load_contents(conn, hashes: Iterable[str]) -> Dict[str, str]:
+    """批量读取并解压压缩内容，返回 {MD5: 完整内容}"""
+    hashes = list(set(hashes))
+    contents = {}
+    for i in range(0, len(hashes), 500):  # 分批，避免超出 SQLite 参数个数上限
+        table = ClipboardContent.__table__
+        rows = conn.execute(
+            select(table.c.content_hash, table.c.codec, table.c.data)
+            .where(table.c.content_hash.in_(hashes[i:i + 500]))
+        ).all()
+        for content_hash, codec, data in rows:
+            contents[content_hash] = decompress_text(codec, data)
+    return contents
+
+def full_content(row, contents: Dict[str, str]) -> Tuple[str, Optional[str]]:
+    """
+    还原一条记录的完整内容
+    :param row: 含 clipboard/raw_content/content_size/content_hash 属性的记录或查询行
+    :param contents: load_contents 的结果
+    :return: (完整 clipboard, 完整 raw_content)
+    """
+    clipboard = row.clipboard or ""
+    if is_compressed(clipboard, row.content_size):
+        if row.content_hash in contents:
+            clipboard = contents[row.content_hash]
+        else:
+            print(f"压缩内容缺失: {row.content_hash}，只返回前缀")
+    return clipboard, _restore_raw_content(row.raw_content, clipboard)
+
+def unpack_content(conn, row) -> Tuple[str, Optional[str]]:
+    """读取单条记录的完整 (clipboard, raw_content)，小文本不访问 clipboard_content"""
+    contents = load_contents(conn, [row.content_hash]) if is_compressed(row.clipboard, row.content_size) else {}
+    return full_content(row, contents)
+
+def ensure_content_storage(engine) -> None:
+    """确保压缩内容的清理触发器存在"""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_TRIGGER)
+
+def preview_column():
+    """预览列：数据库端截取，TEXT 的 substr 按字符计数"""
+    return func.substr(ClipboardHistory.clipboard, 1, config.LIST_PREVIEW_CHARS).label("preview")
+
+def list_options():
+    """列表查询不加载完整内容"""
+    return [defer(ClipboardHistory.clipboard), defer(ClipboardHistory.raw_content)]
+
+def make_preview(text: Optional[str]) -> str:
+    """已在内存中的内容（如刚写入的记录）对应的预览"""
+    return (text or "")[:config.LIST_PREVIEW_CHARS]
+
+def is_truncated(preview: Optional[str], content_size: Optional[int]) -> bool:
+    return content_size is not None and content_size > len((preview or "").encode("utf-8"))
+
+def backfill_content_meta(engine, batch_size: int = 2000) -> int:
+    """升级旧数据库：为缺少字节数/MD5的记录分批补齐，返回处理条数"""
+    count = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT id, clipboard FROM clipboardhistory WHERE id > ? AND content_hash IS NULL "
+                "ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).all()
+            if not rows:
+                return count
+            conn.exec_driver_sql(
+                "UPDATE clipboardhistory SET content_size = ?, content_hash = ? WHERE id = ?",
+                [(*content_meta(text), history_id) for history_id, text in rows],
+            )
+        count += len(rows)
+        last_id = rows[-1][0]
+
+def migrate_content_storage(engine, batch_size: int = 2000) -> Tuple[int, int]:
+    """
+    升级旧数据库（只执行一次）：大文本压缩移入 clipboard_content，raw_content 去掉重复的 Clipboard 字段
+    :return: (压缩的记录数, 更新的记录数)
+    """
+    compressed = updated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT id, clipboard, raw_content, content_size FROM clipboardhistory "
+                "WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).all()
+            if not rows:
+                break
+            updates = []
+            blobs = []
+            for history_id, clipboard, raw_content, content_size in rows:
+                if is_compressed(clipboard, content_size):
+                    continue  # 已是压缩存储
+                columns, blob = pack_content(clipboard, raw_content)
+                if columns["clipboard"] != clipboard or columns["raw_content"] != raw_content:
+                    updates.append((columns["clipboard"], columns["raw_content"],
+                                    columns["content_size"], columns["content_hash"], history_id))
+                if blob:
+                    blobs.append(blob)
+            insert_contents(conn, blobs)
+            if updates:
+                conn.exec_driver_sql(
+                    "UPDATE clipboardhistory SET clipboard = ?, raw_content = ?, content_size = ?, "
+                    "content_hash = ? WHERE id = ?", updates
+                )
+        compressed += len(blobs)
+        updated += len(updates)
+        last_id = rows[-1][0]
+    return compressed, updated
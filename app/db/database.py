@@ -1,14 +1,38 @@
 import os
-import shutil
-import hashlib
 import json
-from sqlmodel import SQLModel, create_engine, Session, select, func, delete
-from typing import Optional
+import threading
+from sqlmodel import SQLModel, Session, select, func, delete, or_, and_
+from typing import Optional, Tuple
 from config import config
 from app.models.models import ClipboardHistory, BackupFile, Folder, Favorite
 from app.db.cache import cache
+from app.db.search import ensure_content_index, ensure_search_index, search_ids
+from app.db import changes
+from app.db.content import preview_column, list_options, make_preview, is_truncated, backfill_content_meta, \
+    ensure_content_storage, migrate_content_storage, unpack_content, CONTENT_TABLE
+from app.db.pagination import encode_cursor, decode_cursor
+from app.db.filters import HistoryFilter, NO_FILTER
+from app.db.engine import get_write_engine, get_read_engine
+from app.services.backup_store import store_file, register_backup, verify_backup, backup_usage
+from app.services.checksum import file_checksum, remember
+from app.services.thumbnail_service import thumbnail_worker
+from app.services.event_bus import event_bus
+from app.services.offload import blocking_pool
 
-def init_db(): # 初始化数据库
+_init_lock = threading.Lock()
+_initialized = False
+
+def init_db(): # 初始化数据库（每个进程只执行一次建表/迁移，之后直接返回共享的写引擎）
+    global _initialized
+    if _initialized:
+        return get_write_engine()
+    with _init_lock:
+        if not _initialized:
+            _init_schema()
+            _initialized = True
+    return get_write_engine()
+
+def _init_schema():
     # 确保数据库目录存在
     db_dir = os.path.dirname(config.DB_PATH) # 获取父目录
     if not os.path.exists(db_dir):
@@ -24,14 +48,43 @@ def init_db(): # 初始化数据库
 
     db_exists = os.path.exists(config.DB_PATH)
 
-    # 创建SQLite数据库引擎
-    # echo=True 参数启用SQL日志（生产环境应设为False）
-    sqlite_url = f"sqlite:///{config.DB_PATH}"  # 数据库连接地址
-    engine = create_engine(sqlite_url, echo=config.DB_LOG_ENABLED)  # 创建引擎
+    # 进程内共享的写引擎（WAL 等 PRAGMA 见 app/db/engine.py）
+    engine = get_write_engine()
+
+    # 压缩存储表不存在说明是旧数据库，建表后需要迁移一次已有记录
+    with engine.connect() as conn:
+        migrate_content = db_exists and conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (CONTENT_TABLE,)
+        ).first() is None
 
     # 创建所有表（如果不存在）
     SQLModel.metadata.create_all(engine)
 
+    # create_all 不会给已存在的表补建列和索引，升级旧数据库时单独补建
+    added_columns = ensure_columns(engine)
+    ensure_indexes(engine)
+    if ("backup_files", "last_used_at") in added_columns:
+        # 旧备份的最近使用时间取引用它的最新历史记录时间
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "UPDATE backup_files SET last_used_at = (SELECT MAX(timestamp) FROM clipboardhistory "
+                "WHERE clipboardhistory.checksum = backup_files.checksum) WHERE last_used_at IS NULL"
+            )
+
+    if ("clipboardhistory", "content_hash") in added_columns:
+        print(f"数据库升级：已补齐 {backfill_content_meta(engine)} 条记录的内容大小与MD5")
+    ensure_content_storage(engine)
+    if migrate_content:
+        compressed, updated = migrate_content_storage(engine)
+        print(f"数据库升级：已压缩 {compressed} 条大文本，精简 {updated} 条记录（可执行 VACUUM 回收空间）")
+
+    # 全文索引（FTS5）及同步触发器
+    ensure_search_index(engine)
+    ensure_content_index(engine)  # 大文本完整内容的全文索引（TEXT_SEARCH_FULL）
+
+    # 变更日志触发器（/api/changes 增量同步与实时推送的版本号）
+    changes.ensure_change_log(engine)
+
     # 初始化收藏夹根目录（仅当首次创建数据库时）
     if not db_exists:
         with Session(engine) as session:
@@ -46,156 +99,194 @@ def init_db(): # 初始化数据库
             session.add(root_folder)
             session.commit()
 
-    return engine
+def ensure_columns(engine) -> list:
+    """
+    为已存在的表补建模型中新增的列（ALTER TABLE ADD COLUMN，新列可为空）
+    :return: 新增的 (表名, 列名) 列表
+    """
+    added = []
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info('{table.name}')")}
+            if not existing:
+                continue  # 表刚由 create_all 创建或不存在
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                    added.append((table.name, column.name))
+                    print(f"数据库升级：{table.name} 新增列 {column.name}")
+    return added
+
+def ensure_indexes(engine) -> None:
+    """为已存在的表补建模型中声明但数据库中缺失的索引"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def add_history_item_from_json(data: dict, engine=None):
     """
     将SyncClipboard.json的内容写入数据库，自动处理文本、文件、图片类型。
     :param data: 解析后的JSON字典
-    :param engine: 可选，传入SQLModel数据库引擎，否则自动init_db
+    :param engine: 可选，传入SQLModel数据库引擎，否则使用共享的写引擎
     """
     if engine is None:
         engine = init_db()
-    with Session(engine) as session:
-        item_type = data.get("Type", "")
-        file_name = data.get("File", "")
-        clipboard = data.get("Clipboard", "")
-        from_equipment = data.get("From", None)
-        tag = data.get("Tag", None)
-        raw_content = json.dumps(data, ensure_ascii=False)
-        checksum = None
-
-        # 处理文件/图片类型
-        if item_type in ["File", "Image"] and file_name:
-            # clipboard字段本身就是MD5，无需再算
-            checksum = clipboard
-            src_path = os.path.join(os.path.dirname(config.SYNC_CLIPBOARD_JSON_PATH), "file", file_name)
-            exists = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
-            backup_name = file_name
-            backup_path = os.path.join(config.BACKUP_DIR, backup_name)
-            os.makedirs(config.BACKUP_DIR, exist_ok=True)
-            if not exists and os.path.exists(src_path):
-                # 文件名冲突且内容不同，加后缀
-                base, ext = os.path.splitext(file_name)
-                count = 1
-                while os.path.exists(backup_path):
-                    # 检查已存在的文件内容是否相同
-                    with open(backup_path, "rb") as f:
-                        if hashlib.md5(f.read()).hexdigest() == checksum:
-                            break
-                    backup_name = f"{base}_{count}{ext}"
-                    backup_path = os.path.join(config.BACKUP_DIR, backup_name)
-                    count += 1
-                if not os.path.exists(backup_path):
-                    shutil.copy2(src_path, backup_path)
-                size = os.path.getsize(backup_path)
-                backup = BackupFile(
-                    checksum=checksum,
-                    filepath=backup_path,
-                    size=size
-                )
-                session.add(backup)
-            elif not os.path.exists(src_path):
-                print(f"文件未找到: {src_path}")
-
-        # group类型（多文件压缩包），需要计算MD5
-        elif item_type == "Group" and file_name:
-            src_path = os.path.join(os.path.dirname(config.SYNC_CLIPBOARD_JSON_PATH), "file", file_name)
-            if os.path.exists(src_path):
-                with open(src_path, "rb") as f:
-                    file_bytes = f.read()
-                    checksum = hashlib.md5(file_bytes).hexdigest()
-                exists = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
-                backup_name = file_name
-                backup_path = os.path.join(config.BACKUP_DIR, backup_name)
-                os.makedirs(config.BACKUP_DIR, exist_ok=True)
-                if not exists:
-                    base, ext = os.path.splitext(file_name)
-                    count = 1
-                    while os.path.exists(backup_path):
-                        with open(backup_path, "rb") as f:
-                            if hashlib.md5(f.read()).hexdigest() == checksum:
-                                break
-                        backup_name = f"{base}_{count}{ext}"
-                        backup_path = os.path.join(config.BACKUP_DIR, backup_name)
-                        count += 1
-                    if not os.path.exists(backup_path):
-                        shutil.copy2(src_path, backup_path)
-                    size = os.path.getsize(backup_path)
-                    backup = BackupFile(
-                        checksum=checksum,
-                        filepath=backup_path,
-                        size=size
-                    )
-                    session.add(backup)
+    item_type = data.get("Type", "")
+    file_name = data.get("File", "")
+    clipboard = data.get("Clipboard", "")
+    checksum = None
+    checksum_entry = None
+    backup_path = None
+
+    # 处理文件/图片/group类型：按内容寻址放入备份存储，原始文件名只记录在数据库中
+    # 计算MD5与复制文件在打开写会话之前完成，读取/复制大文件期间不占用写连接
+    if item_type in ["File", "Image", "Group"] and file_name:
+        src_path = os.path.join(os.path.dirname(config.SYNC_CLIPBOARD_JSON_PATH), "file", file_name)
+        if not os.path.exists(src_path):
+            print(f"文件未找到: {src_path}")
+            # clipboard字段本身就是MD5，group类型无法计算
+            checksum = clipboard if item_type != "Group" else None
+        else:
+            if item_type == "Group":
+                # group类型（多文件压缩包），需要计算MD5（压缩包未变化时复用记录的校验和）
+                checksum, checksum_entry = file_checksum(src_path)
             else:
-                print(f"文件未找到: {src_path}")
-
-        # 写入历史表
-        history = ClipboardHistory(
-            raw_content=raw_content,
-            clipboard=clipboard,
-            type=item_type,
-            from_equipment=from_equipment,
-            tag=tag,
-            checksum=checksum
-        )
+                # clipboard字段本身就是MD5，无需再算
+                checksum = clipboard
+            backup_path = store_file(src_path, checksum)
+
+    history = ClipboardHistory(
+        raw_content=json.dumps(data, ensure_ascii=False),
+        clipboard=clipboard,
+        type=item_type,
+        from_equipment=data.get("From", None),
+        tag=data.get("Tag", None),
+        checksum=checksum,
+        original_filename=file_name if item_type in ["File", "Image", "Group"] and file_name else None
+    )
+    # 写事务（serve.py 工作进程中在专用写线程执行），提交后在当前线程更新缓存并推送
+    history_id, record, version, backup_path, added_bytes = blocking_pool.run_write(
+        insert_history, engine, history, backup_path, checksum_entry
+    )
+    backup_usage.add(added_bytes)
+    on_history_inserted(record, version)
+    if checksum:
+        cache.invalidate_file_path(checksum)
+    if item_type == "Image" and backup_path:
+        thumbnail_worker.submit(checksum, backup_path)
+    return history_id
+
+def insert_history(engine, history: ClipboardHistory, backup_path: Optional[str] = None,
+                    checksum_entry: Optional[dict] = None) -> tuple:
+    """
+    在一个事务中登记备份文件并写入记录（只访问数据库，可在专用写线程中执行）
+    :return: (记录ID, 列表格式的记录, 变更版本号, 备份路径, 新增备份字节数)
+    """
+    with Session(engine) as session:
+        added_bytes = 0
+        if backup_path:
+            backup, added_bytes = register_backup(session, history.checksum, backup_path)
+            backup_path = backup.filepath if backup else None
         session.add(history)
+        remember(session, [checksum_entry])  # 新计算的校验和与记录在同一个事务中写入
         session.commit()
-        cache.invalidate_history()
-        if checksum:
-            cache.invalidate_file_path(checksum)
-        return history.id
+        record, version = inserted_record(session, history)
+        return history.id, record, version, backup_path, added_bytes
+
+def inserted_record(session, history: ClipboardHistory) -> Tuple[dict, Optional[int]]:
+    """新记录提交后，返回 (列表格式的记录, 变更版本号)，供 on_history_inserted 使用"""
+    record = _to_list_records(session, [(history, make_preview(history.clipboard))])[0]
+    version = changes.version_of(session.connection(), history.id, "insert")
+    return record, version
+
+def on_history_inserted(record: dict, version: Optional[int]) -> None:
+    """新记录提交后：增量更新列表缓存（代替整体失效，保持缓存命中率），并将新记录推送给浏览器"""
+    cache.history_inserted(record, version)
+    event_bus.publish_history_delta("insert", version, record=record)
+
+def on_history_deleted(history_id: int, timestamp, uuid: str, record: Optional[dict] = None) -> None:
+    """
+    记录删除提交后：增量更新列表缓存，并通知浏览器移除该记录
+    :param record: 被删记录的 type/source/tag，用于只更新受影响的筛选视图
+    """
+    with get_read_engine().connect() as conn:
+        version = changes.version_of(conn, history_id, "delete")
+    cache.history_deleted(history_id, timestamp, record, version)
+    event_bus.publish_history_delta("delete", version, id=history_id, uuid=uuid)
+
+def _get_favorite_uuids(session, uuids: list) -> set:
+    """返回 uuids 中已被收藏的记录UUID集合（走 _favorite_unique 唯一索引的 history_uuid 前缀）"""
+    if not uuids:
+        return set()
+    return set(session.exec(
+        select(Favorite.history_uuid).where(Favorite.history_uuid.in_(uuids)).distinct()
+    ).all())
+
+def _list_select():
+    """列表查询：记录（不加载 clipboard/raw_content）+ 内容预览"""
+    return select(ClipboardHistory, preview_column()).options(*list_options())
+
+def _to_list_records(session, rows) -> list:
+    """
+    将历史记录转换为列表接口（主页/搜索/推送）使用的字典格式
+    :param rows: (ClipboardHistory, 内容预览) 序列，通常由 _list_select() 查询得到
+    """
+    # 一次集合查询得到本页所有收藏状态，避免逐条查询
+    favorite_uuids = _get_favorite_uuids(session, [item.uuid for item, _ in rows])
+
+    records = []
+    for item, preview in rows:
+        is_text = item.type == 'Text'
+        records.append({
+            'id': item.id,
+            'uuid': item.uuid,
+            'type': item.type,
+            'timestamp': item.timestamp.isoformat(' ', 'seconds'),  # 同 strftime('%Y-%m-%d %H:%M:%S')，更快
+            'source': item.from_equipment,
+            'tag': item.tag,  # 添加标签信息
+            'is_favorite': item.uuid in favorite_uuids,
+            'content': preview if is_text else None,  # 文本预览，完整内容见 truncated
+            'content_size': item.content_size,
+            'content_hash': item.content_hash,
+            'truncated': is_text and is_truncated(preview, item.content_size),
+            # 旧数据的文件名已在创建全文索引时从原始JSON回填
+            'file_name': item.original_filename,
+            'checksum': item.checksum,
+            'cursor': encode_cursor(item.timestamp, item.id)  # 可从任意记录之后继续翻页
+        })
+    return records
+
+# 写入缓存的查询结果需对应确定的变更版本：查询前后各读一次版本号，一致时连同版本号写入缓存
+# （缓存只接受与其当前版本相同的数据，见 InMemoryCache._accepts），期间有新的提交时不写入
+def _version_unchanged(session, version: int) -> bool:
+    return changes.current_version(session.connection()) == version
 
 class ServerGet:
     def __init__(self):
-        self.engine = create_engine(f"sqlite:///{config.DB_PATH}", echo=False)
+        self.engine = get_read_engine()  # 只读连接池，不受写入阻塞
 
-    # 主页列表专用查询（仅按时间排序，无筛选）
-    def get_history_paginated(self, limit: int = 30, offset: int = 0) -> dict:
-        """仅按时间倒序返回指定偏移量和数量的记录，包含总条数"""
-        cached = cache.get_history_page(limit, offset)
+    # 主页列表专用查询（按时间排序，可按类型/来源/标签筛选）
+    def get_history_paginated(self, limit: int = 30, offset: int = 0, filters: HistoryFilter = NO_FILTER) -> dict:
+        """按时间倒序返回指定偏移量和数量的记录，包含（筛选后的）总条数"""
+        cached = cache.get_history_page(limit, offset, filters)
         if cached is not None:
             return cached
         with Session(self.engine) as session:
-            # 基础查询：按时间倒序（最新在前）
-            base_query = select(ClipboardHistory).order_by(ClipboardHistory.timestamp.desc())
+            version = changes.current_version(session.connection())
+            # 基础查询：按时间倒序（最新在前），id 作为同一时间的次序
+            base_query = _list_select().where(*filters.conditions()).order_by(
+                ClipboardHistory.timestamp.desc(), ClipboardHistory.id.desc()
+            )
 
             # 获取总记录数
-            total_count = session.exec(select(func.count()).select_from(base_query.subquery())).first()
+            total_count = self._get_total(session, filters)
 
             # 获取分页数据
             results = session.exec(base_query.offset(offset).limit(limit)).all()
 
             # 转换为前端可用格式
-            records = []
-            for item in results:
-                    # 优先使用 original_filename，如果没有则从原始JSON解析（兼容旧数据）
-                    file_name = item.original_filename
-                    if not file_name:
-                        try:
-                            raw_data = json.loads(item.raw_content)
-                            file_name = raw_data.get("File", None)
-                        except json.JSONDecodeError:
-                            pass
-
-                    # 检查是否为收藏
-                    is_favorite = session.exec(
-                        select(Favorite).where(Favorite.history_uuid == item.uuid)
-                    ).first() is not None
-
-                    records.append({ # for 循环中添加代码
-                        'id': item.id,
-                        'uuid': item.uuid,
-                        'type': item.type,
-                        'timestamp': item.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                        'source': item.from_equipment,
-                        'tag': item.tag,  # 添加标签信息
-                        'is_favorite': is_favorite,
-                        'content': item.clipboard if item.type == 'Text' else None,
-                        'file_name': file_name,
-                        'checksum': item.checksum
-                    })
+            records = _to_list_records(session, results)
 
             payload = {
                 'records': records,
@@ -203,23 +294,122 @@ class ServerGet:
                 'limit': limit,
                 'offset': offset
             }
-            cache.set_history_page(limit, offset, payload)
+            if _version_unchanged(session, version):
+                cache.set_history_page(limit, offset, payload, filters, version)
             return payload
 
+    # 主页列表游标分页：按 (timestamp, id) 定位，翻到任意深度的代价都与第一页相同
+    def get_history_by_cursor(self, limit: int = 30, cursor: Optional[str] = None,
+                              with_total: bool = False, filters: HistoryFilter = NO_FILTER) -> dict:
+        """
+        返回游标之后的 limit 条记录（时间倒序），游标为空时从最新记录开始
+        :param cursor: 上一页返回的 next_cursor（或任意记录的 cursor）
+        :param with_total: 是否附带总条数（由缓存的计数提供，不做每页 COUNT）
+        :param filters: 筛选条件，游标只在同一筛选条件下有效
+        :raises ValueError: 游标格式错误
+        """
+        cursor = cursor or ""
+        payload = cache.get_history_cursor_page(limit, cursor, filters)
+        if payload is None:
+            with Session(self.engine) as session:
+                version = changes.current_version(session.connection())
+                query = _list_select().where(*filters.conditions()).order_by(
+                    ClipboardHistory.timestamp.desc(), ClipboardHistory.id.desc()
+                )
+                if cursor:
+                    timestamp, history_id = decode_cursor(cursor)
+                    query = query.where(or_(
+                        ClipboardHistory.timestamp < timestamp,
+                        and_(ClipboardHistory.timestamp == timestamp, ClipboardHistory.id < history_id)
+                    ))
+
+                # 多取一条用于判断是否还有下一页
+                results = session.exec(query.limit(limit + 1)).all()
+                has_more = len(results) > limit
+                records = _to_list_records(session, results[:limit])
+                cacheable = _version_unchanged(session, version)
+
+            payload = {
+                'records': records,
+                'limit': limit,
+                'cursor': cursor,
+                'next_cursor': records[-1]['cursor'] if has_more and records else None
+            }
+            if cacheable:
+                cache.set_history_cursor_page(limit, cursor, payload, filters, version)
+
+        if with_total:
+            with Session(self.engine) as session:
+                return {**payload, 'total': self._get_total(session, filters)}
+        return payload
+
+    def _get_total(self, session, filters: HistoryFilter = NO_FILTER) -> int:
+        """历史记录总数（筛选后），缓存命中时不访问数据库"""
+        total = cache.get_history_total(filters)
+        if total is None:
+            version = changes.current_version(session.connection())
+            total = session.exec(
+                select(func.count()).select_from(ClipboardHistory).where(*filters.conditions())
+            ).one()
+            if _version_unchanged(session, version):
+                cache.set_history_total(total, filters, version)
+        return total
+
+    # 搜索接口：基于 FTS5 全文索引，数据库端排序与分页
+    def search_history(self, query: str, limit: int = 30, offset: int = 0, filters: HistoryFilter = NO_FILTER) -> dict:
+        """按相关度返回匹配 query 的记录（内容、文件名、来源、标签、时间），包含命中总数"""
+        with Session(self.engine) as session:
+            ids, total_count = search_ids(session.connection(), query, limit, offset, filters)
+            records = []
+            if ids:
+                rows = session.exec(_list_select().where(ClipboardHistory.id.in_(ids))).all()
+                # IN 查询不保证顺序，按检索结果的相关度顺序重排
+                by_id = {row[0].id: row for row in rows}
+                records = _to_list_records(session, [by_id[i] for i in ids if i in by_id])
+            return {
+                'records': records,
+                'total': total_count,
+                'limit': limit,
+                'offset': offset
+            }
+
+    # 下载接口，备份文件按 checksum 存放，下载时使用记录中的原始文件名
+    def get_file_name_by_checksum(self, checksum: str) -> Optional[str]:
+        """返回最近一条使用该文件的记录的原始文件名"""
+        with Session(self.engine) as session:
+            return session.exec(
+                select(ClipboardHistory.original_filename)
+                .where(ClipboardHistory.checksum == checksum, ClipboardHistory.original_filename.is_not(None))
+                .order_by(ClipboardHistory.id.desc())
+            ).first()
+
+    def is_backup_evicted(self, checksum: str) -> bool:
+        """历史记录仍引用该文件，但备份已因容量限制被清理"""
+        with Session(self.engine) as session:
+            referenced = session.exec(
+                select(ClipboardHistory.id).where(ClipboardHistory.checksum == checksum)
+            ).first() is not None
+            backed_up = session.exec(
+                select(BackupFile.id).where(BackupFile.checksum == checksum)
+            ).first() is not None
+            return referenced and not backed_up
 
     # 下载接口，根据checksum获取文件路径
     def get_file_path_by_checksum(self, checksum: str) -> Optional[str]:
-        """根据文件校验和获取文件路径"""
-        hit, cached_path = cache.get_file_path(checksum)
-        if hit:
-            return cached_path
-        with Session(self.engine) as session:
-            backup = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
-            if backup and os.path.exists(backup.filepath):
-                cache.set_file_path(checksum, backup.filepath)
-                return backup.filepath
-            cache.set_file_path(checksum, None)
+        """根据文件校验和获取文件路径（硬链接模式下同时校验内容，已被改写的备份视为已清理）"""
+        hit, path = cache.get_file_path(checksum)
+        if hit and path and not os.path.exists(path):
+            # 备份已被其他进程清理（失效通知尚未送达或丢失），重新查询
+            cache.invalidate_file_path(checksum)
+            hit = False
+        if not hit:
+            with Session(self.engine) as session:
+                backup = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
+            path = backup.filepath if backup and os.path.exists(backup.filepath) else None
+            cache.set_file_path(checksum, path)
+        if path and not verify_backup(get_write_engine(), checksum, path):
             return None
+        return path
 
     # 根据 ID 获取历史记录
     def get_history_by_id(self, history_id: int):
@@ -227,27 +417,70 @@ class ServerGet:
         if cached is not None:
             return cached
         with Session(self.engine) as session: # 通过 Session 类创建一个数据库会话（session），self.engine 是数据库引擎（已在类中初始化），用于建立与数据库的连接。with 语句确保会话使用完毕后自动关闭，释放资源。
+            version = changes.current_version(session.connection())
             # 使用 SQLModel 的 select 方法构建查询语句，指定查询 ClipboardHistory 模型（对应数据库表），并通过 where 条件筛选出 id 等于 history_id 的记录。
             statement = select(ClipboardHistory).where(ClipboardHistory.id == history_id)
             result = session.exec(statement).first() # 通过会话的 exec 方法执行查询语句，first() 方法获取查询结果中的第一条记录（因为 id 通常是唯一的，所以最多只有一条结果）。
 
             if result:
+                # 大文本在此解压，原始JSON还原 Clipboard 字段
+                clipboard, raw_content = unpack_content(session.connection(), result)
                 # 将结果转换为字典格式
                 payload = {
                     'id': result.id,
                     'uuid': result.uuid,
                     'type': result.type,
-                    'clipboard': result.clipboard,
+                    'clipboard': clipboard,
                     'from_equipment': result.from_equipment,
                     'tag': result.tag,
                     'timestamp': result.timestamp.isoformat(),
                     'checksum': result.checksum,
-                    'raw_content': result.raw_content
+                    'original_filename': result.original_filename,
+                    'content_size': result.content_size,
+                    'content_hash': result.content_hash,
+                    'raw_content': raw_content
                 }
-                cache.set_history_by_id(history_id, payload)
+                if _version_unchanged(session, version):
+                    cache.set_history_by_id(history_id, payload, version)
                 return payload
             return None
 
+    # 增量同步：变更日志
+    def get_change_version(self) -> int:
+        """当前最新的变更版本号"""
+        with self.engine.connect() as conn:
+            version = changes.current_version(conn)
+        cache.sync_change_version(version)  # 其他进程写入过时清空本进程的缓存
+        return version
+
+    def is_change_version_expired(self, since: int) -> bool:
+        with self.engine.connect() as conn:
+            return changes.is_expired(conn, since)
+
+    def iter_changes(self, since: int, until: int, batch_size: int = 500):
+        """
+        按版本号顺序逐条生成 (since, until] 范围内的变更，每批一次查询
+        insert 附带完整记录（格式同列表接口），之后又被删除的记录 record 为 None（随后会有对应的 delete）
+        """
+        while since < until:
+            with Session(self.engine) as session:
+                rows = changes.fetch_changes(session.connection(), since, until, batch_size)
+                if not rows:
+                    return
+                # 按 uuid 取记录：SQLite 会复用已删除的最大 id
+                insert_uuids = [row[3] for row in rows if row[1] == "insert"]
+                items = session.exec(
+                    _list_select().where(ClipboardHistory.uuid.in_(insert_uuids))
+                ).all() if insert_uuids else []
+                records = {record['uuid']: record for record in _to_list_records(session, items)}
+
+            for version, op, history_id, history_uuid in rows:
+                change = {'version': version, 'op': op, 'id': history_id, 'uuid': history_uuid}
+                if op == "insert":
+                    change['record'] = records.get(history_uuid)
+                yield change
+            since = rows[-1][0]
+
 class ServerSet:
     def __init__(self):
-        self.engine = create_engine(f"sqlite:///{config.DB_PATH}", echo=False)
+        self.engine = get_write_engine()
@@ -0,0 +1,84 @@
+import threading
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine
+from config import config
+from app.services import metrics
+
+# 进程内共享的数据库引擎（连接池）
+# 写引擎只保留一个连接，所有写操作在进程内串行；读引擎为独立连接池（query_only）。
+# 数据库使用 WAL 日志模式，读连接不会被监控线程的写入阻塞。
+# serve.py 工作进程的写线程（见 app/services/offload.py）另有一个只在该线程中使用的连接（create_writer_engine）。
+
+_lock = threading.Lock()
+_write_engine = None
+_read_engine = None
+
+def _set_sqlite_pragmas(dbapi_connection, read_only: bool) -> None:
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        cursor.execute("PRAGMA journal_mode=WAL")  # 持久化到数据库文件，读连接同样生效
+    cursor.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下 NORMAL 已足够安全，提交无需每次 fsync
+    cursor.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KB)}")  # 负数单位为 KiB
+    cursor.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
+def _create_engine(read_only: bool):
+    sqlite_url = f"sqlite:///{config.DB_PATH}"  # 数据库连接地址
+    pool_options = {"pool_size": config.DB_READ_POOL_SIZE, "max_overflow": config.DB_READ_POOL_SIZE} \
+        if read_only else {"pool_size": 1, "max_overflow": 0}
+    engine = create_engine(
+        sqlite_url,
+        echo=config.DB_LOG_ENABLED and not read_only,  # echo=True 启用SQL日志（生产环境应设为False）
+        connect_args={"check_same_thread": False, "timeout": config.DB_BUSY_TIMEOUT},
+        pool_timeout=config.DB_BUSY_TIMEOUT,
+        **pool_options,
+    )
+    event.listen(engine, "connect", lambda conn, _record: _set_sqlite_pragmas(conn, read_only))
+    if config.METRICS_ENABLED:
+        metrics.instrument_engine(engine, "read" if read_only else "write")
+    return engine
+
+def create_writer_engine():
+    """
+    专用写线程使用的引擎：单个连接，没有连接池锁；不输出 SQL 日志、不记录指标
+    （打补丁的进程中日志与指标使用的锁是协程锁，不能在真实线程中与事件循环争用）
+    """
+    engine = create_engine(
+        f"sqlite:///{config.DB_PATH}",
+        connect_args={"check_same_thread": False, "timeout": config.DB_BUSY_TIMEOUT},
+        poolclass=StaticPool,
+    )
+    event.listen(engine, "connect", lambda conn, _record: _set_sqlite_pragmas(conn, False))
+    return engine
+
+def get_write_engine():
+    """进程内共享的写引擎"""
+    global _write_engine
+    if _write_engine is None:
+        with _lock:
+            if _write_engine is None:
+                _write_engine = _create_engine(read_only=False)
+    return _write_engine
+
+def get_read_engine():
+    """进程内共享的只读引擎"""
+    global _read_engine
+    if _read_engine is None:
+        with _lock:
+            if _read_engine is None:
+                _read_engine = _create_engine(read_only=True)
+    return _read_engine
+
+def dispose_engines() -> None:
+    """关闭所有连接（用于切换数据库路径或进程 fork 之后）"""
+    global _write_engine, _read_engine
+    with _lock:
+        for engine in (_write_engine, _read_engine):
+            if engine is not None:
+                engine.dispose()
+        _write_engine = None
+        _read_engine = None
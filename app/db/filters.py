@@ -0,0 +1,49 @@
+from typing import Mapping, NamedTuple, Optional, Tuple
+from app.models.models import ClipboardHistory
+
+# 列表/搜索筛选条件（类型、来源设备、标签）
+# 在数据库端执行：按类型筛选走 (type, timestamp, id) 复合索引，顺序读取即可分页，无需排序。
+# 筛选条件本身可哈希，直接作为缓存键的一部分，每种筛选视图独立缓存分页。
+
+class HistoryFilter(NamedTuple):
+    types: Tuple[str, ...] = ()  # 为空表示不限类型，多个类型为 OR 关系
+    source: Optional[str] = None
+    tag: Optional[str] = None
+
+    @classmethod
+    def from_args(cls, args: Mapping) -> "HistoryFilter":
+        """
+        从请求参数解析：type（逗号分隔，all 表示全部）、source、tag
+        空参数视为不筛选
+        """
+        types = tuple(sorted({t.strip() for t in (args.get("type") or "").split(",")
+                              if t.strip() and t.strip().lower() != "all"}))
+        return cls(types, (args.get("source") or "").strip() or None, (args.get("tag") or "").strip() or None)
+
+    def is_empty(self) -> bool:
+        return not self.types and self.source is None and self.tag is None
+
+    def matches(self, record: Mapping) -> bool:
+        """列表格式的记录（type/source/tag）是否满足筛选条件"""
+        if self.types and record.get("type") not in self.types:
+            return False
+        if self.source is not None and record.get("source") != self.source:
+            return False
+        if self.tag is not None and record.get("tag") != self.tag:
+            return False
+        return True
+
+    def conditions(self) -> list:
+        """对应的 SQL 条件（用于 select().where(*conditions)）"""
+        conditions = []
+        if len(self.types) == 1:
+            conditions.append(ClipboardHistory.type == self.types[0])
+        elif self.types:
+            conditions.append(ClipboardHistory.type.in_(self.types))
+        if self.source is not None:
+            conditions.append(ClipboardHistory.from_equipment == self.source)
+        if self.tag is not None:
+            conditions.append(ClipboardHistory.tag == self.tag)
+        return conditions
+
+NO_FILTER = HistoryFilter()
@@ -0,0 +1,22 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+# 游标分页（keyset pagination）
+# 游标对调用方是不透明的字符串，内部为记录的 (timestamp, id)，
+# 列表按 (timestamp DESC, id DESC) 排序，下一页从游标之后继续，代价与翻到第几页无关。
+
+def encode_cursor(timestamp: datetime, history_id: int) -> str:
+    """将 (timestamp, id) 编码为 URL 安全的游标字符串"""
+    raw = f"{timestamp.isoformat()}|{history_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        timestamp, history_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(history_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
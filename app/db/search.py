@@ -0,0 +1,294 @@
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from config import config
+from app.models.models import ClipboardContent
+from app.db.filters import HistoryFilter, NO_FILTER
+
+# 全文检索（SQLite FTS5）
+# clipboard_fts 是 clipboardhistory 的外部内容索引（external content），本身不重复存储文本，
+# 由触发器在插入/删除/更新时同步，查询时按 bm25 排序并在数据库端分页。
+#
+# 大文本压缩存入 clipboard_content 后，clipboardhistory.clipboard 只保留前缀（见 app/db/content.py）。
+# TEXT_SEARCH_FULL 开启时另建 clipboard_content_fts，按 clipboard_content.id 索引解压后的完整文本：
+# 写入压缩内容时由 index_contents 传入原文建立索引，压缩内容被删除时由触发器删除索引。
+# SQLite 3.43+ 为 contentless 索引（contentless_delete=1），不重复保存文本；
+# 更早的版本不支持按 rowid 删除 contentless 索引，改为普通 FTS5 表（索引表中另存一份未压缩文本）。
+# 检索时两个索引的结果合并：每个检索词命中记录本身的列或完整文本即可，只在完整文本中命中的排在后面。
+
+FTS_TABLE = "clipboard_fts"
+CONTENT_FTS_TABLE = "clipboard_content_fts"
+CONTENT_TABLE = ClipboardContent.__tablename__
+
+# 分词器，依次尝试（与 clipboard_content_fts 使用同一种）
+TOKENIZERS = ("trigram", "unicode61 remove_diacritics 2")
+
+# 参与检索的列，名称必须与 clipboardhistory 中的列一致（external content 要求）
+FTS_COLUMNS = ["clipboard", "original_filename", "from_equipment", "tag", "timestamp"]
+
+# bm25 列权重（与 FTS_COLUMNS 顺序一致）：文件名命中比正文更相关，时间戳最弱
+BM25_WEIGHTS = [1.0, 2.0, 0.5, 1.0, 0.2]
+
+# trigram 分词器要求每个检索词至少 3 个字符
+TRIGRAM_MIN_TERM = 3
+
+_tokenizer_cache: Optional[str] = None
+_content_index: Optional[bool] = None  # 本进程中 clipboard_content_fts 是否存在（首次使用时查询）
+
+def _create_statements(tokenizer: str) -> List[str]:
+    cols = ", ".join(FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    return [
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"{cols}, content='clipboardhistory', content_rowid='id', tokenize='{tokenizer}')",
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON clipboardhistory BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON clipboardhistory BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {cols} ON clipboardhistory BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+    ]
+
+def ensure_search_index(engine) -> None:
+    """确保全文索引及同步触发器存在；首次创建时回填旧数据并重建索引"""
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+        ).first()
+        if exists:
+            return
+
+        # 旧数据的 original_filename 可能为空（文件名只在原始JSON中），先回填以便按文件名检索
+        conn.exec_driver_sql(
+            "UPDATE clipboardhistory SET original_filename = json_extract(raw_content, '$.File') "
+            "WHERE original_filename IS NULL AND type IN ('File', 'Image', 'Group') "
+            "AND json_valid(raw_content)"
+        )
+
+        # 优先使用 trigram 分词（支持中文及任意子串匹配），旧版 SQLite 回退到 unicode61 + 前缀匹配
+        for tokenizer in TOKENIZERS:
+            try:
+                statements = _create_statements(tokenizer)
+                conn.exec_driver_sql(statements[0])
+                break
+            except OperationalError:
+                continue
+        for statement in statements[1:]:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        print(f"已创建全文索引 {FTS_TABLE} (tokenize={tokenizer})")
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+    ).first() is not None
+
+def _content_index_statements(tokenizer: str, contentless: bool) -> List[str]:
+    options = ", content='', contentless_delete=1" if contentless else ""
+    return [
+        f"CREATE VIRTUAL TABLE {CONTENT_FTS_TABLE} USING fts5(clipboard{options}, tokenize='{tokenizer}')",
+        f"CREATE TRIGGER {CONTENT_FTS_TABLE}_ad AFTER DELETE ON {CONTENT_TABLE} BEGIN "
+        f"DELETE FROM {CONTENT_FTS_TABLE} WHERE rowid = old.id; END",
+    ]
+
+def ensure_content_index(engine, batch_size: int = 200) -> None:
+    """按 TEXT_SEARCH_FULL 创建或删除大文本全文索引；创建时为已有的压缩内容建立索引（需在 ensure_search_index 之后调用）"""
+    global _content_index
+    from app.db.content import iter_contents
+    with engine.begin() as conn:
+        exists = _table_exists(conn, CONTENT_FTS_TABLE)
+        if not config.TEXT_SEARCH_FULL:
+            if exists:
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {CONTENT_FTS_TABLE}_ad")
+                conn.exec_driver_sql(f"DROP TABLE {CONTENT_FTS_TABLE}")
+                print(f"已删除大文本全文索引 {CONTENT_FTS_TABLE}（TEXT_SEARCH_FULL 已关闭）")
+            _content_index = False
+            return
+        if not exists:
+            tokenizer = next(t for t in TOKENIZERS if t.startswith(_get_tokenizer(conn)))
+            try:
+                statements = _content_index_statements(tokenizer, contentless=True)
+                conn.exec_driver_sql(statements[0])
+                mode = "contentless"
+            except OperationalError:  # SQLite 3.43 之前不支持 contentless_delete
+                statements = _content_index_statements(tokenizer, contentless=False)
+                conn.exec_driver_sql(statements[0])
+                mode = "自带内容"
+            conn.exec_driver_sql(statements[1])
+            count = 0
+            for batch in iter_contents(conn, batch_size):
+                conn.exec_driver_sql(f"INSERT INTO {CONTENT_FTS_TABLE}(rowid, clipboard) VALUES (?, ?)", batch)
+                count += len(batch)
+            print(f"已创建大文本全文索引 {CONTENT_FTS_TABLE}（{mode}，已索引 {count} 条）")
+    _content_index = True
+
+def _has_content_index(conn) -> bool:
+    global _content_index
+    if _content_index is None:
+        _content_index = _table_exists(conn, CONTENT_FTS_TABLE)
+    return _content_index
+
+def index_contents(conn, blobs: list) -> None:
+    """
+    为写入 clipboard_content 的内容建立完整文本索引（在写入压缩内容的同一事务中调用），已有索引的内容跳过
+    :param blobs: pack_content 返回的压缩内容行（text 为完整文本）
+    """
+    if not blobs or not _has_content_index(conn):
+        return
+    texts = {blob["content_hash"]: blob["text"] for blob in blobs}
+    hashes = list(texts)
+    for i in range(0, len(hashes), 500):  # 分批，避免超出 SQLite 参数个数上限
+        chunk = hashes[i:i + 500]
+        rows = conn.exec_driver_sql(
+            f"SELECT c.id, c.content_hash FROM {CONTENT_TABLE} c "
+            f"WHERE c.content_hash IN ({', '.join('?' * len(chunk))}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {CONTENT_FTS_TABLE} f WHERE f.rowid = c.id)", tuple(chunk)
+        ).all()
+        if rows:
+            conn.exec_driver_sql(
+                f"INSERT INTO {CONTENT_FTS_TABLE}(rowid, clipboard) VALUES (?, ?)",
+                [(content_id, texts[content_hash]) for content_id, content_hash in rows]
+            )
+
+def _get_tokenizer(conn) -> str:
+    global _tokenizer_cache
+    if _tokenizer_cache is None:
+        row = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+        ).first()
+        _tokenizer_cache = "trigram" if row and "trigram" in row[0] else "unicode61"
+    return _tokenizer_cache
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _build_conditions(query: str, tokenizer: str, table: str = FTS_TABLE) -> Tuple[List[str], List[str], dict]:
+    """
+    将用户输入拆分为检索条件，多个词之间为 AND 关系。
+    :param table: LIKE 条件所针对的表（索引表或 clipboardhistory，两者的列内容相同）
+    :return: (MATCH 检索词列表, 额外的 LIKE 条件列表, 绑定参数)
+    """
+    terms = [t for t in re.split(r"\s+", query.strip()) if t]
+    match_terms = []
+    like_conditions = []
+    params = {}
+    for i, term in enumerate(terms):
+        if tokenizer != "trigram":
+            match_terms.append(_quote(term) + "*")  # 前缀匹配
+        elif len(term) >= TRIGRAM_MIN_TERM:
+            match_terms.append(_quote(term))  # trigram 下即为子串匹配（包含前缀）
+        else:
+            # 过短的词 trigram 无法索引，退化为对索引列的 LIKE 扫描
+            key = f"like_{i}"
+            params[key] = "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+            like_conditions.append(
+                "(" + " OR ".join(f"{table}.{c} LIKE :{key} ESCAPE '\\'" for c in FTS_COLUMNS) + ")"
+            )
+    if match_terms:
+        params["match"] = " AND ".join(match_terms)
+    return match_terms, like_conditions, params
+
+def _filter_conditions(filters: HistoryFilter) -> Tuple[List[str], dict]:
+    """筛选条件对应的 clipboardhistory 列条件及绑定参数"""
+    conditions = []
+    params = {}
+    if filters.types:
+        names = [f"filter_type_{i}" for i in range(len(filters.types))]
+        params.update(zip(names, filters.types))
+        conditions.append("clipboardhistory.type IN (" + ", ".join(f":{n}" for n in names) + ")")
+    if filters.source is not None:
+        params["filter_source"] = filters.source
+        conditions.append("clipboardhistory.from_equipment = :filter_source")
+    if filters.tag is not None:
+        params["filter_tag"] = filters.tag
+        conditions.append("clipboardhistory.tag = :filter_tag")
+    return conditions, params
+
+def search_ids(conn, query: str, limit: int, offset: int,
+               filters: HistoryFilter = NO_FILTER) -> Tuple[List[int], int]:
+    """
+    执行全文检索，返回当前页的记录ID（已排序）以及命中总数
+    有 MATCH 条件时按 bm25 相关度排序，否则按时间倒序
+    :param filters: 类型/来源/标签筛选，与检索词为 AND 关系
+    """
+    tokenizer = _get_tokenizer(conn)
+    match_terms, like_conditions, params = _build_conditions(query, tokenizer)
+    match = params.get("match")
+    where = []
+    if match:
+        where.append(f"{FTS_TABLE} MATCH :match")
+    where.extend(like_conditions)
+    if not where:
+        return [], 0
+    filter_conditions, filter_params = _filter_conditions(filters)
+    where.extend(filter_conditions)
+    params.update(filter_params)
+    where_sql = " AND ".join(where)
+
+    # 无筛选时只计数索引表，有筛选时需要关联记录表
+    join_sql = f"JOIN clipboardhistory ON clipboardhistory.id = {FTS_TABLE}.rowid " if filter_conditions else ""
+    total = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE} {join_sql}WHERE {where_sql}"), params).scalar()
+
+    if match:
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        order_sql = f"bm25({FTS_TABLE}, {weights}), clipboardhistory.timestamp DESC"
+    else:
+        order_sql = "clipboardhistory.timestamp DESC"
+    rows = conn.execute(
+        text(
+            f"SELECT clipboardhistory.id FROM {FTS_TABLE} "
+            f"JOIN clipboardhistory ON clipboardhistory.id = {FTS_TABLE}.rowid "
+            f"WHERE {where_sql} ORDER BY {order_sql} LIMIT :limit OFFSET :offset"
+        ),
+        {**params, "limit": limit, "offset": offset},
+    ).all()
+    ids = [row[0] for row in rows]
+
+    # 大文本只在完整文本中命中的记录排在 clipboard_fts 的结果之后
+    if match and _has_content_index(conn):
+        content_ids, content_total = _search_contents(
+            conn, query, tokenizer, filters, limit - len(ids), max(0, offset - total)
+        )
+        ids.extend(content_ids)
+        total += content_total
+    return ids, total
+
+def _search_contents(conn, query: str, tokenizer: str, filters: HistoryFilter,
+                     limit: int, offset: int) -> Tuple[List[int], int]:
+    """
+    只在大文本的完整文本中命中的记录（整个检索式命中 clipboard_fts 的记录已由 search_ids 返回，这里排除）：
+    每个词命中完整文本或记录本身的列即可，按时间倒序
+    :return: (当前页的记录ID, 命中总数)，limit 为 0 时只计数
+    """
+    match_terms, like_conditions, params = _build_conditions(query, tokenizer, "clipboardhistory")
+    params["any_term"] = " OR ".join(match_terms)
+    where = [
+        f"c.id IN (SELECT rowid FROM {CONTENT_FTS_TABLE} WHERE {CONTENT_FTS_TABLE} MATCH :any_term)",
+        f"clipboardhistory.id NOT IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match)",
+    ]
+    if len(match_terms) > 1:
+        # 完整文本中没有的词须命中记录本身的列（OR 左侧成立时右侧的子查询不会执行）
+        for i, term in enumerate(match_terms):
+            params[f"term_{i}"] = term
+            where.append(
+                f"(c.id IN (SELECT rowid FROM {CONTENT_FTS_TABLE} WHERE {CONTENT_FTS_TABLE} MATCH :term_{i}) "
+                f"OR clipboardhistory.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :term_{i}))"
+            )
+    filter_conditions, filter_params = _filter_conditions(filters)
+    params.update(filter_params)
+    from_sql = (
+        f"FROM {CONTENT_TABLE} c JOIN clipboardhistory ON clipboardhistory.content_hash = c.content_hash "
+        f"WHERE " + " AND ".join(where + like_conditions + filter_conditions)
+    )
+    total = conn.execute(text(f"SELECT count(*) {from_sql}"), params).scalar()
+    if not limit or offset >= total:
+        return [], total
+    rows = conn.execute(
+        text(f"SELECT clipboardhistory.id {from_sql} ORDER BY clipboardhistory.timestamp DESC "
+             f"LIMIT :limit OFFSET :offset"),
+        {**params, "limit": limit, "offset": offset},
+    ).all()
+    return [row[0] for row in rows], total
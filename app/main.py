@@ -3,6 +3,7 @@ import time
 import signal
 import sys
 from app.services import history_service
+from app.services.event_bus import event_bus
 from app.db import database
 from config import config
 from app import create_app, socketio
@@ -17,6 +18,7 @@ def start_monitor():
 def start_web():
     """启动 Web 服务"""
     app = create_app()
+    event_bus.start(socketio)  # 监控线程与接口发布的事件由 Web 服务直接推送
     socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)  # 禁用重载器
 
 def start_monitor_backup_folder(): # 监控，避免文件夹过大
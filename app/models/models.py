@@ -1,8 +1,8 @@
-from sqlmodel import SQLModel, Field, Column, ForeignKey, UniqueConstraint
+from sqlmodel import SQLModel, Field, Column, ForeignKey, UniqueConstraint, Index
 from typing import Optional
 from datetime import datetime
 import uuid as uuid_lib
-from sqlalchemy import DateTime, Text
+from sqlalchemy import DateTime, Text, LargeBinary
 
 
 class BaseTable(SQLModel):
@@ -51,10 +51,55 @@ class ClipboardHistory(BaseTable, table=True):
         default=None,
         description="原始文件名（仅用于File和Image类型）"
     )
+    content_size: Optional[int] = Field(
+        default=None,
+        description="clipboard 内容的字节数（UTF-8），列表只返回预览时据此提示完整大小"
+    )
+    content_hash: Optional[str] = Field(
+        default=None,
+        description="clipboard 内容的MD5（大文本据此关联 clipboard_content）",
+        index=True  # 删除记录时判断压缩内容是否仍被引用
+    )
+
+    # (timestamp, id) 复合索引：支撑按时间倒序的游标分页，避免 OFFSET 扫描
+    # (type, timestamp, id) 复合索引：按类型筛选时同样按索引顺序分页，无需排序
+    __table_args__ = (
+        Index("ix_clipboardhistory_timestamp_id", "timestamp", "id"),
+        Index("ix_clipboardhistory_type_timestamp_id", "type", "timestamp", "id"),
+    )
 
-    class Config:
-        # 为时间戳字段创建索引，优化按时间筛选的性能
-        indexes = [("timestamp_index", "timestamp")]
+# 大文本压缩存储表（按内容MD5去重，clipboardhistory 中只保留前缀，见 app/db/content.py）
+class ClipboardContent(BaseTable, table=True):
+
+    __tablename__ = "clipboard_content"  # 显式指定表名
+    content_hash: str = Field(
+        unique=True,
+        index=True,
+        description="完整内容的MD5"
+    )
+    codec: str = Field(nullable=False, description="压缩算法: zlib/zstd")
+    size: int = Field(description="原始字节数（UTF-8）")
+    data: bytes = Field(
+        sa_column=Column(LargeBinary, nullable=False),
+        description="压缩后的内容"
+    )
+
+# zstd 共享字典表（大文本压缩使用，由监控进程训练，见 app/db/content.py）
+class ClipboardDictionary(BaseTable, table=True):
+
+    __tablename__ = "clipboard_dictionary"  # 显式指定表名
+    dict_id: int = Field(
+        unique=True,
+        index=True,
+        description="zstd 字典ID（写在压缩帧头中，解压时据此取字典）"
+    )
+    data: bytes = Field(
+        sa_column=Column(LargeBinary, nullable=False),
+        description="字典内容"
+    )
+    samples: int = Field(description="训练使用的内容条数")
+    last_content_id: int = Field(description="训练时最新的 clipboard_content.id，之后新增的内容达到阈值时重新训练")
+    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow, description="训练时间")
 
 # 备份文件表
 class BackupFile(BaseTable, table=True):
@@ -71,6 +116,25 @@ class BackupFile(BaseTable, table=True):
         description="备份文件绝对路径"
     )
     size: int = Field(description="文件大小(字节)")
+    last_used_at: Optional[datetime] = Field(
+        default_factory=datetime.utcnow,  # 创建或被新记录复用时更新
+        sa_column=Column(DateTime(timezone=True), index=True),  # 索引：容量超限时按最久未使用淘汰
+        description="最近一次被历史记录引用的时间"
+    )
+
+# 文件校验和缓存表（按路径记录，大小/修改时间/inode 均未变化时直接复用MD5，见 app/services/checksum.py）
+class FileChecksum(BaseTable, table=True):
+
+    __tablename__ = "file_checksums"  # 显式指定表名
+    path: str = Field(
+        unique=True,
+        index=True,
+        description="文件绝对路径"
+    )
+    size: int = Field(description="计算时的文件大小(字节)")
+    mtime_ns: int = Field(description="计算时的修改时间(纳秒)")
+    inode: int = Field(description="计算时的 inode（文件被替换时变化）")
+    checksum: str = Field(nullable=False, description="文件内容的MD5校验和")
 
 # 收藏记录表
 class Favorite(BaseTable, table=True):
@@ -109,3 +173,22 @@ class Folder(BaseTable, table=True):
         default=None,
         description="完整路径（如/a/b/）"
     )
+
+# 变更日志表（由 SQLite 触发器在历史记录增删时写入，见 app/db/changes.py）
+class ChangeLog(BaseTable, table=True):
+
+    __tablename__ = "change_log"  # 显式指定表名
+    op: str = Field(nullable=False, description="变更类型: insert/delete")
+    history_id: int = Field(
+        index=True,  # 推送时按记录ID查找对应的变更版本
+        description="历史记录ID"
+    )
+    history_uuid: str = Field(nullable=False, description="历史记录UUID")
+    created_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True)),
+        description="变更时间（用于清理过期日志）"
+    )
+
+    # AUTOINCREMENT：id 即变更版本号，清理旧日志后也不会被复用
+    __table_args__ = {"sqlite_autoincrement": True}
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import signal
+import subprocess
+import threading
+from typing import List, Optional
+from config import config
+
+# 生产部署：一个主进程 + 多个 Web 工作进程（入口为项目根目录的 serve.py）
+# 主进程：建表/迁移、监控 SyncClipboard.json（整个部署中只有这一个监控）、清理备份，
+#         运行本机消息转发器（使用 unix:// 消息队列时），并在工作进程退出后重新拉起。
+# 工作进程：eventlet（已 monkey_patch）运行 Flask-SocketIO，各自监听 port、port+1……，
+#          由前置 nginx 按客户端 IP 分发（Socket.IO 长轮询要求同一客户端始终落在同一进程）。
+# 事件推送：所有进程通过消息队列（SOCKETIO_MESSAGE_QUEUE）互相转发，任一进程写入的记录都会推送给全部浏览器；
+# 各进程的内存缓存按 change_log 版本号对齐（见 InMemoryCache.sync_change_version）。
+
+RESTART_DELAY = 1.0  # 工作进程退出后重新拉起前的等待时间（秒）
+
+def default_message_queue() -> str:
+    """未配置消息队列时，使用主进程转发的 UNIX 套接字（与数据库放在同一目录）"""
+    return "unix://" + os.path.join(os.path.dirname(config.DB_PATH), "socketio.sock")
+
+def create_worker_app(message_queue: Optional[str] = None):
+    """
+    创建 Web 工作进程的应用（也可直接交给 gunicorn：gunicorn -k eventlet -w 1 "app.server:create_worker_app()"）
+    :param message_queue: 消息队列地址，默认使用配置 SOCKETIO_MESSAGE_QUEUE
+    """
+    if message_queue is not None:
+        config.SOCKETIO_MESSAGE_QUEUE = message_queue
+    from app import create_app, socketio
+    from app.db import database
+    from app.services.event_bus import event_bus
+    database.init_db()
+    app = create_app()
+    event_bus.start(socketio)  # 本进程接口产生的事件经消息队列推送给所有工作进程的客户端
+    return app
+
+def run_worker(host: str, port: int, message_queue: Optional[str] = None) -> None:
+    """运行一个 Web 工作进程（调用前应已执行 eventlet.monkey_patch()）"""
+    from app import socketio
+    app = create_worker_app(message_queue)
+    print(f"Web 工作进程 {os.getpid()} 监听 {host}:{port}")
+    socketio.run(app, host=host, port=port, debug=False, use_reloader=False, log_output=False)
+
+def start_monitor(message_queue: str):
+    """
+    在当前进程启动监控线程：同步文件监控、备份清理，事件经消息队列发布
+    :return: 使用 unix:// 消息队列时运行的 LocalBroker，否则为 None
+    """
+    from app.db import database
+    from app.main import start_monitor as run_watcher, start_monitor_backup_folder
+    from app.services.event_bus import event_bus
+    from app.services.message_queue import LocalBroker, create_client_manager
+
+    database.init_db()  # 在拉起工作进程之前完成建表/迁移，工作进程中的 init_db 只检查到已是最新结构，不重复迁移
+    broker = None
+    if message_queue.startswith("unix://"):
+        broker = LocalBroker(message_queue[len("unix://"):])
+        broker.start()
+    event_bus.start_publisher(create_client_manager(message_queue, write_only=True))
+
+    threading.Thread(target=run_watcher, name="MonitorThread", daemon=True).start()
+    threading.Thread(target=start_monitor_backup_folder, name="MonitorBackupFolder", daemon=True).start()
+    return broker
+
+class Supervisor:
+    """启动并看护 Web 工作进程"""
+
+    def __init__(self, workers: int, host: str, port: int, message_queue: str):
+        self.host = host
+        self.ports = [port + i for i in range(workers)]
+        self.message_queue = message_queue
+        self.processes: List[Optional[subprocess.Popen]] = [None] * workers
+        self.stopping = False
+
+    def _spawn(self, index: int) -> None:
+        command = [sys.executable, os.path.join(config.BASE_DIR, "serve.py"), "worker",
+                   "--host", self.host, "--port", str(self.ports[index]), "--message-queue", self.message_queue]
+        self.processes[index] = subprocess.Popen(command, cwd=config.BASE_DIR)
+
+    def start(self) -> None:
+        for index in range(len(self.processes)):
+            self._spawn(index)
+
+    def watch(self) -> None:
+        """阻塞运行：工作进程异常退出时重新拉起，直到 stop()"""
+        while not self.stopping:
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None and not self.stopping:
+                    print(f"工作进程（端口 {self.ports[index]}）已退出，返回码 {process.returncode}，重新启动")
+                    time.sleep(RESTART_DELAY)
+                    self._spawn(index)
+            time.sleep(1)
+
+    def stop(self, timeout: float = 10) -> None:
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.time() + timeout
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def run_supervisor(workers: int, host: str, port: int, message_queue: Optional[str] = None) -> None:
+    message_queue = message_queue or config.SOCKETIO_MESSAGE_QUEUE or default_message_queue()
+    broker = start_monitor(message_queue)
+    supervisor = Supervisor(workers, host, port, message_queue)
+
+    def shutdown(sig, frame):
+        print("\n接收到退出信号，正在停止工作进程...")
+        supervisor.stop()
+        if broker is not None:
+            broker.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    supervisor.start()
+    print(f"已启动 {workers} 个 Web 工作进程，端口 {supervisor.ports[0]}-{supervisor.ports[-1]}，"
+          f"消息队列 {message_queue}，按 Ctrl+C 退出")
+    supervisor.watch()
+
+def run_monitor(message_queue: Optional[str] = None) -> None:
+    """只运行监控进程（Web 工作进程由 gunicorn/systemd 等外部管理时使用）"""
+    message_queue = message_queue or config.SOCKETIO_MESSAGE_QUEUE or default_message_queue()
+    broker = start_monitor(message_queue)
+    print(f"监控进程已启动，消息队列 {message_queue}，按 Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        if broker is not None:
+            broker.stop()
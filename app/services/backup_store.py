@@ -0,0 +1,327 @@
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import BinaryIO, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, func, delete
+from config import config
+from app.models.models import BackupFile
+from app.db.cache import cache
+from app.db.engine import get_read_engine
+from app.services.offload import blocking_pool
+from app.services.checksum import file_checksum, remember
+from app.services.event_bus import event_bus
+
+# 备份文件存储（按内容寻址）
+# 备份文件按 checksum 存放：BACKUP_DIR/<checksum前2位>/<checksum>，原始文件名只保存在数据库中，
+# 相同内容只存一份，不存在同名冲突，也不需要重新计算已有文件的哈希。
+# 上传内容分块写入备份目录下的临时文件并同时计算MD5，内存占用与文件大小无关；
+# 写完后若该 checksum 已有备份则丢弃临时文件复用旧文件，否则原子重命名到最终位置。
+# 监控目录中的文件默认使用 reflink，不支持时普通复制；配置为硬链接时，下载/导出前重新校验MD5
+# （源文件被客户端原地改写时，硬链接的备份内容随之改变，与 checksum 不再一致）。
+# 复制在打开写会话之前完成（store_file），之后在写入记录的事务中登记（register_backup），不长时间占用写连接。
+# 容量控制基于 BackupFile 表（size 列 + last_used_at 索引），无需遍历备份目录。
+# 写入临时文件/计算MD5、链接或复制文件在线程池中执行（在 Web 请求的协程中调用时），不阻塞事件循环。
+# 删除备份（容量淘汰、硬链接校验失败）后发布 backups_removed 事件，多进程部署时各工作进程据此清除路径缓存
+# （淘汰由监控进程执行，不经过 change_log，工作进程无法通过版本号得知）。
+
+TMP_DIR_NAME = ".tmp"
+BACKUPS_REMOVED_EVENT = "backups_removed"
+FICLONE = 0x40049409  # Linux ioctl：reflink（写时复制克隆），Btrfs/XFS 等文件系统支持
+
+def _tmp_dir() -> str:
+    # 临时目录放在备份目录内，保证与最终位置在同一文件系统，os.replace 为原子操作
+    path = os.path.join(config.BACKUP_DIR, TMP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def cas_path(checksum: str) -> str:
+    """checksum 对应的备份文件路径"""
+    return os.path.join(config.BACKUP_DIR, checksum[:2], checksum)
+
+def _reflink(src_path: str, dst_path: str) -> None:
+    import fcntl  # 仅 Unix 可用
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(src_path, dst_path)
+
+def hardlink_enabled() -> bool:
+    return config.BACKUP_LINK_MODE in ("hardlink", "auto")
+
+def link_or_copy(src_path: str, dst_path: str) -> str:
+    """
+    将 src_path 放入 dst_path，按 BACKUP_LINK_MODE 依次尝试 硬链接（仅 "hardlink"）-> reflink -> 复制
+    :return: 实际使用的方式 "hardlink" / "reflink" / "copy"
+    """
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    mode = config.BACKUP_LINK_MODE
+    if hardlink_enabled():
+        try:
+            os.link(src_path, dst_path)
+            return "hardlink"
+        except FileExistsError:
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+                raise
+
+    # reflink/复制先写临时文件再原子替换，避免留下不完整的备份
+    fd, tmp_path = tempfile.mkstemp(dir=_tmp_dir(), prefix="copy-")
+    os.close(fd)
+    try:
+        method = "copy"
+        if mode != "copy":
+            try:
+                _reflink(src_path, tmp_path)
+                method = "reflink"
+            except (OSError, ImportError):
+                pass
+        if method == "copy":
+            shutil.copy2(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        return method
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class BackupUsage:
+    """备份存储总字节数：首次使用时由 SUM(size) 得出，之后随写入/删除增量维护"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total: Optional[int] = None
+
+    def refresh(self, engine) -> int:
+        """从数据库重新统计（多进程写入时由监控线程定期校准）"""
+        with Session(engine) as session:
+            total = session.exec(select(func.coalesce(func.sum(BackupFile.size), 0))).one()
+        with self.lock:
+            self.total = total
+        return total
+
+    def add(self, delta: int) -> None:
+        with self.lock:
+            if self.total is not None:
+                self.total += delta
+
+    def get(self, engine) -> int:
+        with self.lock:
+            total = self.total
+        return total if total is not None else self.refresh(engine)
+
+backup_usage = BackupUsage()
+
+def store_file(src_path: str, checksum: str) -> str:
+    """
+    将已知 checksum 的文件放入备份存储（在打开写会话之前调用），已有可用备份时不读取文件内容
+    :return: 备份文件路径，之后在写入记录的事务中调用 register_backup 登记
+    """
+    with Session(get_read_engine()) as session:
+        existing = session.exec(select(BackupFile.filepath).where(BackupFile.checksum == checksum)).first()
+    if existing and os.path.exists(existing):
+        return existing
+    backup_path = cas_path(checksum)
+    if not os.path.exists(backup_path):
+        blocking_pool.run_io(link_or_copy, src_path, backup_path)
+    return backup_path
+
+def register_backup(session: Session, checksum: str, backup_path: str) -> Tuple[Optional[BackupFile], int]:
+    """
+    登记 store_file 放入的备份文件（由调用方提交 session），已有记录时只更新最近使用时间
+    :return: (BackupFile, 新增占用的字节数)，提交成功后调用方应计入 backup_usage；
+             备份文件在此之前已被删除时为 (None, 0)，记录照常写入但不关联备份
+    """
+    existing = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
+    if existing and os.path.exists(existing.filepath):
+        existing.last_used_at = datetime.utcnow()
+        session.add(existing)
+        return existing, 0
+
+    try:
+        size = os.path.getsize(backup_path)
+    except OSError as e:
+        # store_file 之后、登记之前被 evict_backups 淘汰：不在写事务中重新复制，跳过登记
+        print(f"备份文件 {backup_path} 在登记前已被删除，跳过登记: {e}")
+        return None, 0
+    added = size
+    if existing:
+        # 记录存在但文件已丢失，用新文件修复记录
+        added -= existing.size
+        existing.filepath = backup_path
+        existing.size = size
+        existing.last_used_at = datetime.utcnow()
+    else:
+        existing = BackupFile(checksum=checksum, filepath=backup_path, size=size)
+    session.add(existing)
+    return existing, added
+
+def write_stream_to_temp(stream: BinaryIO) -> Tuple[str, str, int]:
+    """
+    将流分块写入临时文件，边写边计算MD5
+    :return: (临时文件路径, checksum, 字节数)
+    """
+    md5 = hashlib.md5()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=_tmp_dir(), prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = stream.read(config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, md5.hexdigest(), size
+
+def store_stream(stream: BinaryIO, filename: str, engine) -> Tuple[str, str, int]:
+    """
+    流式保存上传文件并登记 BackupFile（相同内容只保留一份）
+    :param filename: 原始文件名（只记录在历史记录中，不影响存储路径）
+    :return: (checksum, 备份文件路径, 字节数)
+    """
+    tmp_path, checksum, size = blocking_pool.run_io(write_stream_to_temp, stream)
+    try:
+        backup_path, size, added = blocking_pool.run_write(_register_upload, engine, tmp_path, checksum, size)
+        backup_usage.add(added)
+        return checksum, backup_path, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _register_upload(engine, tmp_path: str, checksum: str, size: int) -> Tuple[str, int, int]:
+    """
+    将上传的临时文件移入备份存储并登记 BackupFile（只访问数据库与文件，可在专用写线程中执行）
+    :return: (备份文件路径, 字节数, 新增占用的字节数)
+    """
+    with Session(engine) as session:
+        existing = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
+        if existing and os.path.exists(existing.filepath):
+            existing.last_used_at = datetime.utcnow()
+            session.add(existing)
+            session.commit()
+            return existing.filepath, existing.size, 0
+
+        backup_path = cas_path(checksum)
+        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+        os.replace(tmp_path, backup_path)
+        added = size
+        if existing:
+            # 记录存在但文件已丢失，用新文件修复记录
+            added -= existing.size
+            existing.filepath = backup_path
+            existing.size = size
+            existing.last_used_at = datetime.utcnow()
+            session.add(existing)
+        else:
+            session.add(BackupFile(checksum=checksum, filepath=backup_path, size=size))
+        try:
+            session.commit()
+        except IntegrityError:
+            # 并发上传了相同内容，以先提交的记录为准
+            session.rollback()
+            existing = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).one()
+            return existing.filepath, existing.size, 0
+        return backup_path, size, added
+
+def verify_backup(engine, checksum: str, path: str) -> bool:
+    """
+    硬链接模式下确认备份内容仍与 checksum 一致（文件未变化时使用校验和缓存，不重新读取）
+    不一致时删除该备份及其 BackupFile 记录（历史记录保留，下载时提示文件已被清理），返回 False
+    """
+    if not hardlink_enabled():
+        return True
+    try:
+        actual, entry = file_checksum(path)
+    except FileNotFoundError:
+        return False
+    if actual == checksum:
+        if entry:
+            with engine.begin() as conn:
+                remember(conn, [entry])
+        return True
+    print(f"备份文件 {path} 的内容已被改写（源文件被原地修改），与 {checksum} 不一致，删除该备份")
+    try:
+        os.remove(path)  # 只删除备份目录中的链接，不影响源文件
+    except FileNotFoundError:
+        pass
+    with Session(engine) as session:
+        backup = session.exec(select(BackupFile).where(BackupFile.checksum == checksum)).first()
+        if backup is not None:
+            session.delete(backup)
+            session.commit()
+            backup_usage.add(-backup.size)
+    _backups_removed([checksum])
+    return False
+
+def _backups_removed(checksums: List[str]) -> None:
+    """清除本进程的路径缓存，并通知其他进程（经事件总线与消息队列）"""
+    invalidate_removed({"checksums": checksums})
+    event_bus.publish(BACKUPS_REMOVED_EVENT, {"checksums": checksums})
+
+def invalidate_removed(data: dict) -> None:
+    """处理 backups_removed 事件：清除已删除备份的路径缓存"""
+    for checksum in data.get("checksums", []):
+        cache.invalidate_file_path(checksum)
+
+def evict_backups(engine, max_size: int) -> Tuple[int, int]:
+    """
+    备份总大小超过 max_size 时，按最久未使用一次性淘汰足够多的备份文件
+    同时删除 BackupFile 记录与 file_paths 缓存（历史记录保留，下载时提示文件已被清理）
+    :return: (删除的文件数, 释放的字节数)
+    """
+    if backup_usage.get(engine) <= max_size:
+        return 0, 0
+    # 计数器显示超限时再从数据库校准一次，避免其他进程的写入/删除造成误判
+    excess = backup_usage.refresh(engine) - max_size
+    if excess <= 0:
+        return 0, 0
+
+    # 沿 last_used_at 索引顺序读取，累计到足够释放的大小为止
+    victims = []
+    freed = 0
+    with Session(engine) as session:
+        query = select(BackupFile.id, BackupFile.checksum, BackupFile.filepath, BackupFile.size) \
+            .order_by(BackupFile.last_used_at.asc(), BackupFile.id.asc())
+        for row in session.exec(query.execution_options(yield_per=500)):
+            victims.append(row)
+            freed += row.size
+            if freed >= excess:
+                break
+
+        for row in victims:
+            try:
+                os.remove(row.filepath)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除备份文件 {row.filepath} 失败: {e}")
+
+        ids = [row.id for row in victims]
+        for i in range(0, len(ids), 500):  # 分批，避免超出 SQLite 参数个数上限
+            session.exec(delete(BackupFile).where(BackupFile.id.in_(ids[i:i + 500])))
+        session.commit()
+
+    _backups_removed([row.checksum for row in victims])
+    backup_usage.add(-freed)
+    return len(victims), freed
+
+def cleanup_temp_files(max_age: float = 24 * 3600) -> None:
+    """清理中断的上传/复制遗留的临时文件"""
+    tmp_dir = _tmp_dir()
+    now = time.time()
+    for name in os.listdir(tmp_dir):
+        path = os.path.join(tmp_dir, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
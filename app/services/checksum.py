@@ -0,0 +1,96 @@
+import os
+import mmap
+import hashlib
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import insert, select
+from config import config
+from app.models.models import FileChecksum
+from app.db.engine import get_read_engine
+from app.services.offload import blocking_pool
+
+# 文件MD5计算与校验和缓存
+# 按 UPLOAD_CHUNK_SIZE 分块读取（或 CHECKSUM_USE_MMAP 时通过 mmap 分段），内存占用与文件大小无关。
+# 计算结果按路径记录在 file_checksums 表中，连同当时的大小、修改时间(ns)与 inode；
+# 再次计算同一路径时三者均未变化则直接返回记录的MD5，不读取文件（重启后同样有效）。
+# 计算前后文件状态不一致（计算期间被写入）时不记录。
+# 查询走只读引擎；计算在打开写事务之前完成，新结果由调用方随记录在同一个短事务中写入（remember），
+# 读取大文件期间不占用写连接，也不持有 SQLite 写锁。
+
+def md5_file(path: str, use_mmap: Optional[bool] = None) -> str:
+    """分块计算文件MD5"""
+    if use_mmap is None:
+        use_mmap = config.CHECKSUM_USE_MMAP
+    md5 = hashlib.md5()
+    chunk_size = config.UPLOAD_CHUNK_SIZE
+    with open(path, "rb") as f:
+        if use_mmap and os.fstat(f.fileno()).st_size > 0:  # 空文件不能 mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), chunk_size):
+                        md5.update(view[offset:offset + chunk_size])
+                finally:
+                    view.release()
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+def _signature(st: os.stat_result) -> Tuple[int, int, int]:
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+def lookup(path: str, st: os.stat_result) -> Optional[str]:
+    """返回已记录且文件未变化的MD5，没有记录或文件已变化时返回 None"""
+    if not config.CHECKSUM_CACHE_ENABLED:
+        return None
+    with get_read_engine().connect() as conn:
+        row = conn.execute(
+            select(FileChecksum.size, FileChecksum.mtime_ns, FileChecksum.inode, FileChecksum.checksum)
+            .where(FileChecksum.path == path)
+        ).first()
+    if row is None or (row.size, row.mtime_ns, row.inode) != _signature(st):
+        return None
+    return row.checksum
+
+def _entry(path: str, st: os.stat_result, checksum: str) -> Optional[dict]:
+    """计算完成后确认文件未被修改，返回待写入的缓存行"""
+    if not config.CHECKSUM_CACHE_ENABLED:
+        return None
+    try:
+        if _signature(os.stat(path)) != _signature(st):
+            return None
+    except OSError:
+        return None
+    size, mtime_ns, inode = _signature(st)
+    return {"path": path, "size": size, "mtime_ns": mtime_ns, "inode": inode, "checksum": checksum}
+
+def remember(conn, entries: Iterable[Optional[dict]]) -> None:
+    """在调用方的事务中写入/更新缓存行（同一路径覆盖旧记录），conn 可以是 Connection 或 Session"""
+    rows = [entry for entry in entries if entry]
+    if rows:
+        conn.execute(insert(FileChecksum.__table__).prefix_with("OR REPLACE"), rows)
+
+def file_checksum(path: str) -> Tuple[str, Optional[dict]]:
+    """
+    计算文件MD5，命中缓存时不读取文件；在 Web 请求的协程中调用时在线程池中计算
+    应在打开写事务之前调用，返回的缓存行由调用方在写入记录的事务中 remember
+    :return: (checksum, 需要 remember 的缓存行，命中缓存或文件在计算期间变化时为 None)
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    checksum = lookup(path, st)
+    if checksum is not None:
+        return checksum, None
+    checksum = blocking_pool.run_io(md5_file, path)
+    return checksum, _entry(path, st, checksum)
+
+def prune_checksums(engine, batch_size: int = 500) -> int:
+    """删除文件已不存在的缓存行，返回删除的行数"""
+    with get_read_engine().connect() as conn:
+        rows = conn.execute(select(FileChecksum.id, FileChecksum.path)).all()
+    missing = [row.id for row in rows if not os.path.exists(row.path)]
+    if missing:
+        with engine.begin() as conn:
+            for i in range(0, len(missing), batch_size):  # 分批，避免超出 SQLite 参数个数上限
+                conn.execute(FileChecksum.__table__.delete().where(FileChecksum.id.in_(missing[i:i + batch_size])))
+    return len(missing)
@@ -0,0 +1,118 @@
+import time
+import queue
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+from config import config
+
+# 进程内事件总线
+# 监控线程、Web 请求等任意线程调用 publish() 发布事件（线程安全的队列，不阻塞调用方），
+# 由 Web 服务内的分发协程阻塞等待队列并转发给订阅者（通常是 socketio.emit，直接推送给所有浏览器）。
+# 分发时会把短时间内的一批事件合并：无数据的同名事件只推送一次。
+# 历史记录的增删以 history_delta 事件推送（带 change_log 中的版本号），浏览器据此增量更新列表，
+# 发现版本号不连续（丢失事件）时通过 /api/changes 补齐。
+# 多进程部署时，监控进程没有 Web 服务，由 start_publisher() 在普通线程中分发，经消息队列发给各 Web 工作进程。
+
+Handler = Callable[[str, Any], None]
+
+class EventBus:
+    def __init__(self, max_pending: int = 10000, coalesce_window: float = 0.05):
+        self.queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=max_pending)
+        self.coalesce_window = coalesce_window  # 收到第一个事件后再等待的时间（秒），用于合并突发事件
+        self.handlers: List[Handler] = []
+        self.lock = threading.Lock()
+        self.started = False
+        self.dropped = 0
+        self._socketio = None
+        self._sleep: Callable[[float], None] = time.sleep
+
+    def subscribe(self, handler: Handler) -> None:
+        with self.lock:
+            self.handlers.append(handler)
+
+    def publish(self, event: str, data: Any = None) -> None:
+        """发布事件；尚未启动分发（没有订阅者）时直接丢弃"""
+        if not self.started:
+            return
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def publish_history_delta(self, op: str, version: Optional[int], **payload) -> None:
+        """
+        发布一条历史记录变更
+        :param op: "insert"（payload 为 record）或 "delete"（payload 为 id、uuid）
+        :param version: 该变更在 change_log 中的版本号
+        """
+        self.publish("history_delta", {"version": version, "op": op, **payload})
+
+    def start(self, socketio) -> None:
+        """在 Socket.IO 服务中启动分发协程，并将事件直接推送给所有已连接的客户端"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self._socketio = socketio
+            self._sleep = socketio.sleep
+        self.subscribe(lambda event, data: socketio.emit(event, data) if data is not None else socketio.emit(event))
+        socketio.start_background_task(self._dispatch_loop)
+
+    def start_publisher(self, client_manager) -> None:
+        """
+        在没有 Web 服务的进程中启动分发线程，事件经消息队列转发给各 Web 工作进程的客户端
+        :param client_manager: 只写的 Socket.IO 客户端管理器（见 message_queue.create_client_manager）
+        """
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        self.subscribe(lambda event, data: client_manager.emit(event, data, namespace="/"))
+        threading.Thread(target=self._dispatch_loop, name="EventPublisher", daemon=True).start()
+
+    def _wait(self, timeout: float) -> Optional[Tuple[str, Any]]:
+        """阻塞等待下一个事件；eventlet 未打补丁时在线程池中等待，不阻塞事件循环"""
+        try:
+            if self._socketio is not None and self._socketio.async_mode == "eventlet":
+                from eventlet import patcher, tpool
+                if not patcher.is_monkey_patched("thread"):  # 打补丁后（serve.py 工作进程）队列本身即可协作等待
+                    return tpool.execute(self.queue.get, True, timeout)
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _drain(self) -> List[Tuple[str, Any]]:
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    @staticmethod
+    def coalesce(batch: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        """合并一批事件：无数据的同名事件只保留第一个，其余事件按原顺序保留"""
+        seen = set()
+        result = []
+        for event, data in batch:
+            if data is None:
+                if event in seen:
+                    continue
+                seen.add(event)
+            result.append((event, data))
+        return result
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            first = self._wait(timeout=5.0)
+            if first is None:
+                continue
+            if self.coalesce_window:
+                self._sleep(self.coalesce_window)
+            for event, data in self.coalesce([first] + self._drain()):
+                for handler in list(self.handlers):
+                    try:
+                        handler(event, data)
+                    except Exception as e:
+                        print(f"推送事件 {event} 失败: {e}")
+
+event_bus = EventBus(config.EVENT_BUS_MAX_PENDING, config.EVENT_BUS_COALESCE_WINDOW)
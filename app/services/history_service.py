@@ -1,6 +1,6 @@
 import time
 import json
-import socketio
+import hashlib
 import threading
 import os
 import re
@@ -8,99 +8,149 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from config import config
 from app.db.database import add_history_item_from_json
+from app.db.engine import get_write_engine
+from app.db.changes import prune_change_log
+from app.db.content import maintain_dictionary
+from app.services.thumbnail_service import evict_thumbnails
+from app.services.backup_store import evict_backups, cleanup_temp_files, backup_usage
+from app.services.checksum import prune_checksums
+from app.services import metrics
 
 # 主线程：通过watchdog监控文件变化（同步阻塞）
-# 子线程：专门处理通知队列（异步非阻塞）
-
-SOCKETIO_SERVER = 'http://localhost:5000'
+# 文件事件先经过防抖（一次保存常产生多个事件），再用 (大小, mtime_ns, MD5) 指纹判断内容是否真的变化，
+# 内容未变化时不解析JSON；读到写了一半的文件时稍后重试。
+# 最后一次入库的指纹持久化到文件，重启后不会把当前剪贴板重复写入一条记录。
+# 新记录写入后由 on_history_inserted 发布到进程内事件总线，Web 服务推送给浏览器（见 event_bus.py）
+# 多进程部署（serve.py）时只在主进程运行，事件经消息队列转发给各 Web 工作进程
 
 class JSONChangeHandler(FileSystemEventHandler):
     def __init__(self):
-        self.last_content = self.get_current_content()
-        self.sio = socketio.Client(reconnection=True, reconnection_attempts=5, reconnection_delay=1)
-        self.connected = False
-        self.notification_queue = []  # 通知队列
-        self.notification_thread = None
-        self.stop_notification = threading.Event()
-
-        # 启动后台通知线程
-        self.start_notification_thread()
-
-    def start_notification_thread(self):
-        """启动后台通知线程"""
-        if self.notification_thread and self.notification_thread.is_alive():
-            return
+        self.json_path = os.path.abspath(config.SYNC_CLIPBOARD_JSON_PATH)
+        self.lock = threading.Lock()
+        self.process_lock = threading.Lock()
+        self.timer = None
+        self.retries = 0
+        self.fingerprint = self.load_fingerprint()
+        if self.fingerprint is None:
+            # 首次运行：当前内容视为已入库（与旧版本启动时的行为一致）
+            self.fingerprint = self.get_current_fingerprint()
+            self.save_fingerprint()
+
+    def get_current_fingerprint(self):
+        """返回 {"size", "mtime_ns", "md5"}，文件不存在时返回空指纹"""
+        try:
+            st = os.stat(self.json_path)
+            with open(self.json_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return {"size": None, "mtime_ns": None, "md5": None}
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "md5": hashlib.md5(data).hexdigest()}
+
+    def load_fingerprint(self):
+        try:
+            with open(config.INGEST_STATE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
 
-        self.notification_thread = threading.Thread(
-            target=self.process_notification_queue,
-            daemon=True
-        )
-        self.notification_thread.start()
-
-    def process_notification_queue(self):
-        """在独立的线程中处理通知：处理通知队列的后台线程"""
-        while not self.stop_notification.is_set():
-            if self.notification_queue:
-                event_type = self.notification_queue.pop(0)
-                self._send_notification(event_type)
-            time.sleep(0.1)  # 避免CPU空转
-
-    def _send_notification(self, event_type):
-        """实际发送通知的方法"""
+    def save_fingerprint(self):
+        """原子写入，避免中途退出留下损坏的状态文件"""
         try:
-            if not self.connected:
-                # 尝试连接（带超时）
-                self.sio.connect(SOCKETIO_SERVER, wait_timeout=5) # 连接Socket.IO服务器
-                self.connected = True
-                print("Socket.IO 连接成功")
-
-            if self.connected:
-                self.sio.emit(event_type) # ⭐发送通知⭐
-                print(f"已发送 {event_type} 通知")
-        except Exception as e:
+            os.makedirs(os.path.dirname(config.INGEST_STATE_PATH), exist_ok=True)
+            tmp_path = config.INGEST_STATE_PATH + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.fingerprint, f)
+            os.replace(tmp_path, config.INGEST_STATE_PATH)
+        except OSError as e:
+            print(f"保存同步状态失败: {e}")
+
+    def schedule(self, delay=None):
+        """（重新）开始防抖计时，窗口内的多次事件只处理一次"""
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(config.INGEST_DEBOUNCE if delay is None else delay, self.process)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def is_target(self, path):
+        return bool(path) and os.path.abspath(path) == self.json_path
 
-            # print(f"发送通知失败: {e}")
+    def on_modified(self, event): # 处理文件修改事件
+        if self.is_target(event.src_path): # 仅处理特定文件
+            self.schedule()
 
-            self.connected = False
-            # 短暂延迟后重试连接
-            time.sleep(1)
+    def on_created(self, event):
+        if self.is_target(event.src_path):
+            self.schedule()
 
-    def get_current_content(self):
-        try:
-            with open(config.SYNC_CLIPBOARD_JSON_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"读取JSON文件错误: {e}")
-            return {}
+    def on_moved(self, event): # 先写临时文件再重命名覆盖的保存方式
+        if self.is_target(getattr(event, 'dest_path', None)):
+            self.schedule()
 
-    def on_modified(self, event): # 处理文件修改事件
-        if event.src_path.endswith("SyncClipboard.json"): # 仅处理特定文件
-            try:
-                current_content = self.get_current_content()
-                if current_content != self.last_content:
-                    self.last_content = current_content
+    def process(self):
+        with self.process_lock:  # 防抖计时器在各自的线程中触发，入库需要串行
+            self._process()
 
-                    new_id = add_history_item_from_json(current_content)  # 将JSON内容添加到历史记录
-                    print("已更新历史记录", new_id)
+    def _process(self):
+        try:
+            st = os.stat(self.json_path)
+        except OSError:
+            return
+        # 大小和修改时间都没变，无需读取文件
+        if st.st_size == self.fingerprint.get("size") and st.st_mtime_ns == self.fingerprint.get("mtime_ns"):
+            return
 
-                    # 将通知加入队列（非阻塞）
-                    self.notification_queue.append('history_update')
+        try:
+            with open(self.json_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"读取JSON文件错误: {e}")
+            return
+        fingerprint = {"size": len(data), "mtime_ns": st.st_mtime_ns, "md5": hashlib.md5(data).hexdigest()}
+        if fingerprint["md5"] == self.fingerprint.get("md5"):
+            # 仅被 touch 或重写了相同内容
+            self.fingerprint = fingerprint
+            self.save_fingerprint()
+            metrics.record_ingest("unchanged")
+            return
 
-            except Exception as e:
-                print(f"处理JSON变更错误: {e}")
+        try:
+            current_content = json.loads(data.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as e:
+            # 文件可能还没写完，稍后重试
+            if self.retries < config.INGEST_MAX_RETRIES:
+                self.retries += 1
+                self.schedule(config.INGEST_RETRY_DELAY)
+                metrics.record_ingest("retry")
+            else:
+                print(f"解析JSON文件错误: {e}")
+                self.retries = 0
+                metrics.record_ingest("error")
+            return
+        self.retries = 0
+
+        try:
+            new_id = add_history_item_from_json(current_content)  # 将JSON内容添加到历史记录
+            print("已更新历史记录", new_id)
+        except Exception as e:
+            print(f"处理JSON变更错误: {e}")
+            metrics.record_ingest("error")
+            return
+        self.fingerprint = fingerprint
+        self.save_fingerprint()
+        metrics.record_ingest("inserted", st.st_mtime_ns)
 
     def stop(self):
-        """停止后台线程"""
-        self.stop_notification.set()
-        if self.notification_thread and self.notification_thread.is_alive():
-            self.notification_thread.join(timeout=2.0)
-        if self.connected:
-            self.sio.disconnect()
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
 
 def main():
     event_handler = JSONChangeHandler()
     observer = Observer()
-    observer.schedule(event_handler, path='.', recursive=False)
+    # 监控JSON文件所在的目录（而不是当前工作目录）
+    observer.schedule(event_handler, path=os.path.dirname(event_handler.json_path), recursive=False)
     observer.start()
     try:
         print("监控服务已启动...")
@@ -108,7 +158,7 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-        event_handler.stop()  # 确保停止后台线程
+        event_handler.stop()
     observer.join()
     print("监控服务结束...")
 
@@ -153,50 +203,13 @@ def parse_size(size_str):
 
     return int(size * units[unit])
 
-def get_folder_size(folder_path):
-    """计算文件夹的总大小（字节）"""
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            # 只计算文件大小，忽略符号链接
-            if not os.path.islink(fp):
-                total_size += os.path.getsize(fp)
-    return total_size
-
-def get_oldest_file(folder_path):
-    """获取文件夹中最旧的文件路径"""
-    files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
-             if os.path.isfile(os.path.join(folder_path, f))]
-    if not files:
-        return None
-    # 按创建时间排序，返回最旧的文件
-    return min(files, key=os.path.getctime)
-
 def delete_oldest_files(folder_path, max_size):
-    """删除最旧的文件，直到文件夹大小低于max_size"""
-    current_size = get_folder_size(folder_path)
-
-    if current_size <= max_size:
+    """按最久未使用删除备份文件，直到备份总大小低于max_size（基于 BackupFile 表，不遍历目录）"""
+    deleted_count, freed = evict_backups(get_write_engine(), max_size)
+    if not deleted_count:
         return False  # 不需要删除文件
 
-    print(f"文件夹大小 {format_size(current_size)} 超过阈值 {format_size(max_size)}，开始清理...")
-
-    while current_size > max_size:
-        oldest_file = get_oldest_file(folder_path)
-        if not oldest_file:
-            print("文件夹已空，但仍超过大小限制")
-            break
-
-        file_size = os.path.getsize(oldest_file)
-        try:
-            os.remove(oldest_file)
-            print(f"已删除文件: {oldest_file} (大小: {format_size(file_size)})")
-            current_size -= file_size
-        except Exception as e:
-            print(f"删除文件 {oldest_file} 失败: {e}")
-            break
-
+    print(f"备份超过阈值 {format_size(max_size)}，已清理 {deleted_count} 个文件，释放 {format_size(freed)}")
     return True
 
 def format_size(size_bytes):
@@ -231,7 +244,17 @@ def monitor_backup_folder(folder_path, max_size_str, check_interval=60):
 
     try:
         while True:
-            delete_oldest_files(folder_path, max_size)
+            try:
+                # 先从数据库校准备份总大小：其他进程（多进程部署的 Web 工作进程、导入工具）的写入不在本进程计数中
+                backup_usage.refresh(get_write_engine())
+                delete_oldest_files(folder_path, max_size)
+                cleanup_temp_files()
+                prune_change_log(get_write_engine(), config.CHANGE_LOG_RETENTION_DAYS)
+                prune_checksums(get_write_engine())
+                maintain_dictionary(get_write_engine())
+                evict_thumbnails(config.THUMBNAIL_MAX_FOLDER_SIZE)
+            except Exception as e:
+                print(f"清理备份文件失败: {e}")
             time.sleep(check_interval)
     except KeyboardInterrupt:
         print("\n监控已停止")
@@ -0,0 +1,237 @@
+import os
+import json
+import queue
+import socket
+import threading
+import socketserver
+from typing import Any, Callable, Dict, List, Optional
+import socketio
+
+# Socket.IO 事件的跨进程分发（多进程部署，见 app/server.py）
+# 每个 Web 工作进程只持有自己的连接，任一进程 emit 的事件经消息队列转发给所有工作进程再推送给各自的客户端；
+# 监控进程不运行 Web 服务，以只写方式连接队列发布事件。
+# SOCKETIO_MESSAGE_QUEUE 支持：
+#   ""                     不使用消息队列（单进程），事件只推送给本进程的连接
+#   "redis://host:6379/0"  Redis（需要安装 redis）；kafka:// 与 zmq+tcp:// 见 python-socketio 文档；
+#                          其他地址（amqp:// 等）交给 kombu
+#   "unix:///path/x.sock"  本机 UNIX 套接字：由多进程入口的主进程运行 LocalBroker 转发，无需外部服务
+#   "local://"             进程内队列，同一进程中的多个 Socket.IO 服务之间分发，只用于测试
+# 各管理器都混入 EventHandlersMixin：创建时传入 handlers，本进程可先处理收到的事件（如清除缓存）再推送给客户端。
+
+CHANNEL = "clipboard-socketio"
+
+def _blocking(server, module: str, func, *args):
+    """eventlet 未对 module（"socket"/"thread"）打补丁时，阻塞调用放到线程池中执行，避免阻塞事件循环"""
+    if server is not None and server.async_mode == "eventlet":
+        from eventlet import patcher, tpool
+        if not patcher.is_monkey_patched(module):
+            return tpool.execute(func, *args)
+    return func(*args)
+
+class EventHandlersMixin:
+    """
+    经消息队列收到 handlers 中的事件时，先以事件数据调用对应的处理函数（出错时只打印），之后照常推送给客户端
+    与 socketio.PubSubManager 的子类一起使用，handlers 为 {事件名: 处理函数}
+    """
+
+    def __init__(self, *args, handlers: Optional[Dict[str, Callable[[Any], None]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handlers = dict(handlers or {})
+
+    def _handle_emit(self, message):
+        event = message.get("event")
+        handler = self.handlers.get(event)
+        if handler is not None:
+            try:
+                handler(message.get("data"))
+            except Exception as e:
+                print(f"处理消息队列事件 {event} 失败: {e}")
+        return super()._handle_emit(message)
+
+class RedisManager(EventHandlersMixin, socketio.RedisManager):
+    pass
+
+class KafkaManager(EventHandlersMixin, socketio.KafkaManager):
+    pass
+
+class ZmqManager(EventHandlersMixin, socketio.ZmqManager):
+    pass
+
+class KombuManager(EventHandlersMixin, socketio.KombuManager):
+    pass
+
+class LocalQueueManager(EventHandlersMixin, socketio.PubSubManager):
+    """进程内消息队列（测试用）：同一频道的所有实例互相转发"""
+    name = "local"
+    _subscribers: Dict[str, List["queue.Queue"]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, url: str = "local://", channel: str = CHANNEL, write_only: bool = False, logger=None,
+                 handlers=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, handlers=handlers)
+        self.inbox: "queue.Queue" = queue.Queue()
+        if not write_only:
+            with self._lock:
+                self._subscribers.setdefault(channel, []).append(self.inbox)
+
+    def _publish(self, data):
+        with self._lock:
+            inboxes = list(self._subscribers.get(self.channel, []))
+        for inbox in inboxes:
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield _blocking(self.server, "thread", self.inbox.get)
+
+class UnixSocketManager(EventHandlersMixin, socketio.PubSubManager):
+    """
+    通过 LocalBroker（UNIX 套接字）转发的消息队列，消息为逐行 JSON
+    连接断开时自动重连（期间发布的消息丢失，浏览器按版本号补齐）
+    """
+    name = "unix"
+
+    def __init__(self, url: str, channel: str = CHANNEL, write_only: bool = False, logger=None, handlers=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, handlers=handlers)
+        self.path = url[len("unix://"):]
+        self.write_lock = threading.Lock()
+        self.writer: Optional[socket.socket] = None
+
+    def _connect(self, subscribe: bool) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            # 首行声明频道与是否订阅，LocalBroker 只向订阅者转发
+            sock.sendall(json.dumps({"channel": self.channel, "subscribe": subscribe}).encode("utf-8") + b"\n")
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _publish(self, data):
+        line = json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.write_lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None:
+                        self.writer = self._connect(subscribe=False)
+                    self.writer.sendall(line)
+                    return
+                except OSError as e:
+                    if self.writer is not None:
+                        self.writer.close()
+                        self.writer = None
+                    if attempt:
+                        print(f"消息队列发布失败: {e}")
+
+    def _listen(self):
+        while True:
+            try:
+                sock = _blocking(self.server, "socket", self._connect, True)
+            except OSError as e:
+                print(f"连接消息队列 {self.path} 失败: {e}，稍后重试")
+                self.server.sleep(1)
+                continue
+            reader = sock.makefile("rb")
+            try:
+                while True:
+                    line = _blocking(self.server, "socket", reader.readline)
+                    if not line:
+                        break
+                    yield json.loads(line)
+            except (OSError, ValueError) as e:
+                print(f"消息队列连接中断: {e}")
+            finally:
+                reader.close()
+                sock.close()
+            self.server.sleep(1)
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker: "LocalBroker" = self.server.broker
+        try:
+            hello = json.loads(self.rfile.readline() or b"{}")
+        except ValueError:
+            return
+        channel = hello.get("channel", CHANNEL)
+        if hello.get("subscribe"):
+            broker.add(channel, self)
+        try:
+            for line in self.rfile:
+                broker.broadcast(channel, line)
+        except OSError:
+            pass
+        finally:
+            broker.remove(channel, self)
+
+class LocalBroker:
+    """
+    本机消息转发器：监听 UNIX 套接字，把每条消息转发给同一频道的所有订阅连接
+    由多进程入口的主进程运行，工作进程与监控进程通过 UnixSocketManager 连接
+    """
+
+    def __init__(self, path: str, send_timeout: float = 5.0):
+        self.path = path
+        self.send_timeout = send_timeout
+        self.lock = threading.Lock()
+        self.subscribers: Dict[str, List[_BrokerHandler]] = {}
+        self.server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def add(self, channel: str, handler: _BrokerHandler) -> None:
+        handler.connection.settimeout(self.send_timeout)  # 订阅者长时间不读取时断开，不拖慢其他进程
+        with self.lock:
+            self.subscribers.setdefault(channel, []).append(handler)
+
+    def remove(self, channel: str, handler: _BrokerHandler) -> None:
+        with self.lock:
+            if handler in self.subscribers.get(channel, []):
+                self.subscribers[channel].remove(handler)
+
+    def broadcast(self, channel: str, line: bytes) -> None:
+        with self.lock:
+            handlers = list(self.subscribers.get(channel, []))
+        for handler in handlers:
+            try:
+                handler.connection.sendall(line)
+            except OSError as e:
+                print(f"消息转发失败，断开订阅连接: {e}")
+                self.remove(channel, handler)
+                handler.connection.close()
+
+    def start(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)  # 上次未正常退出遗留的套接字文件
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, _BrokerHandler)
+        self.server.daemon_threads = True
+        self.server.broker = self
+        threading.Thread(target=self.server.serve_forever, name="MessageBroker", daemon=True).start()
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def create_client_manager(url: Optional[str], write_only: bool = False,
+                          handlers: Optional[Dict[str, Callable[[Any], None]]] = None):
+    """
+    按地址创建 Socket.IO 客户端管理器，未配置消息队列时返回 None（使用默认的进程内管理器）
+    :param write_only: 只发布不接收（没有 Web 服务的进程）
+    :param handlers: 本进程对收到的事件的处理 {事件名: 处理函数}（如监控进程清理备份后使本进程的缓存失效）
+    """
+    if not url:
+        return None
+    if url.startswith("unix://"):
+        return UnixSocketManager(url, write_only=write_only, handlers=handlers)
+    if url.startswith("local://"):
+        return LocalQueueManager(url, write_only=write_only, handlers=handlers)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisManager(url, channel=CHANNEL, write_only=write_only, handlers=handlers)
+    if url.startswith("kafka://"):
+        return KafkaManager(url, channel=CHANNEL, write_only=write_only, handlers=handlers)
+    if url.startswith("zmq"):
+        return ZmqManager(url, channel=CHANNEL, write_only=write_only, handlers=handlers)
+    return KombuManager(url, channel=CHANNEL, write_only=write_only, handlers=handlers)
@@ -0,0 +1,282 @@
+import time
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from sqlalchemy import event
+
+# 运行指标（Prometheus 文本格式，由 /metrics 输出）
+# 指标保存在进程内：接口耗时在请求钩子中记录，SQL 耗时通过 SQLAlchemy 引擎事件记录，
+# 入库延迟由监控线程记录；缓存、备份大小、事件队列等状态在抓取时读取，平时不产生开销。
+# 只实现需要的 Counter / Histogram / 回调 Gauge，不依赖 prometheus_client。
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+INGEST_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.values: Dict[Labels, List] = {}  # labels -> [各区间计数, 总和, 总数]
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.values.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, counts, total, count in sorted(values):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(float(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class CallbackMetric:
+    """抓取时才计算的指标，callback 返回 [(标签值, 数值)]"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            values = list(self.callback())
+        except Exception as e:
+            print(f"采集指标 {self.name} 失败: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, documentation: str, metric_type: str = "gauge", labelnames: Sequence[str] = ()):
+        """装饰器：注册抓取时计算的 gauge/counter"""
+        def decorator(func):
+            self.metrics.append(CallbackMetric(name, documentation, metric_type, labelnames, func))
+            return func
+        return decorator
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "clipboard_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+http_duration = registry.histogram(
+    "clipboard_http_request_duration_seconds", "HTTP request latency by route (until the response is returned)",
+    ("route", "method"), HTTP_BUCKETS)
+db_queries = registry.counter(
+    "clipboard_db_queries_total", "SQL statements executed by engine and statement type", ("engine", "statement"))
+db_errors = registry.counter(
+    "clipboard_db_errors_total", "SQL statements that raised an error", ("engine", "statement"))
+db_duration = registry.histogram(
+    "clipboard_db_query_duration_seconds", "SQL statement execution time", ("engine", "statement"), DB_BUCKETS)
+ingest_events = registry.counter(
+    "clipboard_ingest_total", "SyncClipboard.json processing results", ("result",))
+ingest_lag = registry.histogram(
+    "clipboard_ingest_lag_seconds", "Delay from SyncClipboard.json modification to the history record commit",
+    (), INGEST_BUCKETS)
+
+_socketio_clients = 0
+_socketio_lock = threading.Lock()
+_last_ingest = 0.0
+
+@registry.callback("clipboard_socketio_clients", "Connected Socket.IO clients")
+def _collect_socketio_clients():
+    return [((), _socketio_clients)]
+
+@registry.callback("clipboard_ingest_last_success_timestamp_seconds", "Unix time of the last ingested clipboard change")
+def _collect_last_ingest():
+    return [((), _last_ingest)]
+
+def _cache_stat(key: str):
+    def collect():
+        from app.db.cache import cache
+        return [((name,), stats[key]) for name, stats in cache.stats().items()]
+    return collect
+
+for _key, _type, _doc in (
+    ("entries", "gauge", "Entries in the in-memory cache namespace"),
+    ("bytes", "gauge", "Estimated bytes held by the in-memory cache namespace"),
+    ("hits", "counter", "In-memory cache hits"),
+    ("misses", "counter", "In-memory cache misses"),
+    ("evictions", "counter", "In-memory cache LRU evictions"),
+    ("expirations", "counter", "In-memory cache TTL expirations"),
+):
+    _name = f"clipboard_cache_{_key}" + ("_total" if _type == "counter" else "")
+    registry.callback(_name, _doc, _type, ("namespace",))(_cache_stat(_key))
+
+@registry.callback("clipboard_backup_bytes", "Total size of the backup store (from the BackupFile table)")
+def _collect_backup_bytes():
+    from app.db.engine import get_write_engine
+    from app.services.backup_store import backup_usage
+    return [((), backup_usage.get(get_write_engine()))]
+
+@registry.callback("clipboard_event_bus_pending", "Events waiting to be pushed to browsers")
+def _collect_event_bus_pending():
+    from app.services.event_bus import event_bus
+    return [((), event_bus.queue.qsize())]
+
+@registry.callback("clipboard_event_bus_dropped_total", "Events dropped because the event bus queue was full", "counter")
+def _collect_event_bus_dropped():
+    from app.services.event_bus import event_bus
+    return [((), event_bus.dropped)]
+
+@registry.callback("clipboard_offload_pending", "Blocking jobs (uploads, hashing, writes) queued or running in the thread pool")
+def _collect_offload_pending():
+    from app.services.offload import blocking_pool
+    return [((), blocking_pool.pending)]
+
+@registry.callback("clipboard_offload_rejected_total", "Blocking jobs rejected with 503 because the thread pool was full", "counter")
+def _collect_offload_rejected():
+    from app.services.offload import blocking_pool
+    return [((), blocking_pool.rejected)]
+
+def _statement_type(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def instrument_engine(engine, name: str) -> None:
+    """为引擎注册 SQL 计时事件（每条语句的开始时间保存在连接的 info 中）"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if not starts:
+            return
+        statement_type = _statement_type(statement)
+        db_queries.inc(name, statement_type)
+        db_duration.observe(time.perf_counter() - starts.pop(), name, statement_type)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        starts = conn.info.get("metrics_start") if conn is not None else None
+        if starts:
+            starts.pop()
+        db_errors.inc(name, _statement_type(context.statement or ""))
+
+def record_ingest(result: str, mtime_ns: int = None) -> None:
+    """
+    记录一次同步文件处理结果
+    :param result: "inserted" / "unchanged" / "retry" / "error"
+    :param mtime_ns: 入库成功时传入文件修改时间，用于计算入库延迟
+    """
+    global _last_ingest
+    ingest_events.inc(result)
+    if mtime_ns is not None:
+        now = time.time()
+        ingest_lag.observe(max(0.0, now - mtime_ns / 1e9))
+        _last_ingest = now
+
+def init_app(app, socketio) -> None:
+    """注册请求计时钩子与 Socket.IO 连接计数"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # 按路由模板（而不是实际路径）统计，避免标签数量随参数增长
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            http_requests.inc(route, request.method, str(response.status_code))
+            http_duration.observe(time.perf_counter() - start, route, request.method)
+        return response
+
+    @socketio.on("connect")
+    def _on_connect(auth=None):
+        global _socketio_clients
+        with _socketio_lock:
+            _socketio_clients += 1
+
+    @socketio.on("disconnect")
+    def _on_disconnect(*args):
+        global _socketio_clients
+        with _socketio_lock:
+            _socketio_clients = max(0, _socketio_clients - 1)
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,122 @@
+import threading
+from typing import Any, Callable
+from config import config
+
+# 阻塞操作的线程池卸载
+# eventlet 下 Web 请求运行在事件循环的协程中，阻塞操作期间其他请求与 Socket.IO 心跳都会停顿；
+# 在协程中调用 run()/run_io() 时交给 eventlet 的真实线程池（tpool）执行，等待期间让出事件循环。
+# 不在协程中调用时（监控线程、导入工具、测试客户端、已在线程池中）直接执行，本身不会阻塞事件循环。
+# 排队与执行中的任务数达到 OFFLOAD_MAX_PENDING 时立即抛出 OffloadBusy（接口返回 503），
+# 大量并发上传时不会无限堆积任务与临时文件。
+#
+# 卸载范围取决于进程是否 monkey_patch：
+# - start.py（调试服务，未打补丁）：run() 将整段写入流程（含 SQLite 写事务）放到线程池，run_io() 同样卸载；
+# - serve.py 工作进程（已打补丁）：锁与队列都是协程版本，不能在真实线程中使用，run() 在协程内直接执行，
+#   其中的纯文件/哈希操作（写入临时文件、计算MD5、复制备份、解码图片）经 run_io() 卸载到线程池，
+#   写事务经 run_write() 交给专用写线程（DbWriter）：该线程用未打补丁的 threading/queue 创建，
+#   使用自己的数据库连接（create_writer_engine），事务中不访问缓存、事件总线等使用协程锁的对象，
+#   提交后由调用方协程更新缓存并推送。
+# 对比见基准场景 read_during_upload / read_during_upload_inline（python -m benchmarks），
+# 打补丁的工作进程见 python -m benchmarks.serve_worker。
+
+class OffloadBusy(RuntimeError):
+    """线程池排队已满，调用方应稍后重试"""
+
+def _in_greenlet() -> bool:
+    """当前是否运行在事件循环调度的协程中（而不是普通线程的主协程）"""
+    from greenlet import getcurrent
+    return getcurrent().parent is not None
+
+def _thread_patched() -> bool:
+    from eventlet import patcher
+    return patcher.is_monkey_patched("thread")
+
+class DbWriter:
+    """专用写线程：按提交顺序执行 func(engine, ...)，engine 为只在该线程中使用的写引擎"""
+    def __init__(self):
+        from eventlet import patcher
+        self._threading = patcher.original("threading")
+        self._queue = patcher.original("queue")
+        self.start_lock = self._threading.Lock()
+        self.jobs = None
+        self.thread = None
+
+    def _start(self) -> None:
+        with self.start_lock:
+            if self.thread is None:
+                self.jobs = self._queue.Queue()
+                self.thread = self._threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self.thread.start()
+
+    def _loop(self) -> None:
+        from app.db.engine import create_writer_engine
+        engine = create_writer_engine()
+        while True:
+            func, args, kwargs, done, result = self.jobs.get()
+            try:
+                result.append((True, func(engine, *args, **kwargs)))
+            except BaseException as e:
+                result.append((False, e))
+            done.set()
+
+    def execute(self, func: Callable, *args, **kwargs) -> Any:
+        """提交任务并等待结果（阻塞当前真实线程，由 BlockingPool 在线程池中调用）"""
+        if self.thread is None:
+            self._start()
+        done, result = self._threading.Event(), []
+        self.jobs.put((func, args, kwargs, done, result))
+        done.wait()
+        ok, value = result[0]
+        if ok:
+            return value
+        raise value
+
+class BlockingPool:
+    def __init__(self, threads: int, max_pending: int):
+        self.threads = threads
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        # 线程数需在 tpool 首次使用前设置（之后不可修改）；未打补丁时事件总线的等待会长期占用一个线程，额外多开一个
+        from eventlet import tpool
+        tpool.set_num_threads(threads + 1)
+
+    def _execute(self, func: Callable, *args, **kwargs) -> Any:
+        from eventlet import tpool
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise OffloadBusy(f"后台任务已满（{self.max_pending}），请稍后重试")
+            self.pending += 1
+        try:
+            return tpool.execute(func, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """执行不使用锁的纯文件/CPU 操作（哈希、读写与复制文件）"""
+        if config.OFFLOAD_ENABLED and _in_greenlet():
+            return self._execute(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """执行包含数据库写入等加锁操作的流程（只在未打补丁的进程中卸载）"""
+        if config.OFFLOAD_ENABLED and _in_greenlet() and not _thread_patched():
+            return self._execute(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def run_write(self, func: Callable, engine, *args, **kwargs) -> Any:
+        """
+        执行写事务 func(engine, ...)：打补丁的进程中交给专用写线程（换用写线程自己的引擎），
+        func 中只能访问数据库，不能使用缓存、事件总线等；其他情况同 run()
+        """
+        if config.OFFLOAD_ENABLED and _in_greenlet():
+            if _thread_patched():
+                return self._execute(db_writer.execute, func, *args, **kwargs)
+            return self._execute(func, engine, *args, **kwargs)
+        return func(engine, *args, **kwargs)
+
+blocking_pool = BlockingPool(config.OFFLOAD_THREADS, config.OFFLOAD_MAX_PENDING)
+db_writer = DbWriter()
@@ -0,0 +1,178 @@
+import os
+import re
+import time
+import queue
+import tempfile
+import threading
+from typing import Optional, Tuple
+from config import config
+from app.services.offload import blocking_pool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装 Pillow 时不生成缩略图，页面直接使用原图
+    Image = None
+
+# 图片缩略图
+# 缩略图按 checksum 存放：THUMBNAIL_DIR/<checksum前2位>/<checksum>.<格式>，同一内容只生成一次。
+# 入库时提交给后台线程生成；请求时若尚未生成则当场生成。
+# 缩略图目录有独立的容量上限，由监控进程定期检查（evict_thumbnails），超出后按最近最少访问淘汰；
+# 访问时间记录在文件的修改时间上（touch_thumbnail），所有工作进程共用同一目录与同一上限。
+# 解码/缩放图片在线程池中执行（在 Web 请求的协程中调用时），不阻塞事件循环。
+
+_FORMATS = {"WEBP": ("webp", "image/webp"), "JPEG": ("jpg", "image/jpeg")}
+
+def available() -> bool:
+    return Image is not None
+
+def _format():
+    return _FORMATS.get(config.THUMBNAIL_FORMAT.upper(), _FORMATS["JPEG"])
+
+def thumbnail_mimetype() -> str:
+    return _format()[1]
+
+_CHECKSUM_RE = re.compile(r"^[0-9a-f]{32}$")
+
+def is_valid_checksum(checksum: str) -> bool:
+    """checksum 是否为MD5（32 位小写十六进制），拼接路径前必须检查，防止路径穿越"""
+    return bool(checksum) and _CHECKSUM_RE.match(checksum) is not None
+
+def thumbnail_path(checksum: str) -> str:
+    """
+    checksum 对应的缩略图路径
+    :raises ValueError: checksum 不是合法的MD5
+    """
+    if not is_valid_checksum(checksum):
+        raise ValueError(f"无效的 checksum: {checksum!r}")
+    return os.path.join(config.THUMBNAIL_DIR, checksum[:2], f"{checksum}.{_format()[0]}")
+
+def touch_thumbnail(path: str) -> None:
+    """记录一次访问：更新缩略图的修改时间（同一文件 THUMBNAIL_TOUCH_INTERVAL 秒内只更新一次）"""
+    try:
+        if time.time() - os.stat(path).st_mtime >= config.THUMBNAIL_TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+
+def evict_thumbnails(max_size: int) -> Tuple[int, int]:
+    """
+    缩略图目录超出 max_size 时，按修改时间从旧到新删除（由监控进程定期调用）
+    :return: (删除的文件数, 释放的字节数)
+    """
+    files = []
+    total = 0
+    for dirpath, _, filenames in os.walk(config.THUMBNAIL_DIR):
+        for name in filenames:
+            if name.startswith(".tmp-"):  # 正在生成的临时文件
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, path, st.st_size))
+            total += st.st_size
+    removed = freed = 0
+    if total > max_size:
+        for _, path, size in sorted(files):
+            if total - freed <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        print(f"缩略图目录超出容量上限，已删除 {removed} 个最久未访问的缩略图（{freed} 字节）")
+    return removed, freed
+
+def generate_thumbnail(checksum: str, src_path: str) -> Optional[str]:
+    """
+    生成缩略图（已存在时直接返回）
+    :return: 缩略图路径；未安装 Pillow 或源文件不是可识别的图片时返回 None
+    """
+    if Image is None:
+        return None
+    dst_path = thumbnail_path(checksum)
+    if os.path.exists(dst_path):
+        touch_thumbnail(dst_path)
+        return dst_path
+    if not blocking_pool.run_io(_render_thumbnail, checksum, src_path, dst_path):
+        return None
+    return dst_path
+
+def _render_thumbnail(checksum: str, src_path: str, dst_path: str) -> bool:
+    """解码原图并写入缩略图（纯文件/CPU 操作，不使用锁），失败时返回 False"""
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    size = config.THUMBNAIL_SIZE
+    fmt = config.THUMBNAIL_FORMAT.upper() if config.THUMBNAIL_FORMAT.upper() in _FORMATS else "JPEG"
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst_path), prefix=".tmp-")
+    os.close(fd)
+    try:
+        with Image.open(src_path) as img:
+            img.draft("RGB", (size, size))  # JPEG 解码时直接按比例缩小，减少内存和耗时
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            if img.mode not in ("RGB", "RGBA") or (fmt == "JPEG" and img.mode == "RGBA"):
+                img = img.convert("RGBA" if fmt == "WEBP" and "A" in img.getbands() else "RGB")
+            img.save(tmp_path, fmt, quality=config.THUMBNAIL_QUALITY)
+        os.replace(tmp_path, dst_path)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"生成缩略图失败 {checksum}: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+def remove_thumbnail(checksum: str) -> None:
+    """删除 checksum 对应的缩略图（原图被删除时调用）"""
+    if not is_valid_checksum(checksum):
+        return
+    path = thumbnail_path(checksum)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class ThumbnailWorker:
+    """后台生成缩略图的线程，队列满时丢弃任务（请求时会按需生成）"""
+
+    def __init__(self):
+        self.queue: "queue.Queue" = queue.Queue(maxsize=config.THUMBNAIL_QUEUE_SIZE)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _ensure_started(self) -> None:
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="ThumbnailWorker", daemon=True)
+        self.thread.start()
+
+    def submit(self, checksum: str, src_path: str) -> None:
+        if Image is None or not is_valid_checksum(checksum) or os.path.exists(thumbnail_path(checksum)):
+            return
+        with self.lock:
+            if checksum in self.pending:
+                return
+            try:
+                self.queue.put_nowait((checksum, src_path))
+            except queue.Full:
+                return
+            self.pending.add(checksum)
+            self._ensure_started()
+
+    def _run(self) -> None:
+        while True:
+            checksum, src_path = self.queue.get()
+            try:
+                generate_thumbnail(checksum, src_path)
+            except Exception as e:
+                print(f"生成缩略图失败 {checksum}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(checksum)
+                self.queue.task_done()
+
+thumbnail_worker = ThumbnailWorker()
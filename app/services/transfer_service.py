@@ -0,0 +1,238 @@
+import os
+import json
+import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, select
+from config import config
+from app.models.models import ClipboardHistory, BackupFile
+from app.db.engine import get_read_engine, get_write_engine
+from app.db.content import pack_content, insert_contents, load_contents, full_content, is_compressed
+from app.services.backup_store import cas_path, link_or_copy, verify_backup
+from app.services import checksum as checksum_service
+
+# 批量导入/导出
+# 导出：按 id 顺序分批读取，逐行写出 NDJSON（每行一条记录），可选同时导出备份文件（以 checksum 命名）。
+# 导入：流式读取 NDJSON（或 JSON 数组），每 batch_size 条一个事务、一次 executemany 写入，
+# 备份文件用线程池并行放入存储；uuid 已存在的记录跳过，重复导入本工具导出的文件是幂等的
+# （SyncClipboard.json 格式没有 uuid，每次导入都会新增）。
+# 导入在独立进程中运行，结束后可通知正在运行的服务清空一次缓存（而不是每条记录失效一次）。
+
+EXPORT_FIELDS = ["uuid", "type", "clipboard", "from_equipment", "tag", "timestamp",
+                 "checksum", "original_filename", "raw_content"]
+
+def export_history(out, files_dir: Optional[str] = None, batch_size: int = 5000) -> int:
+    """
+    将全部历史记录按 id 顺序写入文本流 out（NDJSON）
+    :param files_dir: 指定时同时把备份文件复制到该目录，文件名为 checksum
+    :return: 导出的记录数
+    """
+    table = ClipboardHistory.__table__
+    columns = [table.c[name] for name in EXPORT_FIELDS] + [table.c.content_size, table.c.content_hash]
+    engine = get_read_engine()
+    if files_dir:
+        os.makedirs(files_dir, exist_ok=True)
+
+    count = 0
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, *columns).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).all()
+            paths = dict(conn.execute(
+                select(BackupFile.checksum, BackupFile.filepath)
+                .where(BackupFile.checksum.in_({row.checksum for row in rows if row.checksum}))
+            ).all()) if files_dir else {}
+            # 导出完整内容：解压大文本，还原原始JSON
+            contents = load_contents(conn, [row.content_hash for row in rows
+                                            if is_compressed(row.clipboard, row.content_size)])
+        if not rows:
+            return count
+
+        for row in rows:
+            record = {name: getattr(row, name) for name in EXPORT_FIELDS}
+            record["clipboard"], record["raw_content"] = full_content(row, contents)
+            record["timestamp"] = row.timestamp.isoformat() if row.timestamp else None
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for checksum, path in paths.items():
+            dst_path = os.path.join(files_dir, checksum)
+            if os.path.exists(path) and not os.path.exists(dst_path) \
+                    and verify_backup(get_write_engine(), checksum, path):
+                link_or_copy(path, dst_path)
+        count += len(rows)
+        last_id = rows[-1].id
+
+def read_records(path: str) -> Iterator[dict]:
+    """逐条读取导入文件：NDJSON 流式读取；以 [ 开头的 JSON 数组整体解析"""
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _parse_timestamp(value) -> datetime:
+    """解析为数据库使用的 UTC 时间（不带时区）；带时区偏移的时间先换算为 UTC，不带时区的视为 UTC"""
+    if not value:
+        return datetime.utcnow()
+    timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def normalize_record(record: dict) -> dict:
+    """
+    将导入记录转换为 clipboardhistory 的列
+    支持本工具导出的格式，以及 SyncClipboard.json 格式（Type/Clipboard/File/From/Tag）
+    """
+    if "Type" in record:
+        item_type = record.get("Type", "")
+        file_name = record.get("File") or None
+        checksum = record.get("Clipboard") if item_type in ("File", "Image") and file_name else None
+        row = {
+            "raw_content": json.dumps(record, ensure_ascii=False),
+            "clipboard": record.get("Clipboard", ""),
+            "type": item_type,
+            "from_equipment": record.get("From"),
+            "tag": record.get("Tag"),
+            "timestamp": _parse_timestamp(record.get("Timestamp")),
+            "checksum": checksum,
+            "original_filename": file_name if item_type in ("File", "Image", "Group") else None,
+        }
+    else:
+        row = {name: record.get(name) for name in EXPORT_FIELDS if name != "uuid"}
+        row["timestamp"] = _parse_timestamp(record.get("timestamp"))
+        if row["raw_content"] is None:
+            row["raw_content"] = json.dumps({"Type": row["type"], "Clipboard": row["clipboard"]}, ensure_ascii=False)
+    row["clipboard"] = row["clipboard"] or ""
+    row["uuid"] = record.get("uuid") or str(uuid_lib.uuid4())
+    return row
+
+def _store_backup(src_path: str, checksum: Optional[str]) -> Optional[Tuple[str, str, int, Optional[dict]]]:
+    """
+    将一个文件放入备份存储（在线程池中运行）
+    :return: (checksum, 备份路径, 字节数, 新计算的校验和缓存行或 None)
+    """
+    if not os.path.exists(src_path):
+        return None
+    entry = None
+    if not checksum:
+        checksum, entry = checksum_service.file_checksum(src_path)
+    backup_path = cas_path(checksum)
+    if not os.path.exists(backup_path):
+        link_or_copy(src_path, backup_path)
+    try:
+        size = os.path.getsize(backup_path)
+    except FileNotFoundError:
+        # 刚好被 evict_backups 淘汰，重新放入（此时尚未打开写事务）
+        link_or_copy(src_path, backup_path)
+        size = os.path.getsize(backup_path)
+    return checksum, backup_path, size, entry
+
+def _find_source_file(files_dir: str, row: dict) -> Optional[str]:
+    """导出目录中的文件以 checksum 命名；SyncClipboard 目录中的文件以原始文件名命名"""
+    for name in (row.get("checksum"), row.get("original_filename")):
+        if name:
+            path = os.path.join(files_dir, os.path.basename(name))
+            if os.path.exists(path):
+                return path
+    return None
+
+def _insert_batch(engine, pool: Optional[ThreadPoolExecutor], files_dir: Optional[str],
+                  rows: List[dict]) -> Tuple[int, int]:
+    """一个事务写入一批记录，返回 (新增记录数, 新增备份文件数)"""
+    backups = []
+    if pool and files_dir:
+        jobs = []
+        for row in rows:
+            if row["type"] not in ("File", "Image", "Group"):
+                continue
+            src_path = _find_source_file(files_dir, row)
+            if src_path:
+                jobs.append((row, pool.submit(_store_backup, src_path, row.get("checksum"))))
+        for row, job in jobs:
+            result = job.result()
+            if result:
+                row["checksum"] = result[0]  # Group 类型导入时才计算 MD5
+                backups.append(result)
+
+    # 大文本压缩存储、原始JSON去掉重复内容（与 ORM 写入时的处理一致）
+    contents = []
+    for row in rows:
+        columns, blob = pack_content(row["clipboard"], row["raw_content"])
+        row.update(columns)
+        if blob:
+            contents.append(blob)
+
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        insert_contents(conn, contents)
+        added_backups = 0
+        if backups:
+            added_backups = conn.execute(
+                insert(BackupFile.__table__).prefix_with("OR IGNORE"),
+                [{"checksum": c, "filepath": p, "size": s, "last_used_at": now} for c, p, s, _ in backups],
+            ).rowcount
+            checksum_service.remember(conn, (entry for _, _, _, entry in backups))
+        # uuid 唯一约束：已存在的记录跳过
+        result = conn.execute(insert(ClipboardHistory.__table__).prefix_with("OR IGNORE"), rows)
+        return result.rowcount, added_backups
+
+def import_history(records: Iterable[dict], files_dir: Optional[str] = None,
+                   batch_size: int = 5000, workers: int = 4, progress=None) -> dict:
+    """
+    批量导入记录
+    :param files_dir: 附件所在目录（导出的备份目录或 SyncClipboard 的 file 目录）
+    :param progress: 可选回调，每写入一批后以已处理条数调用
+    :return: {"read": 读取条数, "inserted": 新增记录数, "backups": 新增备份文件数}
+    """
+    engine = get_write_engine()
+    stats = {"read": 0, "inserted": 0, "backups": 0}
+    pool = ThreadPoolExecutor(max_workers=workers) if files_dir else None
+    try:
+        batch = []
+        for record in records:
+            batch.append(normalize_record(record))
+            if len(batch) >= batch_size:
+                _flush(engine, pool, files_dir, batch, stats, progress)
+                batch = []
+        if batch:
+            _flush(engine, pool, files_dir, batch, stats, progress)
+    finally:
+        if pool:
+            pool.shutdown()
+    return stats
+
+def _flush(engine, pool, files_dir, batch, stats, progress) -> None:
+    inserted, backups = _insert_batch(engine, pool, files_dir, batch)
+    stats["read"] += len(batch)
+    stats["inserted"] += inserted
+    stats["backups"] += backups
+    if progress:
+        progress(stats["read"])
+
+def notify_server(base_url: str, token: Optional[str] = None) -> bool:
+    """
+    通知正在运行的服务清空缓存（导入在独立进程中完成，服务端缓存需要失效一次）
+    :param token: 访问令牌，默认使用 CACHE_INVALIDATE_TOKEN（为空时服务端只接受本机直接访问）
+    """
+    import urllib.request
+    token = config.CACHE_INVALIDATE_TOKEN if token is None else token
+    headers = {"X-Cache-Invalidate-Token": token} if token else {}
+    try:
+        request = urllib.request.Request(base_url.rstrip("/") + "/api/cache/invalidate", method="POST",
+                                         headers=headers)
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status == 200
+    except OSError as e:
+        print(f"通知服务失败: {e}")
+        return False
@@ -0,0 +1,11 @@
+# 基准测试
+# 生成合成数据库（指定条数，按真实比例混合文本/图片/文件，附带收藏与备份文件），
+# 通过 Flask 测试客户端调用各接口以及 add_history_item_from_json，
+# 输出每个场景的吞吐量与 p50/p95/p99 延迟（JSON），便于对比不同版本。
+#
+#   python -m benchmarks --rows 10000 --output bench.json
+#   python -m benchmarks --rows 100000 --iterations 500 --scenarios history_cursor,search
+#
+# history_page_limit{条数}_fav{收藏数} 场景在不同每页条数与收藏数下测量未命中缓存的第一页，
+# 用于确认页面延迟只随每页条数增长，不随收藏数增长：
+#   python -m benchmarks --rows 20000 --iterations 50 --scenarios history_page_limit10_fav0,history_page_limit100_fav10000
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from config import config
+
+# 用法见 benchmarks/__init__.py
+
+def _configure(work_dir: str) -> None:
+    """所有数据写入 work_dir，不影响正在使用的数据库（必须在创建数据库引擎之前调用）"""
+    config.DB_PATH = os.path.join(work_dir, "db", "clipboard_history.db")
+    config.BACKUP_DIR = os.path.join(work_dir, "backup")
+    config.FOLDER_TO_MONITOR = config.BACKUP_DIR
+    config.THUMBNAIL_DIR = os.path.join(work_dir, "thumbnails")
+    config.INGEST_STATE_PATH = os.path.join(work_dir, "db", "ingest_state.json")
+    config.SYNC_CLIPBOARD_JSON_PATH = os.path.join(work_dir, "SyncClipboard.json")
+    config.DB_LOG_ENABLED = False
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=config.BASE_DIR, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="接口与数据库热点路径基准测试")
+    parser.add_argument("--rows", type=int, default=10000, help="合成数据库的记录数（如 10000 / 100000 / 1000000）")
+    parser.add_argument("--iterations", type=int, default=200, help="每个场景的执行次数")
+    parser.add_argument("--scenarios", help="只运行指定场景（逗号分隔）")
+    parser.add_argument("--work-dir", help="数据目录；已存在数据库时直接复用（避免重复生成大库），默认使用临时目录")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果写入该 JSON 文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="clipboard-bench-")
+    _configure(work_dir)
+
+    # 配置修改之后再导入应用模块
+    from app import create_app
+    from app.db import database
+    from app.db.cache import cache
+    from benchmarks.datagen import build_database, set_sweep_favorites
+    from benchmarks.harness import (build_concurrent_scenarios, build_favorites_sweep, build_scenarios, measure,
+                                    measure_concurrent)
+
+    reuse = os.path.exists(config.DB_PATH)
+    database.init_db()
+    samples_path = os.path.join(work_dir, "samples.json")
+    start = time.time()
+    if reuse and os.path.exists(samples_path):
+        with open(samples_path, encoding="utf-8") as f:
+            samples = json.load(f)
+    else:
+        samples = build_database(args.rows, work_dir, seed=args.seed)
+        with open(samples_path, "w", encoding="utf-8") as f:
+            json.dump(samples, f)
+    print(f"数据准备用时 {time.time() - start:.1f} 秒（{work_dir}）", file=sys.stderr)
+
+    client = create_app().test_client()
+    scenarios = build_scenarios(client, args.rows, samples)
+    sweep = build_favorites_sweep(client, args.rows)
+    scenarios.update(sweep)
+    concurrent = build_concurrent_scenarios(client)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios) + list(concurrent)
+
+    results = {}
+    for name in selected:
+        if name not in scenarios and name not in concurrent:
+            parser.error(f"未知场景: {name}（可选: {', '.join(list(scenarios) + list(concurrent))}）")
+        cache.clear_all()  # 各场景从空缓存开始
+        if name in concurrent:
+            results[name] = measure_concurrent(*concurrent[name], args.iterations)
+        else:
+            results[name] = measure(scenarios[name], args.iterations)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+    if any(name in sweep for name in selected):
+        set_sweep_favorites(0)  # 复用数据目录时不影响之后的测试
+
+    report = {
+        "meta": {
+            "rows": args.rows,
+            "iterations": args.iterations,
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "cache": cache.stats(),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
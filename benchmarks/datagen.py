@@ -0,0 +1,108 @@
+import os
+import random
+import hashlib
+import uuid as uuid_lib
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from app.models.models import ClipboardHistory, Favorite, Folder
+from app.db.engine import get_write_engine
+from app.services.transfer_service import import_history
+
+# 合成数据生成
+
+TYPE_MIX = [("Text", 0.80), ("Image", 0.12), ("File", 0.08)]  # 记录类型比例
+FAVORITE_RATIO = 0.02  # 被收藏的记录比例
+SWEEP_FOLDER = "Benchmark"  # favorites_sweep 场景使用的收藏夹（与合成数据自带的收藏分开）
+DEVICES = ["Windows-PC", "MacBook", "Android", "iPhone", "Web"]
+TAGS = [None, None, None, "工作", "手动粘贴", "代码"]
+WORDS = ["剪贴板", "同步", "会议纪要", "clipboard", "history", "python", "sqlite", "下载链接",
+         "password reset", "TODO", "截图", "report", "地址", "error log", "meeting", "发票"]
+
+def _random_text(rng: random.Random) -> str:
+    # 多数为短文本，少数为长文本
+    length = rng.choice([3, 5, 8, 12, 20, 40, 200]) if rng.random() < 0.97 else 2000
+    return " ".join(rng.choice(WORDS) for _ in range(length)) + f" #{rng.randrange(10 ** 6)}"
+
+def make_files(files_dir: str, count: int, rng: random.Random) -> list:
+    """生成 count 个附件（以 checksum 命名，供导入时放入备份存储），返回 checksum 列表"""
+    os.makedirs(files_dir, exist_ok=True)
+    checksums = []
+    for i in range(count):
+        data = rng.randbytes(rng.choice([2 * 1024, 16 * 1024, 128 * 1024]))
+        checksum = hashlib.md5(data).hexdigest()
+        with open(os.path.join(files_dir, checksum), "wb") as f:
+            f.write(data)
+        checksums.append(checksum)
+    return checksums
+
+def generate_records(rows: int, checksums: list, rng: random.Random):
+    """按时间顺序生成导入记录（transfer_service 的导出格式）"""
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(rows, 1)
+    types = [t for t, _ in TYPE_MIX]
+    weights = [w for _, w in TYPE_MIX]
+    for i in range(rows):
+        item_type = rng.choices(types, weights)[0]
+        record = {
+            "uuid": str(uuid_lib.UUID(int=rng.getrandbits(128), version=4)),
+            "type": item_type,
+            "from_equipment": rng.choice(DEVICES),
+            "tag": rng.choice(TAGS),
+            "timestamp": (start + step * i).isoformat(),
+        }
+        if item_type == "Text":
+            record["clipboard"] = _random_text(rng)
+        else:
+            checksum = rng.choice(checksums)
+            name = f"{rng.choice(WORDS)}_{i}.{'png' if item_type == 'Image' else 'pdf'}"
+            record["clipboard"] = checksum if item_type == "Image" else name
+            record["checksum"] = checksum
+            record["original_filename"] = name
+        yield record
+
+def build_database(rows: int, work_dir: str, seed: int = 42, file_count: int = 500) -> dict:
+    """
+    在当前配置的数据库中写入 rows 条合成记录、备份文件与收藏
+    :return: 供基准场景使用的样本（checksum、搜索词等）
+    """
+    rng = random.Random(seed)
+    checksums = make_files(os.path.join(work_dir, "files"), min(file_count, max(rows // 20, 1)), rng)
+    import_history(generate_records(rows, checksums, rng), os.path.join(work_dir, "files"), batch_size=10000)
+
+    engine = get_write_engine()
+    with engine.begin() as conn:
+        folder_id = conn.execute(select(Folder.id).order_by(Folder.id)).scalar()
+        uuids = conn.exec_driver_sql(
+            "SELECT uuid FROM clipboardhistory WHERE abs(random()) % 10000 < ?", (int(FAVORITE_RATIO * 10000),)
+        ).scalars().all()
+        if folder_id is not None and uuids:
+            conn.execute(insert(Favorite.__table__).prefix_with("OR IGNORE"),
+                         [{"history_uuid": u, "folder_id": folder_id, "created_at": datetime.utcnow()} for u in uuids])
+
+        # 只有被记录引用的附件才会进入备份存储
+        stored = conn.exec_driver_sql("SELECT checksum FROM backup_files").scalars().all()
+
+    return {"checksums": stored, "search_terms": ["会议纪要", "python", "error log", "截图 report", "同步"]}
+
+def set_sweep_favorites(count: int, seed: int = 42) -> int:
+    """
+    将 SWEEP_FOLDER 收藏夹中的收藏设为随机的 count 条记录（不影响合成数据自带的收藏）
+    :return: 实际收藏条数（不超过记录数）
+    """
+    rng = random.Random(seed)
+    engine = get_write_engine()
+    with engine.begin() as conn:
+        folder_id = conn.execute(select(Folder.id).where(Folder.name == SWEEP_FOLDER)).scalar()
+        if folder_id is None:
+            root_id = conn.execute(select(Folder.id).order_by(Folder.id)).scalar()
+            folder_id = conn.execute(insert(Folder.__table__), {
+                "name": SWEEP_FOLDER, "parent_id": root_id, "path": f"/{SWEEP_FOLDER}/"
+            }).inserted_primary_key[0]
+        conn.execute(delete(Favorite.__table__).where(Favorite.folder_id == folder_id))
+        uuids = conn.execute(select(ClipboardHistory.uuid).order_by(ClipboardHistory.id)).scalars().all()
+        chosen = rng.sample(uuids, min(count, len(uuids)))
+        if chosen:
+            now = datetime.utcnow()
+            conn.execute(insert(Favorite.__table__),
+                         [{"history_uuid": u, "folder_id": folder_id, "created_at": now} for u in chosen])
+    return len(chosen)
@@ -0,0 +1,208 @@
+import io
+import time
+import zlib
+import random
+import struct
+from typing import Callable, Dict, List, Tuple
+
+# 计时与各基准场景
+
+SWEEP_LIMITS = (10, 30, 100)  # favorites_sweep 场景的每页条数
+SWEEP_FAVORITES = (0, 1000, 10000)  # favorites_sweep 场景额外收藏的记录数
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """最近秩法百分位数（sorted_values 已升序）"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def measure(func: Callable[[int], None], iterations: int, warmup: int = 5) -> Dict[str, float]:
+    """执行 func(i) iterations 次，返回吞吐量与延迟分布（毫秒）"""
+    for i in range(warmup):
+        func(i)
+    durations = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(i)
+        durations.append((time.perf_counter() - t0) * 1000)
+    return _summarize(durations, time.perf_counter() - start)
+
+def measure_concurrent(background: Callable[[int], None], foreground: Callable[[int], None],
+                       iterations: int, warmup: int = 2) -> Dict[str, float]:
+    """
+    每次在 eventlet 协程中启动 background(i)，让出一次事件循环后执行 foreground(i)，
+    只统计 foreground 的延迟（从让出开始计时，包含被 background 阻塞的时间）
+    """
+    import eventlet
+    durations = []
+    elapsed = 0.0
+    for i in range(warmup + iterations):
+        thread = eventlet.spawn(background, i)
+        t0 = time.perf_counter()
+        eventlet.sleep(0)  # background 开始执行，遇到卸载到线程池的操作时才会让回
+        foreground(i)
+        duration = time.perf_counter() - t0
+        thread.wait()
+        if i >= warmup:
+            durations.append(duration * 1000)
+            elapsed += duration
+    return _summarize(durations, elapsed)
+
+def _summarize(durations: List[float], elapsed: float) -> Dict[str, float]:
+    iterations = len(durations)
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "throughput_rps": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(durations) / len(durations), 3),
+        "p50_ms": round(percentile(durations, 50), 3),
+        "p95_ms": round(percentile(durations, 95), 3),
+        "p99_ms": round(percentile(durations, 99), 3),
+        "max_ms": round(durations[-1], 3),
+    }
+
+def make_png(width: int, height: int, rng: random.Random) -> bytes:
+    """生成随机内容的 RGB PNG（不依赖 Pillow）"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+def _check(response, *statuses):
+    if response.status_code not in (statuses or (200,)):
+        raise RuntimeError(f"{response.request.path} 返回 {response.status_code}")
+
+def build_scenarios(client, rows: int, samples: dict, seed: int = 7) -> Dict[str, Callable[[int], None]]:
+    """返回 {场景名: 单次操作}，每个场景内部的随机参数固定种子以便复现"""
+    rng = random.Random(seed)
+    checksums = samples["checksums"]
+    terms = samples["search_terms"]
+    from app.db.database import add_history_item_from_json
+
+    def history_offset_first(i):
+        _check(client.get("/api/history?limit=30&offset=0"))
+
+    def history_offset_first_gzip(i):
+        # 浏览器请求带 Accept-Encoding，命中时直接返回缓存的压缩响应体
+        _check(client.get("/api/history?limit=30&offset=0", headers={"Accept-Encoding": "gzip, br"}))
+
+    def history_offset_random(i):
+        _check(client.get(f"/api/history?limit=30&offset={rng.randrange(max(rows - 30, 1))}"))
+
+    def history_cursor_first(i):
+        _check(client.get("/api/history?limit=30&cursor=&total=1"))
+
+    cursor_state = {"cursor": ""}
+    def history_cursor_walk(i):
+        # 顺序向后翻页，翻到底后从第一页重新开始
+        response = client.get(f"/api/history?limit=30&cursor={cursor_state['cursor']}")
+        _check(response)
+        cursor_state["cursor"] = response.get_json()["data"]["next_cursor"] or ""
+
+    filter_state = {"cursor": ""}
+    def history_filter_walk(i):
+        # 按类型筛选（图片占比小）顺序翻页
+        response = client.get(f"/api/history?limit=30&type=Image&cursor={filter_state['cursor']}")
+        _check(response)
+        filter_state["cursor"] = response.get_json()["data"]["next_cursor"] or ""
+
+    def search(i):
+        _check(client.get(f"/api/search?q={terms[i % len(terms)]}&limit=30&offset=0"))
+
+    def download(i):
+        _check(client.get(f"/api/download?checksum={rng.choice(checksums)}"))
+
+    def download_conditional(i):
+        checksum = rng.choice(checksums)
+        _check(client.get(f"/api/download?checksum={checksum}", headers={"If-None-Match": f'"{checksum}"'}), 304)
+
+    def paste_text(i):
+        _check(client.post("/api/paste/text", json={"content": f"benchmark paste {i} {rng.random()}"}))
+
+    def paste_image(i):
+        data = {"file": (io.BytesIO(make_png(96, 96, rng)), f"bench_{i}.png")}
+        _check(client.post("/api/paste/image", data=data, content_type="multipart/form-data"))
+
+    def ingest_json(i):
+        add_history_item_from_json({"Type": "Text", "Clipboard": f"benchmark ingest {i} {rng.random()}",
+                                    "From": "Benchmark"})
+
+    # 只读场景在前，写入场景在后（写入会改变后续读场景的数据）
+    return {
+        "history_offset_first": history_offset_first,
+        "history_offset_first_gzip": history_offset_first_gzip,
+        "history_offset_random": history_offset_random,
+        "history_cursor_first": history_cursor_first,
+        "history_cursor_walk": history_cursor_walk,
+        "history_filter_walk": history_filter_walk,
+        "search": search,
+        "download": download,
+        "download_conditional": download_conditional,
+        "paste_text": paste_text,
+        "paste_image": paste_image,
+        "ingest_json": ingest_json,
+    }
+
+def build_favorites_sweep(client, rows: int, seed: int = 7) -> Dict[str, Callable[[int], None]]:
+    """
+    每页条数 × 收藏数的组合（history_page_limit{条数}_fav{收藏数}），每次清空缓存后请求第一页，
+    测量未命中缓存时的页面延迟：收藏状态按页一次查询，延迟应只随每页条数增长，与收藏数无关
+    """
+    from app.db.cache import cache
+    from benchmarks.datagen import set_sweep_favorites
+    state = {"favorites": None}
+
+    def page(limit: int, favorites: int) -> Callable[[int], None]:
+        def run(i):
+            if state["favorites"] != favorites:
+                # 第一次（预热）调用时调整收藏数，不计入计时
+                set_sweep_favorites(favorites, seed)
+                state["favorites"] = favorites
+            cache.clear_all()
+            _check(client.get(f"/api/history?limit={limit}&offset=0"))
+        return run
+
+    scenarios = {}
+    for favorites in SWEEP_FAVORITES:
+        favorites = min(favorites, rows)
+        for limit in SWEEP_LIMITS:
+            scenarios[f"history_page_limit{limit}_fav{favorites}"] = page(limit, favorites)
+    return scenarios
+
+def build_concurrent_scenarios(client, seed: int = 7, upload_size: int = 8 * 1024 * 1024
+                               ) -> Dict[str, Tuple[Callable[[int], None], Callable[[int], None]]]:
+    """
+    返回 {场景名: (后台操作, 前台操作)}，用 measure_concurrent 测量
+    上传大文件期间另一个列表请求的延迟：线程池卸载时列表请求无需等待上传完成，
+    _inline 场景关闭卸载（OFFLOAD_ENABLED）作为对比。测试客户端未 monkey_patch，对应 start.py 的情况；
+    打补丁的 serve.py 工作进程见 benchmarks/serve_worker.py
+    """
+    from config import config
+    from werkzeug.test import EnvironBuilder
+    # 每次上传相同内容：备份去重，仍需完整写入临时文件并计算MD5；请求体预先编码，不计入测试客户端自身的开销
+    payload = random.Random(seed).randbytes(upload_size)
+    builder = EnvironBuilder(method="POST", data={"file": (io.BytesIO(payload), "bench_upload.bin")})
+    environ = builder.get_environ()
+    body, content_type = environ["wsgi.input"].read(), environ["CONTENT_TYPE"]
+    builder.close()
+
+    def upload(offload: bool) -> Callable[[int], None]:
+        def run(i):
+            enabled = config.OFFLOAD_ENABLED
+            config.OFFLOAD_ENABLED = offload
+            try:
+                _check(client.post("/api/paste/file", data=body, content_type=content_type))
+            finally:
+                config.OFFLOAD_ENABLED = enabled
+        return run
+
+    def read(i):
+        _check(client.get("/api/history?limit=30&offset=0"))
+
+    return {
+        "read_during_upload": (upload(True), read),
+        "read_during_upload_inline": (upload(False), read),
+    }
@@ -0,0 +1,136 @@
+import sys
+
+# 打补丁的 serve.py 工作进程基准
+# 子进程按 serve.py worker 的方式启动一个工作进程（monkey_patch 后 server.run_worker），
+# 后台线程持续粘贴大文本（压缩与全文索引都在写事务中），同时测量列表接口的延迟。
+# 分别在 OFFLOAD_ENABLED 开启/关闭时运行：开启时写事务在专用写线程中执行（见 app/services/offload.py），
+# 关闭时在事件循环中执行，写事务期间其他请求都要等待。
+#   python -m benchmarks.serve_worker --rows 10000 --iterations 200 --output serve_worker.json
+
+if __name__ == "__main__" and "--child" in sys.argv:
+    # 与 serve.py 相同：在导入其他模块之前打补丁
+    import eventlet
+    eventlet.monkey_patch()
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from config import config
+
+def _request(url: str, body: dict = None) -> bytes:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+def _wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while True:
+        try:
+            _request(url + "/api/history?limit=1&offset=0")
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+def run_child(work_dir: str, port: int, offload: bool) -> None:
+    """子进程：与 serve.py worker 相同地运行一个工作进程"""
+    from benchmarks.__main__ import _configure
+    _configure(work_dir)
+    config.OFFLOAD_ENABLED = offload
+    from app import server
+    server.run_worker("127.0.0.1", port, "")
+
+def measure_worker(work_dir: str, port: int, offload: bool, iterations: int, text_size: int,
+                   seed: int = 7) -> dict:
+    """启动工作进程，在持续写入大文本的同时请求 iterations 次列表第一页"""
+    from benchmarks.harness import _summarize
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve_worker", "--child", "--work-dir", work_dir, "--port", str(port)]
+        + ([] if offload else ["--inline"]),
+        cwd=config.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        rng = random.Random(seed)
+        words = ["剪贴板", "clipboard", "history", "同步", "error log", "python", "sqlite", "report"]
+        while not stop.is_set():
+            text = " ".join(rng.choice(words) for _ in range(text_size // 8)) + f" #{rng.random()}"
+            t0 = time.perf_counter()
+            _request(url + "/api/paste/text", {"content": text})
+            writes.append((time.perf_counter() - t0) * 1000)
+
+    try:
+        _wait_ready(url)
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        time.sleep(0.5)
+        durations = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            _request(url + "/api/history?limit=30&offset=0")
+            durations.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+    result = _summarize(durations, elapsed)
+    result["writes"] = len(writes)
+    result["write_mean_ms"] = round(sum(writes) / len(writes), 3) if writes else 0.0
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serve_worker",
+                                     description="打补丁的工作进程中，写入大文本期间的列表接口延迟")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--inline", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=6401, help="工作进程监听的端口")
+    parser.add_argument("--rows", type=int, default=10000, help="合成数据库的记录数")
+    parser.add_argument("--iterations", type=int, default=200, help="每种模式请求列表的次数")
+    parser.add_argument("--text-size", type=int, default=512 * 1024, help="每次粘贴的文本大小（字节）")
+    parser.add_argument("--work-dir", help="数据目录；已存在数据库时直接复用，默认使用临时目录")
+    parser.add_argument("--output", help="结果写入该 JSON 文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.work_dir, args.port, offload=not args.inline)
+        return
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="clipboard-bench-")
+    from benchmarks.__main__ import _configure
+    _configure(work_dir)
+    if not os.path.exists(config.DB_PATH):
+        from app.db import database
+        from benchmarks.datagen import build_database
+        database.init_db()
+        build_database(args.rows, work_dir)
+
+    results = {}
+    for name, offload in (("read_during_large_paste", True), ("read_during_large_paste_inline", False)):
+        results[name] = measure_worker(work_dir, args.port, offload, args.iterations, args.text_size)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+
+    output = json.dumps({"meta": {"rows": args.rows, "iterations": args.iterations, "text_size": args.text_size},
+                         "results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,121 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # JSON 文件路径
 SYNC_CLIPBOARD_JSON_FILE = "SyncClipboard.json" # 同步文件名
 SYNC_CLIPBOARD_JSON_PATH = os.path.join(BASE_DIR, SYNC_CLIPBOARD_JSON_FILE) # 主同步文件路径
+INGEST_DEBOUNCE = 0.3  # 文件变化后等待的时间（秒），期间的多次写入事件只处理一次
+INGEST_RETRY_DELAY = 0.5  # JSON 未写完（解析失败）时的重试间隔（秒）
+INGEST_MAX_RETRIES = 5
 
 # 数据库配置
 DB_PATH = os.path.join(BASE_DIR, "db", "clipboard_history.db")
-DB_LOG_ENABLED = True  # 是否启用数据库日志
+CHANGE_LOG_RETENTION_DAYS = 30  # 变更日志保留天数，离线更久的客户端需要重新全量同步
+INGEST_STATE_PATH = os.path.join(BASE_DIR, "db", "ingest_state.json")  # 最后一次入库的同步文件指纹
+DB_LOG_ENABLED = False  # 是否启用数据库日志（SQL echo，调试时开启）
+DB_BUSY_TIMEOUT = 30  # 等待数据库锁/连接的超时时间（秒）
+DB_READ_POOL_SIZE = 8  # 只读连接池大小（写连接固定为 1 个）
+DB_CACHE_SIZE_KB = 32 * 1024  # 每个连接的页缓存大小（KiB）
+DB_MMAP_SIZE = 256 * 1024 * 1024  # 内存映射读取的最大字节数
+# 大文本压缩存储：超过阈值的文本压缩后存入 clipboard_content（相同内容只存一份），
+# 历史表中只保留前 TEXT_INLINE_CHARS 个字符用于列表预览
+TEXT_COMPRESS_THRESHOLD = 16 * 1024  # 字节
+TEXT_INLINE_CHARS = 2000  # 应不小于 LIST_PREVIEW_CHARS
+# 为大文本的完整内容另建全文索引（clipboard_content_fts），整条内容均可被搜索到；
+# SQLite 3.43 之前的版本索引表中会另存一份未压缩文本。关闭后只能检索到前 TEXT_INLINE_CHARS 个字符
+TEXT_SEARCH_FULL = True
+TEXT_COMPRESSION = "auto"  # "auto"（安装了 zstandard 时用 zstd，否则 zlib）/ "zstd" / "zlib"
+TEXT_COMPRESSION_LEVEL = 6  # zlib 为 1-9，zstd 为 1-22
+# zstd 共享字典：压缩内容达到 MIN_SAMPLES 条后由监控进程用最近的内容训练，之后每新增 RETRAIN_EVERY 条重新训练；
+# 压缩时使用最新的字典（各进程每 REFRESH 秒检查一次），旧字典保留用于解压
+TEXT_ZSTD_DICT_ENABLED = True
+TEXT_ZSTD_DICT_SIZE = 64 * 1024  # 字典大小（字节）
+TEXT_ZSTD_DICT_MIN_SAMPLES = 50
+TEXT_ZSTD_DICT_MAX_SAMPLES = 1000  # 训练时最多使用的内容条数（每条最多取前 TEXT_ZSTD_DICT_SAMPLE_BYTES 字节）
+TEXT_ZSTD_DICT_SAMPLE_BYTES = 128 * 1024
+TEXT_ZSTD_DICT_RETRAIN_EVERY = 1000
+TEXT_ZSTD_DICT_REFRESH = 60  # 秒
 
 # 备份配置
 BACKUP_DIR_FOLDER = "backup"  # 当前文件夹下，备份文件夹名称
 BACKUP_DIR = os.path.join(BASE_DIR, BACKUP_DIR_FOLDER)
+# 备份文件放入存储的方式：
+# "reflink" 尝试 reflink（写时复制，Btrfs/XFS 等不占额外空间），失败时复制
+# "copy" 始终复制
+# "hardlink" 优先硬链接（同一文件系统，不占额外空间），失败时同 "reflink"；
+#            硬链接与源文件共享内容，源文件被原地改写时备份随之改变，下载/导出前会重新校验MD5
+#            （"auto" 为旧版本的名称，等同 "hardlink"）
+BACKUP_LINK_MODE = "reflink"
+
+# 下载配置
+DOWNLOAD_CACHE_MAX_AGE = 365 * 24 * 3600  # 浏览器缓存时间（秒），下载地址按 checksum 寻址，内容不会变化
+# 由前置的 Web 服务器（nginx 需配合 X-Accel-Redirect 转换，Apache/lighttpd 为 mod_xsendfile）发送文件，
+# 应用只返回 X-Sendfile 头；直接运行内置服务器时保持 False
+USE_X_SENDFILE = False
+
+# 缩略图配置（需要安装 Pillow，未安装时页面直接显示原图）
+THUMBNAIL_DIR = os.path.join(BASE_DIR, "thumbnails")  # 缩略图缓存目录
+THUMBNAIL_SIZE = 320  # 缩略图最长边（像素）
+THUMBNAIL_FORMAT = "WEBP"  # WEBP 或 JPEG
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_FOLDER_SIZE = 200 * 1024 * 1024  # 缩略图目录容量上限（字节），监控进程每轮检查，超出后淘汰最久未访问的缩略图
+THUMBNAIL_TOUCH_INTERVAL = 3600  # 访问缩略图时更新其修改时间（淘汰顺序）的最小间隔（秒）
+THUMBNAIL_QUEUE_SIZE = 1000  # 后台生成队列长度，队列满时改为请求时生成
+THUMBNAIL_CACHE_MAX_AGE = 365 * 24 * 3600  # 浏览器缓存时间（秒），缩略图按内容寻址，内容不会变化
 
 # 网页配置
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 STATIC_DIR = os.path.join(BASE_DIR, "static")
+LIST_PREVIEW_CHARS = 500  # 列表/搜索/推送中文本记录的预览字符数，完整内容通过 /api/history/<id> 获取
 
 # 历史文件删除配置
 MAX_FOLDER_SIZE = "1G"  # 支持的单位: B, K, KB, M, MB, G, GB (不区分大小写)
 CHECK_INTERVAL = 60  # 检查间隔（秒）
 FOLDER_TO_MONITOR = os.path.join(BASE_DIR, BACKUP_DIR_FOLDER)  # 替换为要监控的文件夹路径，一般和备份文件夹相同
+
+# 内存缓存配置（条目数上限 / 字节数上限（0 为不限）/ 过期时间（秒，0 为不过期））
+CACHE_HISTORY_PAGES_MAX_ENTRIES = 256  # 列表分页缓存（offset 分页与游标分页各自独立计算）
+CACHE_HISTORY_PAGES_MAX_BYTES = 32 * 1024 * 1024
+CACHE_HISTORY_PAGES_TTL = 300
+CACHE_HISTORY_BY_ID_MAX_ENTRIES = 2048  # 单条记录缓存
+CACHE_HISTORY_BY_ID_MAX_BYTES = 32 * 1024 * 1024
+CACHE_HISTORY_BY_ID_TTL = 600
+CACHE_FILE_PATHS_MAX_ENTRIES = 4096  # checksum -> 备份文件路径
+CACHE_FILE_PATHS_TTL = 3600
+CACHE_FILE_PATHS_NEGATIVE_TTL = 30  # 文件不存在（负缓存）的过期时间，避免文件补齐后长期 404
+CACHE_FILTERED_TOTALS_MAX_ENTRIES = 256  # 各筛选条件（类型/来源/标签）下的记录总数，过期时间同列表分页
+CACHE_RESPONSE_BODIES_MAX_ENTRIES = 256  # 列表接口序列化（及压缩）后的响应体，过期时间同列表分页
+CACHE_RESPONSE_BODIES_MAX_BYTES = 32 * 1024 * 1024
+
+# 实时推送配置（进程内事件总线）
+EVENT_BUS_MAX_PENDING = 10000  # 待推送事件上限，超出时丢弃
+EVENT_BUS_COALESCE_WINDOW = 0.05  # 合并突发事件的等待时间（秒），0 为不等待
+
+# 接口响应配置
+JSON_FAST_SERIALIZER = True  # 安装 orjson 时用其序列化 JSON 响应，否则使用标准库 json
+RESPONSE_COMPRESSION = True  # 按 Accept-Encoding 压缩 JSON 响应（gzip；安装 brotli 后优先 br）
+RESPONSE_COMPRESS_MIN_BYTES = 1024  # 小于该字节数的响应不压缩
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 5  # 0-11，越高压缩率越高、越慢；压缩结果会随响应体缓存
+
+# 生产部署配置（python serve.py，开发调试的 start.py 不使用）
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 5001  # 第一个 Web 工作进程的端口，其余依次加一，由前置 nginx 按客户端 IP 分发
+SERVE_WORKERS = 4  # Web 工作进程数
+# Socket.IO 消息队列（多个进程之间转发推送事件）：redis://host:6379/0 等，
+# 为空时 serve.py 由主进程通过 UNIX 套接字转发（单机部署无需外部服务），start.py 不使用消息队列
+SOCKETIO_MESSAGE_QUEUE = ""
+# /api/cache/invalidate 的访问令牌（transfer.py --notify 以 X-Cache-Invalidate-Token 请求头发送）；
+# 为空时只接受本机直接访问（经 nginx 转发、带 X-Forwarded-For 的请求会被拒绝）
+CACHE_INVALIDATE_TOKEN = ""
+
+# 运行指标配置（/metrics，Prometheus 文本格式）
+METRICS_ENABLED = True  # 关闭后不记录接口/SQL耗时，/metrics 返回 404
+
+# 上传配置
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传文件分块写入/计算MD5的块大小（字节）
+CHECKSUM_CACHE_ENABLED = True  # 记录已计算的文件MD5（按路径/大小/修改时间/inode），文件未变化时不再重新读取
+CHECKSUM_USE_MMAP = False  # 使用 mmap 读取文件计算MD5（大文件少一次内存复制；网络文件系统上建议关闭）
+OFFLOAD_ENABLED = True  # 阻塞操作放到线程池执行（关闭后在请求协程中直接执行，只用于对比基准）
+# 上传保存、计算MD5等阻塞操作使用的线程数（eventlet tpool）；
+# 写入记录的整段流程在 start.py（未 monkey_patch）中放到线程池；serve.py 工作进程中文件/哈希操作放到线程池，
+# 写事务交给专用写线程
+OFFLOAD_THREADS = 4
+OFFLOAD_MAX_PENDING = 32  # 排队与执行中的阻塞任务上限，超出时接口返回 503
@@ -0,0 +1,45 @@
+import sys
+
+# 生产部署入口（开发调试仍使用 python start.py：单进程、debug 模式）
+#   python serve.py --workers 4 --port 5001     # 主进程（监控 + 消息转发）+ 4 个 Web 工作进程，监听 5001~5004
+#   python serve.py monitor                     # 只运行监控进程（Web 工作进程由 gunicorn/systemd 管理时）
+#   python serve.py worker --port 5001          # 只运行一个 Web 工作进程
+# 前置 nginx 的配置示例见 README「生产部署」
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == "worker":
+    # Web 工作进程：在导入其他模块之前打补丁，socket/线程/sleep 交给 eventlet 调度
+    import eventlet
+    eventlet.monkey_patch()
+
+import argparse
+from config import config
+
+def main():
+    parser = argparse.ArgumentParser(description="剪贴板历史服务（多进程部署）")
+    parser.add_argument("--message-queue", help="Socket.IO 消息队列地址，默认使用配置 SOCKETIO_MESSAGE_QUEUE，"
+                                                "未配置时由主进程通过 UNIX 套接字转发")
+    sub = parser.add_subparsers(dest="command")
+
+    worker_parser = sub.add_parser("worker", help="运行一个 Web 工作进程")
+    worker_parser.add_argument("--host", default=config.SERVE_HOST)
+    worker_parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    worker_parser.add_argument("--message-queue", dest="worker_message_queue")
+
+    sub.add_parser("monitor", help="只运行监控进程（同步文件监控、备份清理、消息转发）")
+
+    parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS, help="Web 工作进程数")
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT, help="第一个工作进程的端口，之后依次加一")
+
+    args = parser.parse_args()
+    from app import server
+
+    if args.command == "worker":
+        server.run_worker(args.host, args.port, args.worker_message_queue or args.message_queue)
+    elif args.command == "monitor":
+        server.run_monitor(args.message_queue)
+    else:
+        server.run_supervisor(max(1, args.workers), args.host, args.port, args.message_queue)
+
+if __name__ == "__main__":
+    main()
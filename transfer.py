@@ -0,0 +1,51 @@
+import sys
+import time
+import argparse
+from app.db import database
+from app.services import transfer_service
+
+# 批量导入/导出工具
+#   python transfer.py export history.ndjson --files backup_export
+#   python transfer.py import history.ndjson --files backup_export --notify http://127.0.0.1:5001
+
+def main():
+    parser = argparse.ArgumentParser(description="剪贴板历史批量导入/导出")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="导出全部历史记录为 NDJSON（- 表示标准输出）")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--files", help="同时导出备份文件到该目录（以 checksum 命名）")
+    export_parser.add_argument("--batch-size", type=int, default=5000)
+
+    import_parser = sub.add_parser("import", help="导入 NDJSON / JSON 数组（本工具导出格式或 SyncClipboard.json 格式）")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--files", help="附件所在目录（导出的备份目录或 SyncClipboard 的 file 目录）")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="每个事务写入的记录数")
+    import_parser.add_argument("--workers", type=int, default=4, help="并行放入备份存储的线程数")
+    import_parser.add_argument("--notify", help="导入完成后通知该地址的服务清空缓存，如 http://127.0.0.1:5001")
+    import_parser.add_argument("--token", help="--notify 使用的访问令牌，默认使用配置 CACHE_INVALIDATE_TOKEN")
+
+    args = parser.parse_args()
+    database.init_db()
+    start = time.time()
+
+    if args.command == "export":
+        if args.output == "-":
+            count = transfer_service.export_history(sys.stdout, args.files, args.batch_size)
+        else:
+            with open(args.output, "w", encoding="utf-8") as out:
+                count = transfer_service.export_history(out, args.files, args.batch_size)
+        print(f"已导出 {count} 条记录，用时 {time.time() - start:.1f} 秒", file=sys.stderr)
+        return
+
+    stats = transfer_service.import_history(
+        transfer_service.read_records(args.input), args.files, args.batch_size, args.workers,
+        progress=lambda n: print(f"已处理 {n} 条", file=sys.stderr),
+    )
+    print(f"读取 {stats['read']} 条，新增 {stats['inserted']} 条记录、{stats['backups']} 个备份文件，"
+          f"用时 {time.time() - start:.1f} 秒", file=sys.stderr)
+    if args.notify:
+        transfer_service.notify_server(args.notify, args.token)
+
+if __name__ == "__main__":
+    main()